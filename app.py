@@ -3,7 +3,28 @@ from typing import Any, AsyncGenerator, Generator, Callable
 from math import floor, log
 import random as rand
 from asyncio import sleep as wait
+import asyncio
+from time import perf_counter
+from array import array
+import base64
+import hashlib
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 import json
+import multiprocessing
+import os
+import secrets
+import sys
+import weakref
+import zlib
+from fastapi.responses import StreamingResponse
+
+# NumPy is optional. Without it every array is a plain list
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # UTILS
 
@@ -17,36 +38,285 @@ def clamp(n: float, l: float, u: float): # o(1) time
 def lerp(v0: float, v1: float, a: float) -> float: # o(1) time
     return (1 - a) * v0 + (v1 * a)
 
+# Whether arr is a numpy array rather than a list. Both support indexing, len(), in-place sort() and element swaps, so the sort generators don't care which one they get
+def is_numpy_array(arr: Any) -> bool: # o(1) time
+    return np is not None and isinstance(arr, np.ndarray)
+
+# Copies an array (list or numpy) into a plain list of Python ints, which is what json can serialize
+def to_list(arr: list[int]) -> list[int]: # o(n) time
+    return arr.tolist() if is_numpy_array(arr) else list(arr)
+
+# Rough size of an int object in a list, for memory estimates (ints above 256 aren't shared)
+INT_OBJECT_BYTES = 28
+
+# Rough number of bytes an array (list, numpy or array.array) takes
+def array_nbytes(arr: Any) -> int: # o(1) time
+    if is_numpy_array(arr):
+        return arr.nbytes
+    if isinstance(arr, array):
+        return len(arr) * arr.itemsize
+    return sys.getsizeof(arr) + len(arr) * INT_OBJECT_BYTES
+
+# The values of an array (list or numpy) as little-endian int32 bytes
+def int32_to_bytes(arr: list[int]) -> bytes: # o(n) time
+    if is_numpy_array(arr):
+        return arr.astype("<i4").tobytes()
+    values = array("i", arr)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+# Reverses int32_to_bytes()
+def int32_from_bytes(data: bytes, use_numpy: bool) -> list[int]: # o(n) time
+    if use_numpy and np is not None:
+        return np.frombuffer(data, dtype="<i4").astype(np.int32)
+    values = array("i")
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tolist()
+
+# A numpy generator seeded from the random module (or from rng), so rand.seed() also makes the vectorized paths repeatable
+def numpy_rng(rng: Any = rand): # o(1) time
+    return np.random.default_rng(rng.getrandbits(64))
+
 # Checks if a list is sorted
 def is_sorted(arr: list[int]): # o(n) time
+    if is_numpy_array(arr):
+        return bool(np.all(arr[:-1] <= arr[1:]))
     for i in range(1, len(arr)):
         if arr[i - 1] > arr[i]:
             return False
     return True
 
-# Generates integers in a way specifically desgined for this program
-def regenerate(arr: list[int], elements: int | None = 50): # o(n) time? (Not sure how long arr.clear() directly takes)
+# Generates integers in a way specifically desgined for this program. Large arrays are generated as numpy int32 arrays (see NUMPY_STORAGE_MIN_ELEMENTS), which can't be resized in place,
+# so always use the returned array. use_numpy forces the storage type either way
+def regenerate(arr: list[int], elements: int | None = 50, use_numpy: bool | None = None): # o(n) time? (Not sure how long arr.clear() directly takes)
     if elements == None: elements = 50
+    if use_numpy is None:
+        use_numpy = elements >= NUMPY_STORAGE_MIN_ELEMENTS
+    if use_numpy and np is not None:
+        return numpy_rng().integers(10, 1000, size=elements, dtype=np.int32, endpoint=True)
+    if not isinstance(arr, list):
+        arr = []
     arr.clear()
     for _ in range(elements):
         arr.append(rand.randint(10,1000))
     return arr
 
-# Fisher-Yates shuffle, with a shuffle_strength variable representing the percentage likelihood that an element will be swapped
-def shuffle(arr: list[int], shuffle_strength: float=1.0): # o(n) time worst case
+# Fisher-Yates shuffle, with a shuffle_strength variable representing the percentage likelihood that an element will be swapped.
+# rng is the random module or a rand.Random
+def shuffle(arr: list[int], shuffle_strength: float=1.0, rng: Any = rand): # o(n) time worst case
+    if is_numpy_array(arr):
+        # Vectorized version: pick each index with probability shuffle_strength, then permute the picked values among themselves
+        generator = numpy_rng(rng)
+        picked = np.flatnonzero(generator.random(len(arr)) < shuffle_strength)
+        arr[picked] = arr[generator.permutation(picked)]
+        return arr
     for i in range(len(arr) - 1, 0, -1):
-        if rand.random() > shuffle_strength: continue
-        j = rand.randint(0, i)
+        if rng.random() > shuffle_strength: continue
+        j = rng.randint(0, i)
         arr[i], arr[j] = arr[j], arr[i]
     return arr
 
+# Splits a permutation into its cycles, leaving out the elements that stay in place. sources[i] is the index of the element that ends up at i.
+# Returns the cycles as one flat list: [length, index, index, ..., length, index, ...], where the element at each index of a cycle moves to the next index (and the last one to the first)
+def permutation_cycles(sources: list[int]) -> list[int]: # o(n) time
+    visited = bytearray(len(sources))
+    cycles: list[int] = []
+    for start in range(len(sources)):
+        if visited[start] or sources[start] == start: continue
+        # Following sources goes backwards along the cycle
+        cycle: list[int] = []
+        i = start
+        while not visited[i]:
+            visited[i] = 1
+            cycle.append(i)
+            i = sources[i]
+        cycle.reverse()
+        cycles.append(len(cycle))
+        cycles.extend(cycle)
+    return cycles
+
+# Moves the elements of arr along the cycles from permutation_cycles(), and calls on_move(index) for every index that changed
+def apply_permutation_cycles(arr: list[int], cycles: list[int], on_move: Callable[[int], Any] | None = None): # o(n) time
+    i = 0
+    while i < len(cycles):
+        length = cycles[i]
+        first, last = i + 1, i + length
+        # Every element moves one index forward, so the last one is kept aside while the others are shifted
+        carried = arr[cycles[last]]
+        for j in range(last, first, -1):
+            arr[cycles[j]] = arr[cycles[j - 1]]
+        arr[cycles[first]] = carried
+        if on_move is not None:
+            for j in range(first, last + 1):
+                on_move(cycles[j])
+        i = last + 1
+
 # END OF UTILS
 
-# UTILITY CLASSES (This used to be a slight bit longer) (Also feel free to optimize by removing the Job class entirely as it only serves as a start and end point, which can be represented by a tuple)
-class Job:
-    def __init__(self, start: int, end: int):
-        self.i0 = start
-        self.i1 = end
+
+# WORKLOADS
+# Input distributions for the chart ("Regenerate Elements") and for benchmark.py, including the bad cases of quick-sort.
+# Every workload is generated in bulk (with numpy when the array is stored as a numpy array, see regenerate()) from its own random generator,
+# so the same seed always gives the same array. Values are in the same 10..1000 range that regenerate() uses, except where noted
+WORKLOADS = ["Random", "Sorted", "Reversed", "Nearly Sorted", "Few Unique", "Organ Pipe", "Sawtooth", "Median-of-3 Killer"]
+NEARLY_SORTED_STRENGTH = 0.05 # Shuffle strength applied to a sorted array
+FEW_UNIQUE_VALUES = 8 # Number of distinct values in "Few Unique"
+SAWTOOTH_TEETH = 8 # Number of ascending runs in "Sawtooth"
+
+# Musser's median-of-3 killer: with the pivot picked as the median of the first, middle and last elements, every partition only splits off two elements,
+# so quick-sort takes o(n^2) time. Values are 10 + their rank, since ties would make it much less effective
+def median_of_three_killer(elements: int, use_numpy: bool): # o(n) time
+    # The construction is a permutation for multiples of 4. The remaining (largest) values go at the end, which keeps the other ranges just as bad
+    k = (elements - elements % 4) // 2
+    if use_numpy:
+        arr = np.arange(1, elements + 1, dtype=np.int32)
+        odd = np.arange(1, k + 1, 2, dtype=np.int32)
+        arr[odd - 1] = odd
+        arr[odd] = k + odd
+        arr[k:2 * k] = 2 * np.arange(1, k + 1, dtype=np.int32)
+        return arr + 9
+    arr = list(range(1, elements + 1))
+    for i in range(1, k + 1, 2):
+        arr[i - 1] = i
+        arr[i] = k + i
+    for i in range(1, k + 1):
+        arr[k + i - 1] = 2 * i
+    return [v + 9 for v in arr]
+
+# Generates an array of the given workload (one of WORKLOADS). Without a seed, the seed is drawn from the random module, so rand.seed() still makes it repeatable.
+# use_numpy decides the storage type like in regenerate()
+def generate_workload(workload: str, elements: int, seed: int | None = None, use_numpy: bool | None = None) -> list[int]: # o(n log n) time
+    rng = rand.Random(rand.getrandbits(64) if seed is None else seed)
+    if use_numpy is None:
+        use_numpy = elements >= NUMPY_STORAGE_MIN_ELEMENTS
+    use_numpy = use_numpy and np is not None
+    generator = numpy_rng(rng) if use_numpy else None
+
+    def random_values(count: int):
+        if use_numpy:
+            return generator.integers(10, 1000, size=count, dtype=np.int32, endpoint=True)
+        return [rng.randint(10, 1000) for _ in range(count)]
+
+    if workload == "Median-of-3 Killer":
+        return median_of_three_killer(elements, use_numpy)
+    if workload == "Sawtooth":
+        period = max(2, -(-elements // SAWTOOTH_TEETH))
+        if use_numpy:
+            return (10 + (np.arange(elements, dtype=np.int32) % period) * 990 // (period - 1)).astype(np.int32)
+        return [10 + (i % period) * 990 // (period - 1) for i in range(elements)]
+    if workload == "Few Unique":
+        values = random_values(FEW_UNIQUE_VALUES)
+        if use_numpy:
+            return values[generator.integers(0, FEW_UNIQUE_VALUES, size=elements)]
+        return [rng.choice(values) for _ in range(elements)]
+
+    arr = random_values(elements)
+    if workload == "Random":
+        return arr
+    arr.sort()
+    if workload == "Reversed":
+        return arr[::-1].copy() if use_numpy else arr[::-1]
+    if workload == "Nearly Sorted":
+        return shuffle(arr, NEARLY_SORTED_STRENGTH, rng)
+    if workload == "Organ Pipe":
+        # Every other element ascending, then the rest descending
+        if use_numpy:
+            return np.concatenate((arr[0::2], arr[1::2][::-1]))
+        return arr[0::2] + arr[1::2][::-1]
+    if workload == "Sorted":
+        return arr
+    raise ValueError(f"Unknown workload: {workload}")
+# END OF WORKLOADS
+
+# UTILITY CLASSES (This used to be a slight bit longer)
+# Stack of pending jobs (ranges of the array that still need to be sorted), packed into one int32 array as (start, end, depth) triples.
+# Step sorts keep this in InternalState between clicks, so it is kept compact instead of being a list of objects
+class JobStack:
+    __slots__ = ("data",)
+
+    def __init__(self, *jobs: tuple[int, int]):
+        self.data = array("i")
+        for start, end in jobs:
+            self.push(start, end)
+
+    # depth is the number of partitions the range is nested in (quick-sort only)
+    def push(self, start: int, end: int, depth: int = 0): # o(1) time
+        self.data.extend((start, end, depth))
+
+    # Returns (start, end, depth) of the job on top of the stack
+    def pop(self) -> tuple[int, int, int]: # o(1) time
+        data = self.data
+        job = (data[-3], data[-2], data[-1])
+        del data[-3:]
+        return job
+
+    def __len__(self) -> int:
+        return len(self.data) // 3
+
+    def nbytes(self) -> int:
+        return len(self.data) * self.data.itemsize
+
+    def copy(self) -> "JobStack":
+        new_copy = JobStack()
+        new_copy.data = array("i", self.data)
+        return new_copy
+
+# Counts the work done by a sort and where the server's time went. Shown in the stats panel under the chart
+class SortStats:
+    __slots__ = ("comparisons", "swaps", "writes", "partitions", "jobs", "yields", "step_time", "serialize_time", "sleep_time")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.comparisons = 0 # Comparisons between two elements of the array
+        self.swaps = 0
+        self.writes = 0 # Writes to the array (a swap is 2 writes)
+        self.partitions = 0 # Calls to partition()
+        self.jobs = 0 # Finished jobs (partitions for quick-sort, passes for the others)
+        self.yields = 0 # Steps taken through the generator
+        # Seconds spent by the sort handlers on each phase
+        self.step_time = 0.0 # Running the generator
+        self.serialize_time = 0.0 # Encoding frames
+        self.sleep_time = 0.0 # Waiting between frames
+
+    def copy(self) -> "SortStats":
+        new_copy = SortStats()
+        new_copy.add(self)
+        return new_copy
+
+    def add(self, other: "SortStats"):
+        for k in SortStats.__slots__:
+            setattr(self, k, getattr(self, k) + getattr(other, k))
+
+    # The work counted since an earlier copy of these stats
+    def since(self, earlier: "SortStats") -> "SortStats":
+        difference = SortStats()
+        for k in SortStats.__slots__:
+            setattr(difference, k, getattr(self, k) - getattr(earlier, k))
+        return difference
+
+    # A copy without the timings, for stats that are reused without the work being done again (see TRACE CACHE)
+    def counts(self) -> "SortStats":
+        new_copy = self.copy()
+        new_copy.step_time = new_copy.serialize_time = new_copy.sleep_time = 0.0
+        return new_copy
+
+    def to_dict(self) -> dict[str, int]:
+        return {
+            "comparisons": self.comparisons,
+            "swaps": self.swaps,
+            "writes": self.writes,
+            "partitions": self.partitions,
+            "jobs": self.jobs,
+            "yields": self.yields,
+            "step_ms": round(self.step_time * 1000),
+            "serialize_ms": round(self.serialize_time * 1000),
+            "sleep_ms": round(self.sleep_time * 1000),
+        }
 # END OF UTILITY CLASSES
 
 
@@ -54,35 +324,649 @@ class Job:
 # Make sure these matches the identifiers used in graph.js
 HTML_DATA_HOLDER_ELEMENT_ID = "graph-data" # HTML element ID where the graph data JSON is stored
 HTML_GRAPH_ELEMENT_ID = "graph" # HTML element ID where the graph will be rendered
+HTML_STATS_ELEMENT_ID = "graph-stats" # HTML element ID where graph.js shows the sort's stats
 
 # Chart Size
 TOTAL_HEIGHT_PX = 200 # SYNC THIS WITH JS (OR CREATE A CONFIG FILE)
 TOTAL_WIDTH_PX = 2000 # SYNC THIS WITH JS (OR CREATE A CONFIG FILE)
+MAX_RENDERED_BARS = TOTAL_WIDTH_PX # Arrays longer than this are drawn as this many buckets (the min/max/mean of a run of elements) instead of one bar per element
+RENDERERS = ["DOM", "Canvas"] # How graph.js draws the chart: a div per bar, or a single canvas (faster for large arrays). SYNC THIS WITH JS
 # Other
-MAXIMUM_ELEMENTS_FOR_SHUFFLE_ANIMATION = 32 
+MAXIMUM_ELEMENTS_FOR_SHUFFLE_ANIMATION = MAX_RENDERED_BARS # Longer arrays are drawn as buckets, which can't show where each element went
+SHUFFLE_ANIMATION_SECONDS = 1.0 # Duration of the shuffle animation, which moves every bar at once
+FRAME_BUDGET = 1 / 60 # Shortest time between two frames sent while sorting. Steps that happen within the same display frame are merged into one frame
+NUMPY_STORAGE_MIN_ELEMENTS = 4096 # Arrays at least this long are stored as numpy int32 arrays (if numpy is installed). Swaps on numpy arrays are slower than on lists, so small arrays stay lists
 # END OF CONFIG
-MAX_ELEMENTS = TOTAL_WIDTH_PX
+MAX_ELEMENTS = 100000 # Not tied to the chart's width, because arrays longer than MAX_RENDERED_BARS are bucketed
+
+
+# FRAME PROTOCOL
+# Frames sent to graph.js are either keyframes (the full visual state) or deltas (only the array slots and fields that changed since the previous frame).
+# graph.js keeps its own copy of the visual state and patches it with every delta, so most frames are a few dozen bytes instead of the whole array.
+FRAME_PROTOCOL_VERSION = 2 # SYNC THIS WITH JS
+KEYFRAME_INTERVAL = 120 # A keyframe is sent at least this often, so a client that missed a delta recovers on its own
+PACK_ARRAYS = True # Whether arr, buckets, permutation and buffer are sent as base64 little-endian uint16s instead of JSON lists of numbers (graph.js reads both)
+STATS_INTERVAL = 10 # Stats change on every frame, so they are only sent with every STATS_INTERVAL-th frame (and with keyframes)
+# Attributes of VisualState that graph.js reads. Only the ones that changed are included in a delta frame
+FRAME_FIELDS = ("partitioning", "i0", "i1", "pv", "s0", "s1", "permutation", "buffer", "buffer_start", "b0", "dt", "swapping", "animate_swaps", "do_queue", "renderer")
+
+# Packs ints into base64 little-endian uint16s. Returns None if a value is outside 0..65535, in which case the values have to be sent as a list
+def pack_uint16(values: list[int]) -> str | None: # o(n) time
+    if is_numpy_array(values):
+        if len(values) > 0 and (values.min() < 0 or values.max() > 0xFFFF):
+            return None
+        data = values.astype("<u2").tobytes()
+    else:
+        try:
+            packed = array("H", values)
+        except OverflowError:
+            return None
+        if sys.byteorder == "big":
+            packed.byteswap()
+        data = packed.tobytes()
+    return base64.b64encode(data).decode("ascii")
+
+# A list of ints as it goes in a frame: packed if PACK_ARRAYS is on and the values fit, a JSON list otherwise
+def encode_int_list(values: list[int]) -> str | list[int]: # o(n) time
+    if PACK_ARRAYS:
+        packed = pack_uint16(values)
+        if packed is not None:
+            return packed
+    return to_list(values)
+
+# Number of elements drawn as one bar, which is 1 unless the array is longer than MAX_RENDERED_BARS
+def get_bucket_size(length: int) -> int: # o(1) time
+    return max(1, -(-length // MAX_RENDERED_BARS))
+
+# (min, max, mean) of arr[start:end]
+def summarize_bucket(arr: list[int], start: int, end: int) -> tuple[int, int, int]: # o(end - start) time
+    chunk = arr[start:end]
+    if is_numpy_array(chunk):
+        return int(chunk.min()), int(chunk.max()), round(float(chunk.mean()))
+    return min(chunk), max(chunk), round(sum(chunk) / len(chunk))
+
+# Flat [min, max, mean, min, max, mean, ...] list with the summary of every bucket
+def bucketize(arr: list[int], bucket_size: int) -> list[int]: # o(n) time
+    if is_numpy_array(arr):
+        starts = np.arange(0, len(arr), bucket_size)
+        counts = np.diff(np.append(starts, len(arr)))
+        summaries = np.empty((len(starts), 3), dtype=np.int64)
+        summaries[:, 0] = np.minimum.reduceat(arr, starts)
+        summaries[:, 1] = np.maximum.reduceat(arr, starts)
+        summaries[:, 2] = np.rint(np.add.reduceat(arr, starts, dtype=np.int64) / counts)
+        return summaries.ravel().tolist()
+    buckets: list[int] = []
+    for start in range(0, len(arr), bucket_size):
+        buckets.extend(summarize_bucket(arr, start, start + bucket_size))
+    return buckets
+
+class FrameEncoder:
+    __slots__ = ("seq", "dirty", "sent", "sent_length", "frames_since_keyframe", "keyframe_requested", "stats_requested")
+
+    def __init__(self):
+        self.seq = 0 # Sequence number of the last frame that was encoded
+        self.dirty: set[int] = set() # Indices of the array that changed since the last frame
+        self.sent: dict[str, Any] = {} # Values of FRAME_FIELDS as of the last frame
+        self.sent_length = -1
+        self.frames_since_keyframe = 0
+        self.keyframe_requested = True
+        self.stats_requested = True
+
+    # Marks array indices as changed. Anything that writes to VisualState.arr without going through VisualState.swap() or VisualState.write() must call this (or request_keyframe())
+    def touch(self, *indices: int):
+        self.dirty.update(indices)
+
+    # Forces the next frame to be a keyframe. Used when the whole array is replaced (regenerate, shuffle, loading a save point)
+    def request_keyframe(self):
+        self.keyframe_requested = True
+
+    # Makes the next frame include the stats, e.g. for the last frame of a sort
+    def request_stats(self):
+        self.stats_requested = True
+
+    def encode(self, chart_info: "VisualState") -> dict[str, Any]: # o(k) time for k changed indices, o(n) time for keyframes
+        arr = chart_info.arr
+        self.seq += 1
+        frame: dict[str, Any] = {"v": FRAME_PROTOCOL_VERSION, "seq": self.seq}
+
+        is_keyframe = self.keyframe_requested or self.frames_since_keyframe >= KEYFRAME_INTERVAL or len(arr) != self.sent_length
+        # Long arrays are sent as buckets, so the frame size depends on the chart's width instead of the array's length
+        bucket_size = get_bucket_size(len(arr))
+
+        if is_keyframe:
+            frame["key"] = True
+            if bucket_size > 1:
+                frame["bucket_size"] = bucket_size
+                frame["buckets"] = encode_int_list(bucketize(arr, bucket_size))
+            else:
+                frame["arr"] = encode_int_list(arr)
+            self.frames_since_keyframe = 0
+            self.keyframe_requested = False
+            self.sent_length = len(arr)
+        elif bucket_size > 1:
+            frame["key"] = False
+            # Flat list of [bucket, min, max, mean, ...] for every bucket with a changed index
+            bucket_changes: list[int] = []
+            for b in {i // bucket_size for i in self.dirty}:
+                bucket_changes.append(b)
+                bucket_changes.extend(summarize_bucket(arr, b * bucket_size, (b + 1) * bucket_size))
+            if bucket_changes:
+                frame["bset"] = bucket_changes
+            self.frames_since_keyframe += 1
+        else:
+            frame["key"] = False
+            # Flat list of [index, value, index, value, ...] pairs
+            changes: list[int] = []
+            for i in self.dirty:
+                changes.append(i)
+                changes.append(int(arr[i]))
+            if changes:
+                frame["set"] = changes
+            self.frames_since_keyframe += 1
+        self.dirty.clear()
+
+        if bucket_size > 1:
+            # graph.js doesn't have the elements of a bucketed array, so it's sent the pivot's value to colour the buckets around it
+            pv_value = None if chart_info.pv is None else int(arr[chart_info.pv])
+            if is_keyframe or "pv_value" not in self.sent or self.sent["pv_value"] != pv_value:
+                frame["pv_value"] = pv_value
+                self.sent["pv_value"] = pv_value
+
+        for k in FRAME_FIELDS:
+            v = getattr(chart_info, k)
+            if is_keyframe or k not in self.sent or self.sent[k] != v:
+                frame[k] = encode_int_list(v) if (k == "permutation" or k == "buffer") and v else v
+                self.sent[k] = v
+
+        if is_keyframe or self.stats_requested or self.seq % STATS_INTERVAL == 0:
+            frame["stats"] = chart_info.stats.to_dict()
+            self.stats_requested = False
+
+        return frame
+
+    # Starts a frame that only carries a trace chunk. graph.js is still playing the trace back, so no fields or array slots are included
+    def encode_empty(self) -> dict[str, Any]:
+        self.seq += 1
+        self.frames_since_keyframe += 1
+        return {"v": FRAME_PROTOCOL_VERSION, "seq": self.seq, "key": False}
+
+    # Records the current state as already known by graph.js (used after a trace, which ends on the current state), so the next delta is relative to it
+    def mark_sent(self, chart_info: "VisualState"):
+        self.dirty.clear()
+        self.sent_length = len(chart_info.arr)
+        for k in FRAME_FIELDS:
+            v = getattr(chart_info, k)
+            self.sent[k] = list(v) if isinstance(v, list) else v
+
+# Wraps a frame in the element that graph.js reads
+def embed_frame(frame: dict[str, Any]) -> str:
+    json_src = json.dumps(frame, separators=(",", ":"))
+    return f"<script id=\"{HTML_DATA_HOLDER_ELEMENT_ID}\" type=\"application/json\">{json_src}</script>"
+# END OF FRAME PROTOCOL
+
+
+# FRAME STREAMING
+# graph.js subscribes to its session's frames with server-sent events at FRAME_STREAM_PATH/<channel id>. While it's subscribed, frames are sent there
+# instead of through hidden_graph_data, which skips gradio's queue, diffing and DOM replacement for every frame.
+# hidden_graph_data is still used for the frame that gives graph.js the channel id, and whenever nothing is subscribed (no EventSource, or the stream dropped)
+FRAME_STREAM_PATH = "/frames" # SYNC THIS WITH JS
+FRAME_STREAM_BACKLOG = 1024 # Frames that can wait for a slow client. When it's full, frames go through hidden_graph_data until it drains
+FRAME_STREAM_KEEPALIVE = 15 # Seconds between comments sent on an idle stream, so proxies don't close it
+
+class FrameChannel:
+    def __init__(self):
+        self.queue: asyncio.Queue[str] = asyncio.Queue(FRAME_STREAM_BACKLOG)
+        self.resync = True # A new subscriber may have missed frames, so the next frame sent to it is a keyframe
+
+    # Queues a frame for the subscriber. Must be called from the event loop (the frame handlers are async for this reason). Returns False if the backlog is full
+    def publish(self, frame: dict[str, Any]) -> bool:
+        try:
+            self.queue.put_nowait(json.dumps(frame, separators=(",", ":")))
+            return True
+        except asyncio.QueueFull:
+            return False
+
+# Channel id -> channel, only for channels that have a subscriber
+frame_channels: dict[str, FrameChannel] = {}
+
+def new_channel_id() -> str:
+    return secrets.token_urlsafe(16)
+
+# The event stream of one subscriber. The channel exists while the subscriber is connected
+async def stream_frame_channel(channel_id: str) -> AsyncGenerator[str, None]:
+    channel = FrameChannel()
+    # A newer subscription (e.g. a reloaded tab) replaces the older one
+    frame_channels[channel_id] = channel
+    try:
+        yield "retry: 1000\n\n"
+        while True:
+            try:
+                data = await asyncio.wait_for(channel.queue.get(), FRAME_STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield f"data: {data}\n\n"
+    finally:
+        if frame_channels.get(channel_id) is channel:
+            del frame_channels[channel_id]
+
+# Adds the frame stream route to the FastAPI app that serves the gradio app
+def mount_frame_stream(app: Any):
+    async def frame_stream_route(channel_id: str):
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        return StreamingResponse(stream_frame_channel(channel_id), media_type="text/event-stream", headers=headers)
+    app.add_api_route(FRAME_STREAM_PATH + "/{channel_id}", frame_stream_route, methods=["GET"])
+# END OF FRAME STREAMING
+
+
+# OPERATION TRACES
+# A trace is a recording of a whole sort, played back by graph.js on its own clock instead of receiving one frame per step.
+# Every op is packed as 3 int32 values: [op, a, b]. None is stored as -1. SYNC THESE WITH JS
+OP_FRAME = 0 # a: duration of the frame in milliseconds. Marks a point where the live handlers would have sent a frame
+OP_RANGE = 1 # a: i0, b: i1
+OP_PIVOT = 2 # a: pv
+OP_COMPARE = 3 # a: s0, b: s1 (highlighted, swapping = False)
+OP_SWAP_INTENT = 4 # a: s0, b: s1 (highlighted, swapping = True)
+OP_SWAP = 5 # a, b: indices swapped in the array
+OP_PARTITIONING = 6 # a: 1 if partitioning, otherwise 0
+OP_WRITE = 7 # a: index written to, b: the value written
+OP_BUFFER = 8 # a, b: range of the array copied into the buffer (it holds arr[a:b] at this point of the trace), with b0 back at 0. a = -1 empties the buffer
+OP_BUFFER_HEAD = 9 # a: b0
+TRACE_OP_WIDTH = 3
+TRACE_CHUNK_OPS = 1 << 16 # Maximum ops per frame; longer traces are sent over several frames
+
+def none_to_int(v: int | None) -> int:
+    return -1 if v is None else v
+
+def int_to_none(v: int) -> int | None:
+    return None if v == -1 else v
+
+class SortTrace:
+    def __init__(self, chart_info: "VisualState"):
+        self.ops = array("i")
+        # Start from the state graph.js receives in the keyframe, so only changes are recorded
+        self.i0 = chart_info.i0
+        self.i1 = chart_info.i1
+        self.pv = chart_info.pv
+        self.highlight = (chart_info.s0, chart_info.s1, chart_info.swapping)
+        self.partitioning = chart_info.partitioning
+        self.b0 = chart_info.b0
+
+    def record_swap(self, a: int, b: int): # o(1) time
+        self.ops.extend((OP_SWAP, a, b))
+
+    def record_write(self, index: int, value: int): # o(1) time
+        self.ops.extend((OP_WRITE, index, value))
+
+    # Recorded when the buffer is filled, before any writes, so playback can copy it from the array
+    def record_buffer(self, start: int, end: int): # o(1) time
+        self.ops.extend((OP_BUFFER, start, end))
+        self.b0 = 0
+
+    # Records the fields that changed since the last recorded state
+    def record_state(self, chart_info: "VisualState"): # o(1) time
+        ops = self.ops
+        if chart_info.partitioning != self.partitioning:
+            self.partitioning = chart_info.partitioning
+            ops.extend((OP_PARTITIONING, int(self.partitioning), 0))
+        if chart_info.i0 != self.i0 or chart_info.i1 != self.i1:
+            self.i0 = chart_info.i0
+            self.i1 = chart_info.i1
+            ops.extend((OP_RANGE, self.i0, self.i1))
+        if chart_info.pv != self.pv:
+            self.pv = chart_info.pv
+            ops.extend((OP_PIVOT, none_to_int(self.pv), 0))
+        highlight = (chart_info.s0, chart_info.s1, chart_info.swapping)
+        if highlight != self.highlight:
+            self.highlight = highlight
+            ops.extend((OP_SWAP_INTENT if chart_info.swapping else OP_COMPARE, none_to_int(chart_info.s0), none_to_int(chart_info.s1)))
+        if chart_info.b0 != self.b0:
+            self.b0 = chart_info.b0
+            ops.extend((OP_BUFFER_HEAD, self.b0, 0))
+
+    def record_frame(self, interval: float):
+        self.ops.extend((OP_FRAME, round(interval * 1000), 0))
+
+    # Runs a sort generator until it finishes, the trace holds max_ops ops, max_steps steps were taken or the deadline passes. Returns True once the generator is exhausted
+    def record(self, generator: Generator, chart_info: "VisualState", session_info: "InternalState", max_ops: int, max_steps: float = float("inf"), deadline: float = float("inf")) -> bool:
+        limit = max_ops * TRACE_OP_WIDTH
+        ops = self.ops
+        stats = chart_info.stats
+        steps = 0
+        for job_finished in generator:
+            stats.yields += 1
+            if job_finished:
+                stats.jobs += 1
+            interval = get_frame_interval(chart_info, session_info, job_finished)
+            if interval is not None:
+                # Mirrors the live handlers, which show the partition that just finished when queries are hidden
+                if session_info.show_queries:
+                    self.record_state(chart_info)
+                else:
+                    chart_info.partitioning = True
+                    self.record_state(chart_info)
+                    chart_info.partitioning = False
+                self.record_frame(interval)
+
+                if len(ops) >= limit:
+                    return False
+            steps += 1
+            if steps >= max_steps or perf_counter() >= deadline:
+                return False
+        return True
+
+    # Returns the recorded ops as base64 (little-endian int32) and starts a new chunk
+    def flush(self) -> str:
+        encoded = encode_trace_ops(self.ops)
+        self.ops = array("i")
+        return encoded
+
+def encode_trace_ops(ops: array) -> str: # o(n) time
+    if sys.byteorder == "big":
+        ops = array("i", ops)
+        ops.byteswap()
+    return base64.b64encode(ops.tobytes()).decode("ascii")
+# END OF OPERATION TRACES
+
+
+# UNDO LOG
+# Every Step records the swaps it makes, so "Step Back" can undo them in reverse order instead of re-running the sort from a save point.
+# The swaps of all recorded steps share one ring buffer; when it's full, the oldest steps are forgotten.
+# Writes (see VisualState.write()) share the ring buffer too, as (~index, value before the write) pairs; ~index is negative, which tells them apart from swaps
+DEFAULT_UNDO_DEPTH = 100000 # Swaps kept for stepping back
+MAX_UNDO_DEPTH = 1000000
+UNDO_FIELDS = ("partitioning", "i0", "i1", "pv", "s0", "s1", "buffer", "buffer_start", "b0", "swapping", "dt") # Visual fields restored when a step is undone
+
+class UndoLog:
+    __slots__ = ("swaps", "depth", "head", "size", "steps", "recording")
+
+    def __init__(self, depth: int = DEFAULT_UNDO_DEPTH):
+        self.swaps = array("i") # Ring buffer of (a, b) pairs, grown up to 2 * depth values
+        self.depth = depth
+        self.head = 0 # Pair index the next swap is written to
+        self.size = 0 # Pairs that belong to a recorded step
+        # One entry per step, oldest first: [swap count, step_sort_jobs before the step, UNDO_FIELDS before the step]
+        self.steps: deque[list[Any]] = deque()
+        self.recording: list[Any] | None = None # The entry of the step being recorded, which is always the newest
+
+    # Starts recording a step. Swaps are recorded while chart_info.undo is this log. Returns the step's entry, for end_step()
+    def begin_step(self, chart_info: "VisualState", step_sort_jobs: JobStack | None) -> list[Any] | None:
+        if self.depth == 0:
+            return None
+        jobs = step_sort_jobs.copy() if step_sort_jobs is not None else None
+        self.recording = [0, jobs, tuple(getattr(chart_info, k) for k in UNDO_FIELDS)]
+        self.steps.append(self.recording)
+        chart_info.undo = self
+        return self.recording
+
+    # Stops recording the step, unless a newer step has started since (a Step handler that was interrupted by another Step finishes after it)
+    def end_step(self, chart_info: "VisualState", step: list[Any] | None):
+        if step is None or self.recording is not step:
+            return
+        self.recording = None
+        if chart_info.undo is self:
+            chart_info.undo = None
+
+    def record_write(self, index: int, old_value: int): # o(1) time amortized
+        self.record_swap(~index, old_value)
+
+    def record_swap(self, a: int, b: int): # o(1) time amortized
+        if self.recording is None:
+            return
+        while self.size == self.depth:
+            # The oldest step is losing its first swap, so it can't be undone anymore. If that's the step being recorded, it's too long to undo at all
+            forgotten = self.steps.popleft()
+            self.size -= forgotten[0]
+            if not self.steps:
+                self.recording = None
+                return
+
+        if len(self.swaps) < 2 * self.depth:
+            self.swaps.append(a)
+            self.swaps.append(b)
+        else:
+            self.swaps[2 * self.head] = a
+            self.swaps[2 * self.head + 1] = b
+        self.head = (self.head + 1) % self.depth
+        self.size += 1
+        self.recording[0] += 1
+
+    # Undoes the newest step: swaps its pairs back in reverse order and restores the highlights and pending jobs from before it.
+    # Returns False if there is no step to undo
+    def undo_step(self, chart_info: "VisualState", session_info: "InternalState") -> bool: # o(swaps in the step) time
+        if not self.steps:
+            return False
+        swap_count, jobs, fields = self.steps.pop()
+
+        arr = chart_info.arr
+        swaps = self.swaps
+        encoder = chart_info.encoder
+        head = self.head
+        for _ in range(swap_count):
+            head = (head - 1) % self.depth
+            a = swaps[2 * head]
+            b = swaps[2 * head + 1]
+            if a < 0:
+                arr[~a] = b
+                encoder.touch(~a)
+                continue
+            arr[a], arr[b] = arr[b], arr[a]
+            encoder.touch(a, b)
+        self.head = head
+        self.size -= swap_count
+
+        for k, v in zip(UNDO_FIELDS, fields):
+            setattr(chart_info, k, v)
+        chart_info.permutation = None
+        session_info.step_sort_jobs = jobs
+        return True
+
+    def step_count(self) -> int:
+        return len(self.steps)
+
+    # Forgets every step. Called whenever the array changes other than by stepping
+    def clear(self):
+        self.swaps = array("i")
+        self.head = 0
+        self.size = 0
+        self.steps.clear()
+        self.recording = None
+
+    def set_depth(self, depth: int):
+        if depth != self.depth:
+            self.depth = depth
+            self.clear()
+
+    def nbytes(self) -> int:
+        return array_nbytes(self.swaps) + sum(step[1].nbytes() for step in self.steps if step[1] is not None)
+# END OF UNDO LOG
+
+
+# SORT RECORDINGS
+# A recording of a whole sort, which the chart can be moved to any step of ("Timeline Step") without running the sort up to that step.
+# The steps (every yield of the sort generator) are stored as trace ops, see OPERATION TRACES. Every keyframe_interval ops, a copy of the array is kept too,
+# so seeking copies the nearest earlier keyframe and replays at most keyframe_interval ops from it
+RECORDING_KEYFRAME_OPS = 4096 # Keyframe interval for short arrays. Long arrays use their length, so the copies never take more memory than the ops
+MAX_RECORDING_OPS = 1 << 21 # Longer sorts are only recorded up to this many ops
+
+class SortRecording:
+    __slots__ = ("trace", "step_ends", "keyframe_steps", "keyframes", "keyframe_interval", "complete")
+
+    def __init__(self, chart_info: "VisualState"):
+        self.trace = SortTrace(chart_info) # Only its ops and its record_state() are used
+        self.step_ends = array("i", [0]) # Number of ops recorded at the end of each step. Step 0 is the starting state
+        self.keyframe_steps = array("i") # Step of each keyframe, ascending
+        self.keyframes: list[tuple[list[int], tuple]] = [] # (array, UNDO_FIELDS) at each of keyframe_steps
+        self.keyframe_interval = max(RECORDING_KEYFRAME_OPS, len(chart_info.arr))
+        self.complete = False # Whether the sort finished before MAX_RECORDING_OPS
+        self.add_keyframe(chart_info)
+
+    def add_keyframe(self, chart_info: "VisualState"): # o(n) time
+        self.keyframe_steps.append(len(self.step_ends) - 1)
+        self.keyframes.append((chart_info.arr.copy(), tuple(getattr(chart_info, k) for k in UNDO_FIELDS)))
+
+    # Runs the sort generator (on chart_info, which has to have this recording's trace as chart_info.trace) for up to max_steps steps, or until the deadline passes.
+    # Returns True once the sort has finished or the recording is full
+    def record(self, generator: Generator, chart_info: "VisualState", max_steps: int, deadline: float = float("inf")) -> bool:
+        trace = self.trace
+        step_ends = self.step_ends
+        steps = 0
+        for _ in generator:
+            trace.record_state(chart_info)
+            op_count = len(trace.ops) // TRACE_OP_WIDTH
+            step_ends.append(op_count)
+            if op_count - step_ends[self.keyframe_steps[-1]] >= self.keyframe_interval:
+                self.add_keyframe(chart_info)
+            if op_count >= MAX_RECORDING_OPS:
+                generator.close()
+                return True
+            steps += 1
+            if steps >= max_steps or perf_counter() >= deadline:
+                return False
+        self.complete = True
+        return True
+
+    # Number of the last step (steps go from 0 to this)
+    def step_count(self) -> int:
+        return len(self.step_ends) - 1
+
+    # Moves chart_info to the given step: copies the nearest keyframe at or before it, and replays the ops in between
+    def seek(self, chart_info: "VisualState", step: int): # o(n + keyframe_interval) time
+        step = min(max(step, 0), self.step_count())
+        keyframe = bisect_right(self.keyframe_steps, step) - 1
+        arr, fields = self.keyframes[keyframe]
+
+        chart_info.arr = arr.copy()
+        for k, v in zip(UNDO_FIELDS, fields):
+            setattr(chart_info, k, v)
+        chart_info.permutation = None
+
+        ops = self.trace.ops
+        arr = chart_info.arr
+        for i in range(self.step_ends[self.keyframe_steps[keyframe]] * TRACE_OP_WIDTH, self.step_ends[step] * TRACE_OP_WIDTH, TRACE_OP_WIDTH):
+            op, a, b = ops[i], ops[i + 1], ops[i + 2]
+            if op == OP_SWAP:
+                arr[a], arr[b] = arr[b], arr[a]
+            elif op == OP_WRITE:
+                arr[a] = b
+            elif op == OP_RANGE:
+                chart_info.i0 = a
+                chart_info.i1 = b
+            elif op == OP_PIVOT:
+                chart_info.pv = int_to_none(a)
+            elif op == OP_COMPARE or op == OP_SWAP_INTENT:
+                chart_info.s0 = int_to_none(a)
+                chart_info.s1 = int_to_none(b)
+                chart_info.swapping = op == OP_SWAP_INTENT
+            elif op == OP_PARTITIONING:
+                chart_info.partitioning = a == 1
+            elif op == OP_BUFFER:
+                chart_info.buffer = None if a == -1 else tuple(to_list(arr[a:b]))
+                chart_info.b0 = 0
+                if a != -1:
+                    chart_info.buffer_start = a
+            elif op == OP_BUFFER_HEAD:
+                chart_info.b0 = a
+        chart_info.dt = 0
+        # The whole array was replaced
+        chart_info.encoder.request_keyframe()
+
+    def nbytes(self) -> int:
+        return array_nbytes(self.trace.ops) + array_nbytes(self.step_ends) + sum(array_nbytes(arr) for arr, _ in self.keyframes)
+# END OF SORT RECORDINGS
 
 
 # CLASSES
 
 class VisualState:
-    arr: list[int]
-    partitioning: bool = False
-    i0: int = 0 # Lower interval index
-    i1: int = 0 # Upper interval index
-    pv: int | None = None # Pivot index
-    s0: int | None = None # First swap index
-    s1: int | None = None # Second swap index
-    bulk_swap: list[tuple[int,int]] | None = None # A list of 2-element arrays for rendering multiple swaps at once: {[0] = s0, [1] = s1, [2] = dt}
-    dt: float = 0 # Expected time delay before proceeding
-    swapping: bool = False # Whether a swap is occurring. The swap indexes will be coloured differently if (swapping)
-    animate_swaps: bool = True # Whether to animate swaps
-    do_queue: bool = True # Whether to queue data sent to js or to drop other frames
+    # Attributes are listed in __slots__ instead of a per-instance __dict__, which makes every session's state smaller.
+    # The attributes in FRAME_FIELDS are what graph.js reads, and also what clone() and to_bytes() keep
+    __slots__ = ("arr", *FRAME_FIELDS, "channel_id", "encoder", "stats", "trace", "undo")
+
+    arr: list[int] # A list, or a numpy int32 array once it's large enough (see regenerate())
+    partitioning: bool
+    i0: int # Lower interval index
+    i1: int # Upper interval index
+    pv: int | None # Pivot index
+    s0: int | None # First swap index
+    s1: int | None # Second swap index
+    permutation: list[int] | None # Elements that are all moved at once (by a shuffle), as the cycles from permutation_cycles(). Never edited in place
+    buffer: tuple[int, ...] | None # Elements a merge or radix sort copied out of the array, drawn as a strip under the chart. Set through set_buffer(), never edited in place
+    buffer_start: int # Index of the array the buffer was copied from. Element k of the buffer is drawn under index buffer_start + k
+    b0: int # Index in the buffer of the next element to be written back. The ones before it have already left the buffer
+    dt: float # Expected time delay before proceeding
+    swapping: bool # Whether a swap is occurring. The swap indexes will be coloured differently if (swapping)
+    animate_swaps: bool # Whether to animate swaps
+    do_queue: bool # Whether to queue data sent to js or to drop other frames
+    renderer: str # Which of RENDERERS graph.js draws the chart with
+    channel_id: str | None # Id of the session's frame stream (see FRAME STREAMING). Set when the page loads
+    encoder: FrameEncoder
+    stats: SortStats
+    trace: SortTrace | None # Receives every swap and write while a sort is being recorded for client-side playback
+    undo: UndoLog | None # Receives every swap and write while a Step is running, for "Step Back"
     
     def __init__(self):
         self.arr = regenerate([])
-        self.animate_swaps = True # Make sure __dict__ knows this value exists? Idk if this is necessary
+        self.partitioning = False
+        self.i0 = 0
+        self.i1 = 0
+        self.pv = None
+        self.s0 = None
+        self.s1 = None
+        self.permutation = None
+        self.buffer = None
+        self.buffer_start = 0
+        self.b0 = 0
+        self.dt = 0
+        self.swapping = False
+        self.animate_swaps = True
+        self.do_queue = True
+        self.renderer = RENDERERS[0]
+        self.channel_id = None
+        self.encoder = FrameEncoder()
+        self.stats = SortStats()
+        self.trace = None
+        self.undo = None
+
+    # Swaps two elements of the array. Generators should swap through this method so the frame encoder knows which indices changed
+    def swap(self, a: int, b: int): # o(1) time
+        arr = self.arr
+        arr[a], arr[b] = arr[b], arr[a]
+        self.encoder.touch(a, b)
+        stats = self.stats
+        stats.swaps += 1
+        stats.writes += 2
+        if self.trace is not None:
+            self.trace.record_swap(a, b)
+        if self.undo is not None:
+            self.undo.record_swap(a, b)
+
+    # Overwrites one element, for sorts that move elements through a buffer instead of swapping them (merge and radix sort). Like swap(), generators should write through this method
+    def write(self, index: int, value: int): # o(1) time
+        arr = self.arr
+        if self.undo is not None:
+            self.undo.record_write(index, arr[index])
+        arr[index] = value
+        self.encoder.touch(index)
+        self.stats.writes += 1
+        if self.trace is not None:
+            self.trace.record_write(index, value)
+
+    # Shows arr[start:end] as the buffer strip. Only unbucketed arrays get one; a bucketed chart has no room to line it up under its elements
+    def set_buffer(self, start: int, end: int): # o(end - start) time
+        if get_bucket_size(len(self.arr)) > 1: return
+        self.buffer = tuple(to_list(self.arr[start:end]))
+        self.buffer_start = start
+        self.b0 = 0
+        if self.trace is not None:
+            self.trace.record_buffer(start, end)
+
+    def clear_buffer(self): # o(1) time
+        if self.buffer is None: return
+        self.buffer = None
+        self.b0 = 0
+        if self.trace is not None:
+            self.trace.record_buffer(-1, -1)
 
     def reset_visuals(self):
         self.i0 = 0
@@ -91,35 +975,10 @@ class VisualState:
         self.s0 = None
         self.s1 = None
         self.pv = None
+        self.buffer = None
+        self.b0 = 0
         self.dt = 0
 
-        
-    def convert_bulk_swap_attribute_to_antisymmetric_and_irreflexive(self):
-
-        # For indices that swapped places, there will be (a,b) and (b,a). This will cause the animation to run the same thing.
-        # This means, in discrete math terms:
-        # Given the relation of R = {kEN, 0 <= k < len(chart_info.arr): (chart_info.s[k][0], chart_info.s[k][1])}
-        # R must be antisymmetric.
-        # R does not have to be irreflexive, but it can be done to optimize data transfer (sending (a,a) is useless and takes a couple bytes)
-        
-        if not self.bulk_swap: return
-        pairs: dict[int, int] = {}
-        # Iterate backwards so popping doesn't affect indexing
-        for i in range(len(self.bulk_swap) - 1, -1, -1):
-
-            relation: tuple[int,int] = self.bulk_swap[i]
-            a = relation[0]
-            b = relation[1]
-
-            # Irreflexive
-            if a == b:
-                self.bulk_swap.pop(i)
-                continue
-            # Antisymmetric
-            if b in pairs and pairs[b] == a:
-                self.bulk_swap.pop(i)
-                continue
-            pairs[a] = b
 
     def get_wait_multiplier_for(self, s0: int, s1: int) -> float:
         return log(2 + abs(s0 - s1), 2)
@@ -130,56 +989,330 @@ class VisualState:
         return self.get_wait_multiplier_for(self.s0, self.s1)
     
     def to_embedded_json(self) -> str:
-        json_src = json.dumps(self.__dict__)
-        return f"<script id=\"{HTML_DATA_HOLDER_ELEMENT_ID}\" type=\"application/json\">{json_src}</script>"
+        return embed_frame(self.encoder.encode(self))
+
+    # Sends a frame through the session's frame stream if graph.js is subscribed to it, and returns None.
+    # Otherwise returns the frame embedded for hidden_graph_data
+    def deliver(self, frame: dict[str, Any]) -> str | None:
+        channel = frame_channels.get(self.channel_id) if self.channel_id else None
+        if channel is not None:
+            if channel.publish(frame):
+                return None
+            # The subscriber fell behind; this frame goes through hidden_graph_data, and the stream picks up again with a keyframe
+            channel.resync = True
+        return embed_frame(frame)
+
+    # Encodes and delivers the next frame
+    def next_frame(self) -> str | None:
+        channel = frame_channels.get(self.channel_id) if self.channel_id else None
+        if channel is not None and channel.resync and not channel.queue.full():
+            channel.resync = False
+            self.encoder.request_keyframe()
+        return self.deliver(self.encoder.encode(self))
+
+    # next_frame() as the output of a handler that updates hidden_graph_data
+    def frame_output(self) -> Any:
+        return self.next_frame() or gr.skip()
     
+    # The clone starts its own frame sequence (with a keyframe) and its own stats instead of sharing these
     def clone(self):
         new_clone = VisualState()
+        new_clone.arr = self.arr.copy() # Both lists and numpy arrays copy their buffer in one go
+        for k in FRAME_FIELDS:
+            setattr(new_clone, k, getattr(self, k))
+        new_clone.channel_id = self.channel_id
+        return new_clone
 
-        read = self.__dict__
-        
-        for k in read:
-            v: Any = read[k]
-            new_v = v
-            if isinstance(v, list):
-                new_v: list[Any] = []
-                for j in range(len(v)):
-                    new_v.append(v[j]) # deepcopying is not supported; I don't know enough python syntax, and it's not required here because this object's maximum depth is known
+    # Rough number of bytes the array takes
+    def nbytes(self) -> int: # o(1) time
+        return array_nbytes(self.arr)
+
+    # Compact encoding of the array and FRAME_FIELDS: a JSON header with the fields, then the array as little-endian int32s, compressed
+    def to_bytes(self) -> bytes: # o(n) time
+        header = {k: getattr(self, k) for k in FRAME_FIELDS}
+        header["numpy"] = is_numpy_array(self.arr)
+        header_bytes = json.dumps(header, separators=(",", ":")).encode()
+        return zlib.compress(len(header_bytes).to_bytes(4, "little") + header_bytes + int32_to_bytes(self.arr), 1)
+
+    # Decodes to_bytes(). The state gets a fresh frame encoder and stats, like a clone
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "VisualState": # o(n) time
+        raw = zlib.decompress(data)
+        header_length = int.from_bytes(raw[:4], "little")
+        header = json.loads(raw[4:4 + header_length])
+        body = raw[4 + header_length:]
+
+        state = cls()
+        state.arr = int32_from_bytes(body, header.pop("numpy"))
+        for k, v in header.items():
+            setattr(state, k, v)
+        if state.buffer is not None:
+            state.buffer = tuple(state.buffer) # JSON has no tuples
+        return state
+    
+# Save points are stored as deltas: the indices and values where the saved array differs from a shared base copy.
+# The base is only copied when a save point is too different from it, so saving while a sort runs costs the size of the changes rather than a full copy.
+MAX_SAVE_POINTS = 16 # Per session. Saving another one removes the oldest
+SAVE_POINT_MAX_DELTA = 0.25 # A save point that differs from the base in more than this fraction of elements gets a new base
+
+# A copy of an array that save points are stored as deltas against. It's never modified, so every save point made from it can share it
+class SavePointBase:
+    __slots__ = ("arr", "packed", "numpy", "length")
+
+    arr: list[int] | None # None while packed
+    packed: bytes | None # zlib compressed int32_to_bytes() of the array, see compact()
+    numpy: bool
+    length: int
+
+    def __init__(self, arr: list[int]):
+        self.arr = arr.copy()
+        self.packed = None
+        self.numpy = is_numpy_array(arr)
+        self.length = len(arr)
+
+    def get(self) -> list[int]:
+        if self.arr is None:
+            self.arr = int32_from_bytes(zlib.decompress(self.packed), self.numpy)
+            self.packed = None
+        return self.arr
+
+    # Compresses the array until the next get()
+    def compact(self):
+        if self.arr is not None:
+            self.packed = zlib.compress(int32_to_bytes(self.arr), 1)
+            self.arr = None
+
+    def nbytes(self) -> int:
+        return len(self.packed) if self.arr is None else array_nbytes(self.arr)
+
+    # Indices and values of arr where it differs from this base, or None if there are more than max_changes of them
+    def diff(self, arr: list[int], max_changes: int) -> tuple[Any, Any] | None: # o(n) time
+        base = self.get()
+        if self.numpy:
+            indices = np.flatnonzero(base != arr)
+            if len(indices) > max_changes:
+                return None
+            return indices.astype(np.int32), arr[indices]
+
+        indices = array("i")
+        values = array("i")
+        for i in range(self.length):
+            if base[i] != arr[i]:
+                if len(indices) == max_changes:
+                    return None
+                indices.append(i)
+                values.append(arr[i])
+        return indices, values
+
+    def fits(self, arr: list[int]) -> bool:
+        return self.length == len(arr) and self.numpy == is_numpy_array(arr)
+
+class SavePoint:
+    __slots__ = ("base", "indices", "values", "fields")
+
+    def __init__(self, base: SavePointBase, indices: Any, values: Any, fields: dict[str, Any]):
+        self.base = base
+        self.indices = indices
+        self.values = values
+        self.fields = fields # FRAME_FIELDS of the saved state
+
+    # A new state with the saved array: a copy of the base with the changes written over it
+    def restore(self) -> VisualState: # o(n) time, but only the changes are written in python for list arrays
+        arr = self.base.get().copy()
+        if self.base.numpy:
+            arr[self.indices] = self.values
+        else:
+            for i, v in zip(self.indices, self.values):
+                arr[i] = v
 
-            setattr(new_clone, k, new_v)
+        state = VisualState()
+        state.arr = arr
+        for k, v in self.fields.items():
+            setattr(state, k, v)
+        state.reset_visuals()
+        return state
 
+    # Bytes of the changes; the base is counted by SavePointStore because it's shared
+    def nbytes(self) -> int:
+        return array_nbytes(self.indices) + array_nbytes(self.values)
+
+# A session's save points by name, oldest first
+class SavePointStore:
+    __slots__ = ("slots", "base", "saved")
+
+    def __init__(self):
+        self.slots: dict[str, SavePoint] = {}
+        self.base: SavePointBase | None = None # Base of the newest save point, which the next one is compared with
+        self.saved = 0 # Number of save points made, for naming them
+
+    def next_name(self) -> str:
+        return f"Save Point {self.saved + 1}"
+
+    def names(self) -> list[str]:
+        return list(self.slots.keys())
+
+    def save(self, name: str, chart_info: VisualState): # o(n) time
+        arr = chart_info.arr
+        delta = None
+        if self.base is not None and self.base.fits(arr):
+            delta = self.base.diff(arr, floor(len(arr) * SAVE_POINT_MAX_DELTA))
+        if delta is None:
+            self.base = SavePointBase(arr)
+            delta = (array("i"), array("i"))
+
+        fields = {k: getattr(chart_info, k) for k in FRAME_FIELDS}
+
+        # Saving over a name makes it the newest
+        self.slots.pop(name, None)
+        self.slots[name] = SavePoint(self.base, delta[0], delta[1], fields)
+        self.saved += 1
+        while len(self.slots) > MAX_SAVE_POINTS:
+            del self.slots[next(iter(self.slots))]
+
+    def load(self, name: str) -> VisualState | None:
+        save_point = self.slots.get(name)
+        return save_point.restore() if save_point else None
+
+    def delete(self, name: str):
+        self.slots.pop(name, None)
+        if not self.slots:
+            self.base = None
+
+    def clear(self):
+        self.slots.clear()
+        self.base = None
+
+    def bases(self) -> list[SavePointBase]:
+        unique: dict[int, SavePointBase] = {}
+        for save_point in self.slots.values():
+            unique[id(save_point.base)] = save_point.base
+        return list(unique.values())
+
+    # Compresses every base. Their arrays are decompressed again when a save point made from them is loaded or compared with
+    def compact(self):
+        for base in self.bases():
+            base.compact()
+
+    def nbytes(self) -> int:
+        return sum(base.nbytes() for base in self.bases()) + sum(save_point.nbytes() for save_point in self.slots.values())
+
+# Attributes of InternalState that change how a sort runs, which InternalState.fork() copies
+SORT_SETTINGS = ("pv_alpha", "wait_interval", "use_random_pv", "pv_seed", "pv_strategy", "three_way_partition", "insertion_cutoff", "use_depth_limit", "gap_sequence", "show_queries", "show_comparisons", "algorithm")
 
-        return new_clone
-    
 # bounded by 32-bit int lim.
 START_CALL_ID = -2**31
 MAX_CALL_ID = 2**31 - 1
 class InternalState:
+    __slots__ = (
+        "is_active", "step_sort_jobs", "call_id", "pv_alpha", "wait_interval", "use_random_pv", "pv_seed", "pv_strategy", "three_way_partition", "insertion_cutoff",
+        "use_depth_limit", "gap_sequence", "show_queries", "show_comparisons", "use_playback", "algorithm", "save_points", "undo_log", "recording", "active_generator", "event_loop", "chart", "last_active", "__weakref__",
+    )
 
-    is_active: bool = False # Whether sorting is active
-    step_sort_jobs: list[Job] | None = None
-    call_id: int = START_CALL_ID
-    pv_alpha: float = 1.0
+    is_active: bool # Whether sorting is active
+    step_sort_jobs: JobStack | None
+    call_id: int
+    pv_alpha: float
+
+    wait_interval: float
+
+    use_random_pv: bool
+    pv_seed: int # Seed of the random pivots, so the same array is always sorted the same way (which lets sorts be cached, see TRACE CACHE)
+    pv_strategy: str # One of PIVOT_STRATEGIES, used when use_random_pv is off
+    three_way_partition: bool # Whether quick-sort groups elements equal to the pivot
+    insertion_cutoff: int # Quick-sort insertion sorts ranges of at most this many elements (0 to disable)
+    use_depth_limit: bool # Whether quick-sort falls back to heap sort for deeply nested ranges (introsort)
+    gap_sequence: str # One of SHELL_GAP_SEQUENCES, the gaps shell sort uses
+    show_queries: bool
+    show_comparisons: bool
+    use_playback: bool # Whether to record whole sorts and let graph.js play them back, instead of sending a frame per step
+    
+    algorithm: str
 
-    wait_interval: float = 0.1
+    save_points: SavePointStore
+    undo_log: UndoLog # Swaps of the latest Steps, for "Step Back"
+    recording: SortRecording | None # The sort recorded by "Record Timeline", for "Timeline Step"
 
-    use_random_pv: bool = False
-    show_queries: bool = True
-    show_comparisons: bool = True
-    
-    algorithm: str = "Quick-Sort"
+    active_generator: Generator | None # The sort generator a handler is currently stepping through, so "Skip to End" can close it
+    event_loop: asyncio.AbstractEventLoop | None # The loop active_generator is stepped on, for closing it from other threads (see end_session())
+
+    chart: VisualState | None # The session's chart_info, for memory estimates. Set when the page loads
+    last_active: float # perf_counter() of the session's last interaction
 
-    snapshot: VisualState | None = None
+    def __init__(self):
+        self.is_active = False
+        self.step_sort_jobs = None
+        self.call_id = START_CALL_ID
+        self.pv_alpha = 1.0
+        self.wait_interval = 0.1
+        self.use_random_pv = False
+        self.pv_seed = rand.getrandbits(31)
+        self.pv_strategy = "Custom Point"
+        self.three_way_partition = False
+        self.insertion_cutoff = 0
+        self.use_depth_limit = False
+        self.gap_sequence = "Ciura"
+        self.show_queries = True
+        self.show_comparisons = True
+        self.use_playback = False
+        self.algorithm = "Quick-Sort"
+        self.save_points = SavePointStore()
+        self.undo_log = UndoLog()
+        self.recording = None
+        self.active_generator = None
+        self.event_loop = None
+        self.chart = None
+        self.last_active = perf_counter()
+
+    def touch(self):
+        self.last_active = perf_counter()
+
+    # Rough number of bytes the session's arrays and pending jobs take
+    def memory_usage(self) -> int: # o(1) time
+        total = 0
+        if self.chart is not None:
+            total += self.chart.nbytes()
+        total += self.save_points.nbytes()
+        total += self.undo_log.nbytes()
+        if self.recording is not None:
+            total += self.recording.nbytes()
+        if self.step_sort_jobs is not None:
+            total += self.step_sort_jobs.nbytes()
+        return total
+
+    # Compresses the save points and drops the pending step jobs, the step back history and the timeline; the next Step starts the sort over, which still ends sorted
+    def compact(self):
+        self.save_points.compact()
+        self.step_sort_jobs = None
+        self.undo_log.clear()
+        self.recording = None
+
+    # A session with the same sort settings and a copy of the pending step jobs, for running a sort without changing this one
+    def fork(self) -> "InternalState":
+        forked = InternalState()
+        for k in SORT_SETTINGS:
+            setattr(forked, k, getattr(self, k))
+        if self.step_sort_jobs is not None:
+            forked.step_sort_jobs = self.step_sort_jobs.copy()
+        return forked
 
     # Functions used to ensure that only one thing is running at once.
+    # new_lock() closes the running sort, which is stepped on the event loop (see SORT SCHEDULER), so it has to be called on the event loop too.
+    # That's why the handlers that take the lock are async: gradio runs sync handlers in worker threads
     def new_lock(self):
         this_id = self.call_id + 1
         # Ensure continuity, if the user hits the max call ids, set it back to -2**31
         if this_id > MAX_CALL_ID:
             this_id = START_CALL_ID
 
+        # The sort that held the lock is closed now instead of whenever it's garbage collected, so a sort holding elements in a buffer (merge and radix sort)
+        # puts them back before anything else uses the array
+        if self.active_generator is not None:
+            self.active_generator.close()
+            self.active_generator = None
+
         self.is_active = True
         self.call_id = this_id
+        self.touch()
         return this_id
 
     def lock_active(self):
@@ -194,39 +1327,76 @@ class InternalState:
             self.is_active = False
 # END OF CLASSES
 
-def shuffle_iterative(chart_info: VisualState, shuffle_strength: float=1.0):
-
-
-
 
-    if len(chart_info.arr) < MAXIMUM_ELEMENTS_FOR_SHUFFLE_ANIMATION:
-        # Tracer array, shuffles a set of indices, to be applied later so that animations don't animate on one object multiple times, since an element in the array can be displaced more than once
-        indices: list[int] = []
-        for i in range(len(chart_info.arr)):
-            indices.append(i)
-        shuffle(indices, shuffle_strength)
+# SESSION MEMORY
+# Every open tab keeps its array, and possibly save points and pending step jobs. When all sessions together go over SESSION_MEMORY_BUDGET,
+# the sessions that have been idle the longest are compacted (InternalState.compact()), and if that isn't enough, their save points are dropped
+SESSION_MEMORY_BUDGET = 256 * 1024 * 1024 # Rough bytes for all sessions in this process
+SESSION_IDLE_SECONDS = 5 * 60 # Sessions without an interaction for this long may be compacted
+live_sessions: "weakref.WeakSet[InternalState]" = weakref.WeakSet() # Gradio drops a session's state when its tab closes, which also removes it from here
+
+def register_session(chart_info: VisualState, session_info: InternalState):
+    session_info.chart = chart_info
+    session_info.touch()
+    live_sessions.add(session_info)
+
+# delete_callback of session_info_state: stops anything the closed tab was running
+def end_session(session_info: InternalState):
+    # Gradio can call this from a worker thread, so the lock (which closes the running sort) is taken on the event loop the sort is stepped on
+    loop = session_info.event_loop
+    if loop is not None and not loop.is_closed():
+        loop.call_soon_threadsafe(lambda: session_info.close_lock(session_info.new_lock()))
+    else:
+        session_info.close_lock(session_info.new_lock())
+    session_info.save_points.clear()
+    live_sessions.discard(session_info)
+
+# Compacts idle sessions, least recently used first, until the sessions fit in SESSION_MEMORY_BUDGET (or nothing idle is left). Returns the bytes freed
+def enforce_memory_budget() -> int: # o(s log s) time for s sessions
+    sessions = list(live_sessions)
+    total = sum(session.memory_usage() for session in sessions)
+    if total <= SESSION_MEMORY_BUDGET:
+        return 0
+    start_total = total
+
+    now = perf_counter()
+    idle = [session for session in sessions if not session.lock_active() and now - session.last_active >= SESSION_IDLE_SECONDS]
+    idle.sort(key=lambda session: session.last_active)
+
+    for free in (InternalState.compact, drop_save_points):
+        for session in idle:
+            if total <= SESSION_MEMORY_BUDGET:
+                return start_total - total
+            before = session.memory_usage()
+            free(session)
+            total -= before - session.memory_usage()
+    return start_total - total
+
+def drop_save_points(session_info: InternalState):
+    session_info.save_points.clear()
+# END OF SESSION MEMORY
+
+# Shuffles the array. Arrays that are drawn one bar per element are shuffled as one permutation, which graph.js animates by moving every bar to its new place at once
+def shuffle_iterative(chart_info: VisualState, shuffle_strength: float=1.0):
+    if len(chart_info.arr) <= MAXIMUM_ELEMENTS_FOR_SHUFFLE_ANIMATION:
+        # Shuffles the indices instead of the elements, so every element moves once, straight to where it ends up
+        sources = list(range(len(chart_info.arr)))
+        shuffle(sources, shuffle_strength)
 
         # Don't need to set chart.swapping = True because the js side doesn't read this property, the swapping attribute is meant for the focused swap
-        chart_info.bulk_swap = []        
-        for final in range(len(indices)):
-            initial = indices[final]
-            new_2_ele: tuple[int,int] = (initial, final)
-            chart_info.bulk_swap.append(new_2_ele)
-
-        chart_info.dt = 1
-        chart_info.convert_bulk_swap_attribute_to_antisymmetric_and_irreflexive() # Holy long identifier
+        chart_info.permutation = permutation_cycles(sources)
+        chart_info.dt = SHUFFLE_ANIMATION_SECONDS
         # Run the animation first
         yield
-        # Update indices based on the antisymmetric and irreflexive data
-        for i in range(len(chart_info.bulk_swap)):
-            data = chart_info.bulk_swap[i]
-            initial = data[0]
-            final = data[1]
-            chart_info.arr[initial], chart_info.arr[final] = chart_info.arr[final], chart_info.arr[initial]
-        chart_info.bulk_swap = None
+        # Not done through chart_info.swap(), because shuffling isn't part of the sort's stats
+        apply_permutation_cycles(chart_info.arr, chart_info.permutation, chart_info.encoder.touch)
+        chart_info.permutation = None
+        chart_info.dt = 0
     else:
         shuffle(chart_info.arr, shuffle_strength)
-        yield
+        chart_info.encoder.request_keyframe()
+    yield
+
 def bubble_sort_iterative(chart_info: VisualState, start: int | None=None, end: int | None=None):
 
     l = len(chart_info.arr)
@@ -248,12 +1418,13 @@ def bubble_sort_iterative(chart_info: VisualState, start: int | None=None, end:
             chart_info.pv = query
             chart_info.s0 = query
             chart_info.s1 = plus1
+            chart_info.stats.comparisons += 1
             if chart_info.arr[query] > chart_info.arr[plus1]:
                 did_swap = True
                 chart_info.swapping = True
                 yield
                 chart_info.pv = plus1
-                chart_info.arr[query], chart_info.arr[plus1] = chart_info.arr[plus1], chart_info.arr[query]
+                chart_info.swap(query, plus1)
                 chart_info.swapping = False
             yield
         yield True
@@ -263,7 +1434,8 @@ def bubble_sort_iterative(chart_info: VisualState, start: int | None=None, end:
     chart_info.partitioning = False
                 
         
-def insertion_sort_iterative(chart_info: VisualState, start: int | None =None, end: int | None=None):
+# 'bound' is the index the sorted region starts at; elements are never moved below it (quick-sort uses this to insertion sort a small range)
+def insertion_sort_iterative(chart_info: VisualState, start: int | None =None, end: int | None=None, bound: int = 0):
 
     chart_info.partitioning = True
 
@@ -273,14 +1445,15 @@ def insertion_sort_iterative(chart_info: VisualState, start: int | None =None, e
 
     free_index = start or 0
 
-    chart_info.i0 = 0
+    chart_info.i0 = bound
 
     for i in range(free_index, min(l - 1, end)):
         chart_info.swapping = True
         chart_info.i1 = i + 1
 
-        for self_i in range(i + 1, 0, -1):
+        for self_i in range(i + 1, bound, -1):
             query_i = self_i - 1
+            chart_info.stats.comparisons += 1
             if chart_info.arr[query_i] <= chart_info.arr[self_i]:
                 chart_info.swapping = False
                 chart_info.s1 = None
@@ -293,7 +1466,7 @@ def insertion_sort_iterative(chart_info: VisualState, start: int | None =None, e
             chart_info.s1 = self_i
             chart_info.pv = self_i
             yield
-            chart_info.arr[query_i], chart_info.arr[self_i] = chart_info.arr[self_i], chart_info.arr[query_i]
+            chart_info.swap(query_i, self_i)
         else:
             chart_info.swapping = False
 
@@ -327,6 +1500,7 @@ def selection_sort_iterative(chart_info: VisualState, start: int | None=None, en
 
         for q in range(i + 1, l):
             chart_info.s1 = q
+            chart_info.stats.comparisons += 1
             if chart_info.arr[q] < low_v:
                 low_v = chart_info.arr[q]
                 low_i = q
@@ -340,15 +1514,445 @@ def selection_sort_iterative(chart_info: VisualState, start: int | None=None, en
             chart_info.s1 = low_i
             chart_info.swapping = True
             yield
-            chart_info.arr[i], chart_info.arr[low_i] = chart_info.arr[low_i], chart_info.arr[i]
+            chart_info.swap(i, low_i)
         chart_info.swapping = False
         yield True
     chart_info.partitioning = False
 # END OF SELECTION SORT
 
+# HEAP SORT
+# Moves the element at 'root' down the max-heap stored in arr[base:base + size] until both of its children are smaller
+def sift_down(chart_info: VisualState, base: int, root: int, size: int):
+    arr = chart_info.arr
+    stats = chart_info.stats
+
+    while True:
+        # Children of node k are 2k + 1 and 2k + 2, relative to base
+        child = 2 * root + 1
+        if child >= size:
+            return
+
+        # Pick the larger child
+        if child + 1 < size:
+            chart_info.s0 = base + child
+            chart_info.s1 = base + child + 1
+            chart_info.swapping = False
+            stats.comparisons += 1
+            yield
+            if arr[base + child + 1] > arr[base + child]:
+                child += 1
+
+        chart_info.pv = base + root
+        chart_info.s0 = base + root
+        chart_info.s1 = base + child
+        stats.comparisons += 1
+        if arr[base + root] >= arr[base + child]:
+            chart_info.swapping = False
+            yield
+            return
+
+        chart_info.swapping = True
+        yield
+        chart_info.swap(base + root, base + child)
+        chart_info.swapping = False
+        root = child
+
+# Sorts arr[start..end] (inclusive). Quick-sort falls back to this when a range is nested too deep
+def heap_sort_iterative(chart_info: VisualState, start: int | None = None, end: int | None = None):
+    start = start or 0
+    end = len(chart_info.arr) - 1 if end is None else end
+    size = end - start + 1
+
+    chart_info.partitioning = True
+    chart_info.i0 = start
+    chart_info.i1 = end
+
+    # Build the heap bottom-up
+    for root in range(size // 2 - 1, -1, -1):
+        yield from sift_down(chart_info, start, root, size)
+
+    for heap_size in range(size - 1, 0, -1):
+        # Move the largest element of the heap to the end of the heap, where it belongs
+        chart_info.pv = start
+        chart_info.s0 = start
+        chart_info.s1 = start + heap_size
+        chart_info.swapping = True
+        yield
+        chart_info.swap(start, start + heap_size)
+        chart_info.swapping = False
+        chart_info.i1 = start + heap_size - 1
+        yield True
+
+        yield from sift_down(chart_info, start, 0, heap_size)
+
+    chart_info.partitioning = False
+
+# Heap sort of the whole array, for the algorithm list. Unlike heap_sort_iterative(), it can stop after any number of iterations and carry on with the next Step:
+# an iteration is one sift-down while the heap is built, then one extraction of the largest element. The pending job is (next root to sift down, or -1 once the heap is built, heap size)
+def stepped_heap_sort_iterative(chart_info: VisualState, session_info: InternalState, step_sort: bool = False, iterations_allowed: int = 1):
+    size = len(chart_info.arr)
+    if size <= 1:
+        session_info.step_sort_jobs = None
+        return
+
+    # A complete sort starts over, because the pending job only holds if the array is still the heap the last Step left
+    jobs = session_info.step_sort_jobs if step_sort and session_info.step_sort_jobs else JobStack((size // 2 - 1, size))
+    session_info.step_sort_jobs = jobs if step_sort else None
+
+    chart_info.partitioning = True
+    chart_info.i0 = 0
+
+    iterations_finished = 0
+    while jobs and (not step_sort or iterations_finished < iterations_allowed):
+        root, heap_size, _ = jobs.pop()
+        chart_info.i1 = heap_size - 1
+        iterations_finished += 1
+
+        if root >= 0:
+            # Build the heap bottom-up
+            yield from sift_down(chart_info, 0, root, heap_size)
+            yield True
+            jobs.push(root - 1, heap_size)
+            continue
+
+        # Move the largest element of the heap to the end of the heap, where it belongs
+        last = heap_size - 1
+        chart_info.pv = 0
+        chart_info.s0 = 0
+        chart_info.s1 = last
+        chart_info.swapping = True
+        yield
+        chart_info.swap(0, last)
+        chart_info.swapping = False
+        chart_info.i1 = last - 1
+        yield from sift_down(chart_info, 0, 0, last)
+        yield True
+        if last > 1:
+            jobs.push(-1, last)
+    chart_info.partitioning = False
+# END OF HEAP SORT
+
+# MERGE SORT
+# Merges the sorted runs arr[start:middle] and arr[middle:end]. The left run is copied to a buffer, then the buffer and the right run are merged back into arr[start:end] with writes.
+# The buffer is drawn as a strip under the chart (see VisualState.set_buffer()). Every write highlights the element's source as pv (the right run's next element, or where the buffer's next element was before the merge) and its destination as s0
+def merge(chart_info: VisualState, start: int, middle: int, end: int):
+    arr = chart_info.arr
+    stats = chart_info.stats
+
+    chart_info.i0 = start
+    chart_info.i1 = end - 1
+
+    # Runs that are already in order are left as they are, which makes merge sort o(n) time on sorted arrays
+    chart_info.pv = middle
+    chart_info.s0 = middle - 1
+    chart_info.s1 = middle
+    chart_info.swapping = False
+    stats.comparisons += 1
+    yield
+    if arr[middle - 1] <= arr[middle]:
+        return
+
+    buffer = arr[start:middle].copy() # Slices of numpy arrays are views
+    buffer_length = middle - start
+    i = 0 # Next element of the buffer
+    j = middle # Next element of the right run
+    k = start # Next index written to
+    chart_info.set_buffer(start, middle)
+    chart_info.s1 = None
+    chart_info.swapping = True
+    try:
+        while i < buffer_length and j < end:
+            chart_info.s0 = k
+            chart_info.b0 = i
+            stats.comparisons += 1
+            # Ties are taken from the buffer, which keeps the sort stable
+            if arr[j] < buffer[i]:
+                chart_info.pv = j
+                yield
+                chart_info.write(k, arr[j])
+                j += 1
+            else:
+                chart_info.pv = start + i
+                yield
+                chart_info.write(k, buffer[i])
+                i += 1
+            k += 1
+
+        # The rest of the right run is already in place
+        while i < buffer_length:
+            chart_info.s0 = k
+            chart_info.b0 = i
+            chart_info.pv = start + i
+            yield
+            chart_info.write(k, buffer[i])
+            i += 1
+            k += 1
+    finally:
+        # If the sort was stopped during the merge, the rest of the buffer fills the gap in front of the right run, so no element is lost
+        if chart_info.arr is arr:
+            for i in range(i, buffer_length):
+                chart_info.write(k, buffer[i])
+                k += 1
+        chart_info.clear_buffer()
+        chart_info.swapping = False
+
+# Bottom-up merge sort: merges neighbouring runs of 1 element, then of 2, 4, ... until one run is left. o(n log n) time, with an o(n) buffer.
+# One merge is one iteration. The pending job is (start of the next merge, run width)
+def merge_sort_iterative(chart_info: VisualState, session_info: InternalState, step_sort: bool = False, iterations_allowed: int = 1):
+    length = len(chart_info.arr)
+    if length <= 1:
+        session_info.step_sort_jobs = None
+        return
+
+    jobs = session_info.step_sort_jobs if step_sort and session_info.step_sort_jobs else JobStack((0, 1))
+    session_info.step_sort_jobs = jobs if step_sort else None
+
+    chart_info.partitioning = True
+
+    iterations_finished = 0
+    while jobs and (not step_sort or iterations_finished < iterations_allowed):
+        start, width, _ = jobs.pop()
+        middle = min(start + width, length)
+        end = min(start + 2 * width, length)
+        iterations_finished += 1
+
+        if middle < end:
+            yield from merge(chart_info, start, middle, end)
+        yield True
+
+        # A last run without a neighbour is merged at a later width
+        if end + width < length:
+            jobs.push(end, width)
+        elif 2 * width < length:
+            jobs.push(0, 2 * width)
+    chart_info.partitioning = False
+# END OF MERGE SORT
+
+# SHELL SORT
+SHELL_GAP_SEQUENCES = ["Ciura", "Knuth", "Shell"]
+CIURA_GAPS = [1, 4, 10, 23, 57, 132, 301, 701, 1750] # Found experimentally by Marcin Ciura; longer arrays extend it by a factor of 2.25
+
+# The gaps shell sort uses for an array of the given length, largest first. The last gap is always 1, which is a plain insertion sort
+def shell_gaps(sequence: str, length: int) -> list[int]: # o(log n) time
+    if sequence == "Shell":
+        # n/2, n/4, ..., 1
+        gaps = []
+        gap = length // 2
+        while gap > 0:
+            gaps.append(gap)
+            gap //= 2
+        return gaps or [1]
+
+    if sequence == "Knuth":
+        # 1, 4, 13, 40, ... up to a third of the array
+        gaps = [1]
+        while 3 * gaps[-1] + 1 <= length // 3:
+            gaps.append(3 * gaps[-1] + 1)
+    else:
+        gaps = [gap for gap in CIURA_GAPS if gap < length] or [1]
+        while floor(gaps[-1] * 2.25) < length and gaps[-1] >= CIURA_GAPS[-1]:
+            gaps.append(floor(gaps[-1] * 2.25))
+    gaps.reverse()
+    return gaps
+
+# Insertion sort of every gap-th element, with gaps that shrink to 1 (see shell_gaps()). Elements move far in the early passes, so the last pass has little left to do.
+# Inserting one element is one iteration, like insertion sort. The pending job is (index of the next element to insert, gap)
+def shell_sort_iterative(chart_info: VisualState, session_info: InternalState, step_sort: bool = False, iterations_allowed: int = 1):
+    arr = chart_info.arr
+    length = len(arr)
+    if length <= 1:
+        session_info.step_sort_jobs = None
+        return
+
+    gaps = shell_gaps(session_info.gap_sequence, length)
+    jobs = session_info.step_sort_jobs if step_sort and session_info.step_sort_jobs else JobStack((gaps[0], gaps[0]))
+    session_info.step_sort_jobs = jobs if step_sort else None
+
+    chart_info.partitioning = True
+    chart_info.i0 = 0
+    stats = chart_info.stats
+
+    iterations_finished = 0
+    while jobs and (not step_sort or iterations_finished < iterations_allowed):
+        i, gap, _ = jobs.pop()
+        chart_info.i1 = i
+        iterations_finished += 1
+
+        # Move arr[i] back by gap until the element gap before it is smaller
+        self_i = i
+        while self_i >= gap:
+            query_i = self_i - gap
+            chart_info.pv = self_i
+            chart_info.s0 = query_i
+            chart_info.s1 = self_i
+            stats.comparisons += 1
+            if arr[query_i] <= arr[self_i]:
+                chart_info.swapping = False
+                yield
+                break
+            chart_info.swapping = True
+            yield
+            chart_info.swap(query_i, self_i)
+            chart_info.swapping = False
+            self_i = query_i
+        yield True
+
+        if i + 1 < length:
+            jobs.push(i + 1, gap)
+        else:
+            # The gap setting can change between Steps, so the next gap is the largest one that's smaller than this one
+            smaller_gaps = [g for g in gaps if g < gap]
+            if smaller_gaps:
+                jobs.push(smaller_gaps[0], smaller_gaps[0])
+    chart_info.partitioning = False
+# END OF SHELL SORT
+
+# RADIX SORT
+RADIX = 10 # Base of the digits radix sort sorts by, one digit per pass. Decimal digits are easy to follow, and the default elements (10 to 1000) take 3 passes
+
+# Stably sorts the array by one digit of (element - low): counts the elements with each digit, copies the array to a buffer, then writes every element
+# from the buffer to the next free index of its digit. Like in a merge, the buffer is drawn as a strip under the chart: pv is where the element was, s0 is where it's written
+def counting_pass(chart_info: VisualState, low: int, place: int, radix: int):
+    arr = chart_info.arr
+    length = len(arr)
+
+    chart_info.swapping = False
+    chart_info.s1 = None
+    counts = [0] * radix
+    for i in range(length):
+        chart_info.pv = i
+        chart_info.s0 = i
+        counts[(arr[i] - low) // place % radix] += 1
+        yield
+
+    # next_index[d] is where the next element with digit d is written
+    next_index = [0] * radix
+    total = 0
+    for digit in range(radix):
+        next_index[digit] = total
+        total += counts[digit]
+
+    buffer = arr.copy()
+    i = 0 # Next element of the buffer
+    chart_info.set_buffer(0, length)
+    chart_info.swapping = True
+    try:
+        while i < length:
+            value = buffer[i]
+            digit = (value - low) // place % radix
+            destination = next_index[digit]
+            chart_info.pv = i
+            chart_info.b0 = i
+            chart_info.s0 = destination
+            yield
+            chart_info.write(destination, value)
+            next_index[digit] += 1
+            i += 1
+    finally:
+        # If the sort was stopped during the pass, the rest of the buffer is written without frames, so no element is lost
+        if chart_info.arr is arr:
+            for i in range(i, length):
+                value = buffer[i]
+                digit = (value - low) // place % radix
+                chart_info.write(next_index[digit], value)
+                next_index[digit] += 1
+        chart_info.clear_buffer()
+        chart_info.swapping = False
+
+# LSD radix sort: sorts by the least significant digit first, then by every more significant digit, each with a stable counting_pass(). o(n * passes) time without any comparisons.
+# Digits are taken from element - (smallest element), so negative elements work and no pass is spent on digits every element shares.
+# radix=None sorts by the whole value in one pass, which is counting sort (o(n + range) time and memory). One pass is one iteration. The pending job is (place value of the next pass's digit, -1)
+def radix_sort_iterative(chart_info: VisualState, session_info: InternalState, step_sort: bool = False, iterations_allowed: int = 1, radix: int | None = RADIX):
+    arr = chart_info.arr
+    if len(arr) <= 1:
+        session_info.step_sort_jobs = None
+        return
+
+    jobs = session_info.step_sort_jobs if step_sort and session_info.step_sort_jobs else JobStack((1, -1))
+    session_info.step_sort_jobs = jobs if step_sort else None
+
+    low = int(min(arr))
+    key_range = int(max(arr)) - low + 1
+    radix = radix or key_range
+
+    chart_info.partitioning = True
+    chart_info.i0 = 0
+    chart_info.i1 = len(arr) - 1
+
+    iterations_finished = 0
+    while jobs and (not step_sort or iterations_finished < iterations_allowed):
+        place = jobs.pop()[0]
+        iterations_finished += 1
+        yield from counting_pass(chart_info, low, place, radix)
+        yield True
+        # Every key is smaller than key_range, so digits from there on are all 0
+        if place * radix < key_range:
+            jobs.push(place * radix, -1)
+    chart_info.partitioning = False
+# END OF RADIX SORT
+
 # QUICK SORT
-def partition(chart_info: VisualState, start: int, end: int, alpha: float=1):
-    get_pivot_index = floor(lerp(start, end, alpha))
+PIVOT_STRATEGIES = ["Custom Point", "Median-of-Three", "Ninther"]
+NINTHER_MIN_LENGTH = 40 # Ranges shorter than this use median-of-three instead of the ninther
+
+# Returns the index of the median of arr[a], arr[b] and arr[c], highlighting each comparison
+def median_of_three(chart_info: VisualState, a: int, b: int, c: int):
+    arr = chart_info.arr
+    stats = chart_info.stats
+    chart_info.swapping = False
+
+    chart_info.s0 = a
+    chart_info.s1 = b
+    stats.comparisons += 1
+    yield
+    if arr[a] > arr[b]:
+        a, b = b, a
+    # arr[a] <= arr[b] from here on
+
+    chart_info.s0 = b
+    chart_info.s1 = c
+    stats.comparisons += 1
+    yield
+    if arr[b] <= arr[c]:
+        return b
+
+    chart_info.s0 = a
+    chart_info.s1 = c
+    stats.comparisons += 1
+    yield
+    return c if arr[a] <= arr[c] else a
+
+# Random pivot index for arr[start..end], picked with a hash of the seed and the range instead of the random module.
+# The same range always gets the same pivot, no matter how many Steps the sort was split into or which process runs it
+def random_pivot(seed: int, start: int, end: int) -> int: # o(1) time
+    if end <= start:
+        return start
+    return start + hash((seed, start, end)) % (end - start)
+
+# Chooses the pivot index for arr[start..end] with the session's pivot strategy
+def choose_pivot(chart_info: VisualState, session_info: InternalState, start: int, end: int):
+    if session_info.use_random_pv:
+        return random_pivot(session_info.pv_seed, start, end)
+
+    strategy = session_info.pv_strategy
+    if strategy == "Ninther" and end - start + 1 >= NINTHER_MIN_LENGTH:
+        # Median of the medians of three evenly spaced groups of three
+        step = (end - start + 1) // 8
+        middle = (start + end) // 2
+        low = yield from median_of_three(chart_info, start, start + step, start + 2 * step)
+        mid = yield from median_of_three(chart_info, middle - step, middle, middle + step)
+        high = yield from median_of_three(chart_info, end - 2 * step, end - step, end)
+        return (yield from median_of_three(chart_info, low, mid, high))
+    if strategy == "Median-of-Three" or strategy == "Ninther":
+        return (yield from median_of_three(chart_info, start, (start + end) // 2, end))
+
+    return floor(lerp(start, end, session_info.pv_alpha))
+
+def partition(chart_info: VisualState, start: int, end: int, alpha: float=1, pivot_index: int | None = None):
+    # The pivot is chosen by the caller when pivot_index is given, otherwise with the alpha point
+    get_pivot_index = floor(lerp(start, end, alpha)) if pivot_index is None else pivot_index
+    stats = chart_info.stats
+    stats.partitions += 1
     
     
     arr = chart_info.arr
@@ -363,7 +1967,7 @@ def partition(chart_info: VisualState, start: int, end: int, alpha: float=1):
     
     yield
     
-    arr[get_pivot_index], arr[end] = arr[end], arr[get_pivot_index]
+    chart_info.swap(get_pivot_index, end)
     chart_info.swapping = False
     # Update graphics (result)
     chart_info.pv = end
@@ -377,13 +1981,14 @@ def partition(chart_info: VisualState, start: int, end: int, alpha: float=1):
     for i in range(start, end):
         
         # check if this element is smaller than the pivot. If it is, then an index is taken up (so free_index should be incremented).
+        stats.comparisons += 1
         do_swap = arr[i] <= pivot_value
         swap_is_redunant = i == free_index
 
         # Update graphics (intent) before swapping
         chart_info.s0 = i
         chart_info.s1 = free_index
-        chart_info.swapping = do_swap and not swap_is_redunant
+        chart_info.swapping = bool(do_swap) and not swap_is_redunant # bool() because comparing numpy elements gives a numpy bool, which json can't serialize
         yield
         
         if do_swap:
@@ -391,7 +1996,7 @@ def partition(chart_info: VisualState, start: int, end: int, alpha: float=1):
             # Skip update and variable assignment if the location and destination are the same
             if not swap_is_redunant:
                 # Move the small element to the free index, then fill the gap with the other arbitrary element
-                arr[free_index], arr[i] = arr[i], arr[free_index]
+                chart_info.swap(free_index, i)
 
                 # Update graphics (result) after the swap
                 chart_info.swapping = False
@@ -409,7 +2014,7 @@ def partition(chart_info: VisualState, start: int, end: int, alpha: float=1):
 
 
     # Move the pivot element to the free index that was found, swapping with the current element in the free index
-    arr[pivot_index], arr[free_index] = arr[free_index], pivot_value
+    chart_info.swap(pivot_index, free_index)
     
     # Update graphics (result) after the swap
     chart_info.swapping = False
@@ -418,58 +2023,127 @@ def partition(chart_info: VisualState, start: int, end: int, alpha: float=1):
     # Return the free index, which has the position of the semi-sorted element, the pivot
     return free_index
 
+# Dutch national flag partition: splits arr[start..end] into elements smaller than, equal to and greater than the pivot.
+# Returns the first and last index of the equal section, which is already in place, so many duplicates don't cause extra partitions
+def three_way_partition(chart_info: VisualState, start: int, end: int, pivot_index: int):
+    arr = chart_info.arr
+    stats = chart_info.stats
+    stats.partitions += 1
+
+    # Move the pivot to the start of the range
+    chart_info.pv = pivot_index
+    chart_info.s0 = pivot_index
+    chart_info.s1 = start
+    chart_info.swapping = True
+    yield
+    chart_info.swap(pivot_index, start)
+    chart_info.swapping = False
+    chart_info.pv = start
+    yield
+
+    pivot_value = arr[start]
+    # arr[start:lt] < pivot, arr[lt:i] == pivot, arr[gt + 1:end + 1] > pivot, arr[i:gt + 1] is unchecked
+    lt = start
+    i = start + 1
+    gt = end
+
+    while i <= gt:
+        # arr[lt] always holds a copy of the pivot value
+        chart_info.pv = lt
+        value = arr[i]
+
+        stats.comparisons += 1
+        if value < pivot_value:
+            chart_info.s0 = i
+            chart_info.s1 = lt
+            chart_info.swapping = True
+            yield
+            chart_info.swap(lt, i)
+            chart_info.swapping = False
+            lt += 1
+            i += 1
+            chart_info.pv = lt
+            yield
+            continue
+
+        stats.comparisons += 1
+        if value > pivot_value:
+            chart_info.s0 = i
+            chart_info.s1 = gt
+            chart_info.swapping = True
+            yield
+            chart_info.swap(i, gt)
+            chart_info.swapping = False
+            gt -= 1
+            yield
+        else:
+            chart_info.s0 = i
+            chart_info.s1 = lt
+            chart_info.swapping = False
+            yield
+            i += 1
+
+    return lt, gt
+
 def quick_sort_iterative(chart_info: VisualState, session_info: InternalState, step_sort: bool=False, iterations_allowed: int = 1):
 
     arr = chart_info.arr
 
     # Avoid edge-case for len(arr) - 1
     if len(arr) <= 1:
-        session_info.step_sort_jobs = []
+        session_info.step_sort_jobs = JobStack()
         return
     # If jobs doesn't exist or jobs is empty, create default 'jobs' value which considers the entire array
 
-    jobs = session_info.step_sort_jobs and session_info.step_sort_jobs or [Job(0, len(arr) - 1)]
+    jobs = session_info.step_sort_jobs and session_info.step_sort_jobs or JobStack((0, len(arr) - 1))
     if step_sort:
         session_info.step_sort_jobs = jobs
     # Resync, in case jobs created a new array
 
+    # Introsort's depth limit: ranges nested deeper than this are heap sorted, so bad pivots can't make the sort o(n^2)
+    depth_limit = 2 * floor(log(len(arr), 2))
+
     # Used to support the limited iteration count feature
     iterations_finished = 0
     # Keep iterating while there are jobs and the number of maximum iterations on this function call has not been reached
     while jobs and (not step_sort or iterations_finished < iterations_allowed):
         
-        current_job = jobs.pop()
-        # Small shortcut by removing indexing on the current_job object
-        i0 = current_job.i0
-        i1 = current_job.i1
+        i0, i1, depth = jobs.pop()
         chart_info.i0 = i0
         chart_info.i1 = i1
         chart_info.partitioning = True
+        iterations_finished += 1
 
+        # Small ranges are insertion sorted in place; the elements left of the range are all smaller, so it is sorted on its own
+        if i1 - i0 + 1 <= session_info.insertion_cutoff:
+            yield from insertion_sort_iterative(chart_info, start=i0, end=i1, bound=i0)
+            yield True
+            continue
 
-        partitioner = partition(chart_info, i0, i1, session_info.use_random_pv and rand.random() or session_info.pv_alpha)
-
-        # Conventional structure for python generators (I think?)
-        try:
-            while True:
-                next(partitioner)
-                yield
-        except StopIteration as result:
-            # Get the pivot point's index
-            pivot_index = result.value
-            yield True # Indicate that a job has finished
-
+        if session_info.use_depth_limit and depth >= depth_limit:
+            yield from heap_sort_iterative(chart_info, i0, i1)
+            chart_info.partitioning = True
+            yield True
+            continue
 
-            
-        # Only add the job if the start is smaller than the end
-        if i0 < pivot_index - 1:
-            # Left side of the pivot
-            jobs.append(Job(i0, pivot_index - 1))
-        if pivot_index + 1 < i1:
-            # Right side of the pivot
-            jobs.append(Job(pivot_index + 1, i1))
+        pivot_index = yield from choose_pivot(chart_info, session_info, i0, i1)
 
-        iterations_finished += 1
+        if session_info.three_way_partition:
+            equal_start, equal_end = yield from three_way_partition(chart_info, i0, i1, pivot_index)
+        else:
+            equal_start = equal_end = yield from partition(chart_info, i0, i1, pivot_index=pivot_index)
+        yield True # Indicate that a job has finished
+
+        # The smaller side is pushed last so it is sorted first. Every job left waiting is then at least twice as large as the one above it, so at most o(log n) jobs are ever pending
+        left_size = equal_start - i0
+        right_size = i1 - equal_end
+        sides = [(i0, equal_start - 1), (equal_end + 1, i1)]
+        if left_size < right_size:
+            sides.reverse()
+        for start, end in sides:
+            # Only add the job if the start is smaller than the end
+            if start < end:
+                jobs.push(start, end, depth + 1)
     chart_info.partitioning = False
 
 # SORT GENERATORS (To assist in interfacing with Gradio components)
@@ -479,8 +2153,7 @@ def quick_sort_iterative(chart_info: VisualState, session_info: InternalState, s
 def step_bubblesort_gen(chart_info: VisualState, session_info: InternalState, steps: int):
 
     if session_info.step_sort_jobs:
-        current_job = session_info.step_sort_jobs.pop()
-        i0 = current_job.i0
+        i0 = session_info.step_sort_jobs.pop()[0]
     else:
         i0 = 0
 
@@ -493,7 +2166,7 @@ def step_bubblesort_gen(chart_info: VisualState, session_info: InternalState, st
     except StopIteration:
         next_index = i0 + steps
         if len(chart_info.arr) > next_index:
-            session_info.step_sort_jobs = [Job(next_index, -1)]
+            session_info.step_sort_jobs = JobStack((next_index, -1))
         pass
 
 def full_bubblesort_gen(chart_info: VisualState, session_info: InternalState):
@@ -513,8 +2186,7 @@ def full_bubblesort_gen(chart_info: VisualState, session_info: InternalState):
 def step_insertionsort_gen(chart_info: VisualState, session_info: InternalState, steps: int):
 
     if session_info.step_sort_jobs:
-        current_job = session_info.step_sort_jobs.pop()
-        i0 = current_job.i0
+        i0 = session_info.step_sort_jobs.pop()[0]
     else:
         i0 = 0
 
@@ -527,7 +2199,7 @@ def step_insertionsort_gen(chart_info: VisualState, session_info: InternalState,
     except StopIteration:
         next_index = i0 + steps
         if len(chart_info.arr) > next_index:
-            session_info.step_sort_jobs = [Job(next_index, -1)]
+            session_info.step_sort_jobs = JobStack((next_index, -1))
         pass
 
 def full_insertionsort_gen(chart_info: VisualState, session_info: InternalState):
@@ -560,7 +2232,8 @@ def step_quicksort_gen(
 
 def full_quicksort_gen(chart_info: VisualState, session_info: InternalState):
 
-    # If pivot_alpha isn't 1, the sort function will unsort the array. This if statement will prevent that from happening
+    # If pivot_alpha isn't 1, the sort function will unsort the array. This if statement will prevent that from happening.
+    # sort_button_on_click tells the user; this generator runs in the scheduler's task (or a worker process), where gr.Info doesn't reach the session
     if not is_sorted(chart_info.arr):
 
         generator = quick_sort_iterative(chart_info, session_info)
@@ -570,17 +2243,12 @@ def full_quicksort_gen(chart_info: VisualState, session_info: InternalState):
                 yield next(generator)
         except StopIteration:
             pass
-        
-    else:
-        gr.Info("The array is fully sorted.")
-        pass
 
 def step_selectionsort_gen(chart_info: VisualState, session_info: InternalState, steps: int):
     
-    # To follow the structure that session_info was built around, we use step_sort_jobs: list[Job] to store data for stepsort. We use a singular job in the list, and use that job's i0 as the point where the stepsort left off.
+    # To follow the structure that session_info was built around, we use step_sort_jobs: JobStack to store data for stepsort. We use a singular job in the stack, and use that job's start as the point where the stepsort left off.
     if session_info.step_sort_jobs:
-        current_job = session_info.step_sort_jobs.pop()
-        i0 = current_job.i0
+        i0 = session_info.step_sort_jobs.pop()[0]
     else:
         i0 = 0
 
@@ -593,7 +2261,7 @@ def step_selectionsort_gen(chart_info: VisualState, session_info: InternalState,
         
         next_index = i0 + steps
         if len(chart_info.arr) > next_index:
-            session_info.step_sort_jobs = [Job(next_index, -1)]
+            session_info.step_sort_jobs = JobStack((next_index, -1))
         pass
 
 def full_selectionsort_gen(chart_info: VisualState, session_info: InternalState):
@@ -607,11 +2275,51 @@ def full_selectionsort_gen(chart_info: VisualState, session_info: InternalState)
         pass
 
 
+# The algorithms below keep their progress in step_sort_jobs themselves, like quick-sort. A complete sort starts them over
+def step_mergesort_gen(chart_info: VisualState, session_info: InternalState, steps: int):
+    yield from merge_sort_iterative(chart_info, session_info, step_sort=True, iterations_allowed=steps)
+
+def full_mergesort_gen(chart_info: VisualState, session_info: InternalState):
+    yield from merge_sort_iterative(chart_info, session_info)
+
+def step_heapsort_gen(chart_info: VisualState, session_info: InternalState, steps: int):
+    yield from stepped_heap_sort_iterative(chart_info, session_info, step_sort=True, iterations_allowed=steps)
+
+def full_heapsort_gen(chart_info: VisualState, session_info: InternalState):
+    yield from stepped_heap_sort_iterative(chart_info, session_info)
+
+def step_shellsort_gen(chart_info: VisualState, session_info: InternalState, steps: int):
+    yield from shell_sort_iterative(chart_info, session_info, step_sort=True, iterations_allowed=steps)
+
+def full_shellsort_gen(chart_info: VisualState, session_info: InternalState):
+    yield from shell_sort_iterative(chart_info, session_info)
+
+def step_radixsort_gen(chart_info: VisualState, session_info: InternalState, steps: int):
+    yield from radix_sort_iterative(chart_info, session_info, step_sort=True, iterations_allowed=steps)
+
+def full_radixsort_gen(chart_info: VisualState, session_info: InternalState):
+    yield from radix_sort_iterative(chart_info, session_info)
+
+def step_countingsort_gen(chart_info: VisualState, session_info: InternalState, steps: int):
+    yield from radix_sort_iterative(chart_info, session_info, step_sort=True, iterations_allowed=steps, radix=None)
+
+def full_countingsort_gen(chart_info: VisualState, session_info: InternalState):
+    yield from radix_sort_iterative(chart_info, session_info, radix=None)
+
+
+# Sorts that move elements through a buffer (with VisualState.write()) instead of swapping them. The array can't be shuffled while they run
+BUFFERED_SORTS = ("Merge-Sort", "Radix-Sort", "Counting-Sort")
+
 # Dictionary of algorithms; <str> indexes <tuple> where: index 0: stepsort: stepsort generator, index 1: fullsort generator
 
 sort_algorithms: dict[str, list[Any]] = {
     # <str>: [<step sort generator>, <full sort generator>],
     "Quick-Sort": [step_quicksort_gen, full_quicksort_gen],
+    "Merge-Sort": [step_mergesort_gen, full_mergesort_gen],
+    "Heap-Sort": [step_heapsort_gen, full_heapsort_gen],
+    "Shell-Sort": [step_shellsort_gen, full_shellsort_gen],
+    "Radix-Sort": [step_radixsort_gen, full_radixsort_gen],
+    "Counting-Sort": [step_countingsort_gen, full_countingsort_gen],
     "Selection-Sort": [step_selectionsort_gen, full_selectionsort_gen],
     "Bubble-Sort": [step_bubblesort_gen, full_bubblesort_gen],
     "Insertion-Sort": [step_insertionsort_gen, full_insertionsort_gen],
@@ -619,11 +2327,657 @@ sort_algorithms: dict[str, list[Any]] = {
 
 # END OF SORT GENERATORS
 
+# SORT DRIVERS (Shared by the Step and Complete Sort event handlers)
+
+# Decides whether the state a sort generator just yielded gets its own frame. Returns the frame's duration in seconds, or None to skip it
+def get_frame_interval(chart_info: VisualState, session_info: InternalState, job_finished: bool | None) -> float | None:
+    if session_info.show_queries:
+        if chart_info.swapping and chart_info.animate_swaps:
+            return session_info.wait_interval * chart_info.get_wait_multiplier_for_current_state()
+        elif chart_info.swapping or session_info.show_comparisons:
+            return session_info.wait_interval
+    elif job_finished:
+        return session_info.wait_interval
+    return None
+
+# SORT SCHEDULER
+# Every streamed sort is stepped by one scheduler task instead of by its own handler. The scheduler advances the sorts in rounds: every sort that is due
+# gets an equal share of SCHEDULER_TICK_BUDGET seconds and SCHEDULER_TICK_STEPS steps, so with many sessions every sort slows down evenly,
+# instead of the sort with the slowest steps holding up the rest. Frames go to the session's frame stream, or to the handler through SortRun.outbox.
+# Other work that steps sorts on the event loop (race lanes, traces and timeline recordings) gets its share of the rounds through run_in_scheduler()
+SCHEDULER_TICK_BUDGET = FRAME_BUDGET / 2 # Seconds of stepping per round, shared by every sort that is due. The rest of the display frame is left for serving
+SCHEDULER_TICK_STEPS = 1 << 16 # Steps per round, shared by every sort that is due
+
+# A streamed sort, stepped by the scheduler.
+# Steps are merged into one frame until they add up to FRAME_BUDGET, so short intervals don't send more frames than the browser can draw.
+# The array changes of merged steps are all in the frame's delta, and the highlights are the last step's
+class SortRun:
+    __slots__ = ("generator", "chart", "session", "lock", "outbox", "pending_interval", "tick_start", "resume_at", "error")
+
+    def __init__(self, generator: Generator, chart_info: VisualState, session_info: InternalState, lock: int):
+        self.generator = generator
+        self.chart = chart_info
+        self.session = session_info
+        self.lock = lock
+        self.outbox: asyncio.Queue = asyncio.Queue() # Frames for the handler to yield (the ones that didn't go through the frame stream), then None once the sort has ended
+        self.pending_interval = 0.0 # Total interval of the steps merged into the next frame
+        self.tick_start = perf_counter()
+        self.resume_at = 0.0 # When the wait after the last frame is over
+        self.error: BaseException | None = None # Raised by the handler if the generator failed
+
+    # Whether the scheduler should step this sort now. A frame the handler hasn't taken yet holds the sort back, like the handler's own yield used to
+    def is_due(self, now: float) -> bool:
+        return self.resume_at <= now and self.outbox.empty()
+
+    # Steps the sort until a frame is sent, the deadline passes or max_steps steps were taken. Returns False once the sort has ended
+    def step(self, deadline: float, max_steps: int) -> bool:
+        chart_info = self.chart
+        session_info = self.session
+        stats = chart_info.stats
+        for _ in range(max_steps):
+            step_start = perf_counter()
+            try:
+                job_finished = next(self.generator)
+            except StopIteration:
+                return False
+            step_end = perf_counter()
+            stats.step_time += step_end - step_start
+            stats.yields += 1
+            if job_finished:
+                stats.jobs += 1
+
+            applied_wait_interval = get_frame_interval(chart_info, session_info, job_finished)
+            if applied_wait_interval is None:
+                if step_end >= deadline:
+                    return True
+                continue
+
+            self.pending_interval += applied_wait_interval
+            if self.pending_interval < FRAME_BUDGET and step_end - self.tick_start < FRAME_BUDGET:
+                if step_end >= deadline:
+                    return True
+                continue
+
+            serialize_start = perf_counter()
+            if session_info.show_queries:
+                chart_info.dt = self.pending_interval
+                frame = chart_info.next_frame()
+            else:
+                chart_info.partitioning = True
+                frame = chart_info.next_frame()
+                chart_info.partitioning = False
+            now = perf_counter()
+            stats.serialize_time += now - serialize_start
+            # Frames sent through the frame stream don't go through gradio at all
+            if frame is not None:
+                self.outbox.put_nowait(frame)
+
+            # Time spent running the steps counts towards the interval
+            sleep_time = max(self.pending_interval - (now - self.tick_start), 0)
+            stats.sleep_time += sleep_time
+            self.resume_at = now + sleep_time
+            self.tick_start = self.resume_at
+            self.pending_interval = 0.0
+            return True
+        return True
+
+    # Tells the handler the sort has ended
+    def end(self):
+        self.outbox.put_nowait(None)
+
+# One call of work(deadline, max_steps), made by the scheduler in its next round. See run_in_scheduler()
+class SliceRun:
+    __slots__ = ("work", "session", "lock", "result", "error")
+
+    def __init__(self, work: Callable[[float, int], Any], session_info: InternalState, lock: int):
+        self.work = work
+        self.session = session_info
+        self.lock = lock
+        self.result: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.error: BaseException | None = None
+
+    def is_due(self, now: float) -> bool:
+        return True
+
+    # Returns False, because a slice is only run once
+    def step(self, deadline: float, max_steps: int) -> bool:
+        self.result.set_result(self.work(deadline, max_steps))
+        return False
+
+    # Lets the caller continue. If work() wasn't called (the lock was taken first), the result is None
+    def end(self):
+        if self.result.done():
+            return
+        if self.error is not None:
+            self.result.set_exception(self.error)
+        else:
+            self.result.set_result(None)
+
+class SortScheduler:
+    def __init__(self):
+        self.runs: list[SortRun] = []
+        self.task: asyncio.Task | None = None
+        self.wakeup: asyncio.Event | None = None # Set when a sort is added or a handler takes a frame
+
+    def add(self, run: SortRun):
+        self.runs.append(run)
+        if self.task is None or self.task.done():
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.get_running_loop().create_task(self.loop())
+        self.wake()
+
+    def wake(self):
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    # Stops stepping a sort, and tells its handler it has ended
+    def finish(self, run: SortRun | SliceRun):
+        if run in self.runs:
+            self.runs.remove(run)
+            run.end()
+
+    async def loop(self):
+        while self.runs:
+            now = perf_counter()
+            due = [run for run in self.runs if run.is_due(now)]
+            if not due:
+                # Sleep until the next wait is over, or until a handler takes a frame or a sort is added. Slices are always due, so these are all SortRuns
+                waiting = [run.resume_at for run in self.runs if run.outbox.empty()]
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), min(waiting) - now if waiting else None)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            slice_seconds = SCHEDULER_TICK_BUDGET / len(due)
+            slice_steps = max(1, SCHEDULER_TICK_STEPS // len(due))
+            for run in due:
+                if not run.session.is_lock_owner(run.lock):
+                    self.finish(run)
+                    continue
+                try:
+                    running = run.step(perf_counter() + slice_seconds, slice_steps)
+                except Exception as e:
+                    run.error = e
+                    running = False
+                if not running:
+                    self.finish(run)
+            # Lets the handlers, the frame streams and every other request run between rounds
+            await wait(0)
+
+sort_scheduler = SortScheduler()
+
+# Calls work(deadline, max_steps) in the scheduler's next round, which gives it the same share of the round as every sort that is due.
+# Returns what work() returned, or None if the lock was taken before its turn. Long work is done in slices by calling this in a loop
+async def run_in_scheduler(work: Callable[[float, int], Any], session_info: InternalState, lock: int) -> Any:
+    run = SliceRun(work, session_info, lock)
+    sort_scheduler.add(run)
+    try:
+        return await run.result
+    finally:
+        sort_scheduler.finish(run)
+
+# Sends frames while the scheduler steps through the generator, waiting between frames
+async def stream_sort_frames(generator: Generator, chart_info: VisualState, session_info: InternalState, lock: int) -> AsyncGenerator[str, None]:
+    run = SortRun(generator, chart_info, session_info, lock)
+    sort_scheduler.add(run)
+    try:
+        while True:
+            frame = await run.outbox.get()
+            sort_scheduler.wake()
+            if frame is None:
+                break
+            yield frame
+    finally:
+        # Also stops the sort if gradio cancels the handler
+        sort_scheduler.finish(run)
+    if run.error is not None:
+        raise run.error
+# END OF SORT SCHEDULER
+
+# Records the whole sort as a trace and sends it in a few frames; graph.js plays it back on its own clock.
+# If cache_key is given, a trace that runs to the end of the sort is stored in trace_cache under it
+async def stream_sort_trace(generator: Generator, chart_info: VisualState, session_info: InternalState, lock: int, cache_key: tuple | None = None) -> AsyncGenerator[str, None]:
+    encoder = chart_info.encoder
+
+    # The first frame is a keyframe of the starting state, which is what the trace is played back from
+    encoder.request_keyframe()
+    frame = encoder.encode(chart_info)
+
+    stats = chart_info.stats
+    start_stats = stats.copy()
+    recorded_ops = array("i") if cache_key is not None else None
+    trace = SortTrace(chart_info)
+    chart_info.trace = trace
+
+    def record_slice(deadline: float, max_steps: int) -> bool:
+        step_start = perf_counter()
+        try:
+            return trace.record(generator, chart_info, session_info, TRACE_CHUNK_OPS, max_steps, deadline)
+        finally:
+            stats.step_time += perf_counter() - step_start
+
+    try:
+        finished = False
+        while not finished:
+            # Every chunk is recorded in the scheduler's rounds, so a long sort doesn't hold up the sorts of other sessions
+            sort_finished = False
+            while not sort_finished and len(trace.ops) < TRACE_CHUNK_OPS * TRACE_OP_WIDTH and session_info.is_lock_owner(lock):
+                sort_finished = bool(await run_in_scheduler(record_slice, session_info, lock))
+            finished = sort_finished or not session_info.is_lock_owner(lock)
+            if finished:
+                # End the playback on exactly the state the server is in
+                trace.record_state(chart_info)
+                trace.record_frame(0)
+            serialize_start = perf_counter()
+
+            if recorded_ops is not None:
+                recorded_ops.extend(trace.ops)
+                # A sort that was stopped was closed early (see InternalState.new_lock()), so its trace isn't the whole sort
+                if sort_finished and session_info.is_lock_owner(lock):
+                    trace_cache.put(cache_key, RecordedTrace(recorded_ops, chart_info.to_bytes(), stats.since(start_stats).counts()))
+            frame["trace"] = trace.flush()
+            frame["trace_end"] = finished
+            frame["stats"] = {**stats.to_dict(), **trace_cache.metrics()}
+            embedded_frame = chart_info.deliver(frame)
+            stats.serialize_time += perf_counter() - serialize_start
+            if embedded_frame is not None:
+                yield embedded_frame
+
+            if not finished:
+                frame = encoder.encode_empty()
+    finally:
+        chart_info.trace = None
+
+    encoder.mark_sent(chart_info)
+
+# complete_sort: whether the generator is a complete sort (rather than a step), which can be recorded in a worker process instead (see WORKER PROCESSES)
+async def run_sort_generator(generator: Generator, chart_info: VisualState, session_info: InternalState, lock: int, complete_sort: bool = False) -> AsyncGenerator[str, None]:
+    session_info.active_generator = generator
+    session_info.event_loop = asyncio.get_running_loop()
+    # graph.js only has the buckets of a long array, not the elements a trace swaps, so those are always streamed
+    if session_info.use_playback and get_bucket_size(len(chart_info.arr)) == 1:
+        # Complete sorts are cached (see TRACE CACHE). A step depends on how far the sort got, so it's always recorded
+        cache_key = trace_cache_key("trace", chart_info, session_info) if complete_sort else None
+        cached = trace_cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            generator.close()
+            chart_info.stats.add(cached.stats)
+            frames = stream_recorded_trace(chart_info, session_info, cached)
+        elif complete_sort and use_worker(chart_info):
+            generator.close()
+            frames = stream_worker_trace(chart_info, session_info, lock, cache_key)
+        else:
+            frames = stream_sort_trace(generator, chart_info, session_info, lock, cache_key)
+        # No frame is sent after the trace, because graph.js skips to the end of a playback whenever a newer frame arrives
+        async for frame in frames:
+            yield frame
+        # (Assumption based on debugging) At least one yield is required, otherwise chart_info_state.value is set to null. A skip isn't a newer frame, so the playback continues
+        yield gr.skip()
+    else:
+        async for frame in stream_sort_frames(generator, chart_info, session_info, lock):
+            yield frame
+        chart_info.encoder.request_stats()
+        yield chart_info.frame_output() # (Assumption based on debugging) At least one yield is required, otherwise chart_info_state.value is set to null
+    if session_info.active_generator is generator:
+        session_info.active_generator = None
+    session_info.close_lock(lock)
+
+# The sort "Skip to End" finishes: the one that was running (unless it was closed when it went to a worker process or the trace cache),
+# otherwise the pending step jobs, otherwise a complete sort from the current array. None if there is nothing left to sort
+def get_fast_forward_generator(chart_info: VisualState, session_info: InternalState, generator: Generator | None) -> Generator | None:
+    if generator is not None and generator.gi_frame is not None:
+        return generator
+    if session_info.step_sort_jobs:
+        return sort_algorithms[session_info.algorithm][0](chart_info, session_info, MAX_CALL_ID)
+    # Like a sort that already finished on the server while graph.js is still playing its trace back
+    if is_sorted(chart_info.arr):
+        return None
+    return sort_algorithms[session_info.algorithm][1](chart_info, session_info)
+
+# Runs the generator for up to max_steps steps or until the deadline passes, without frames, waits or highlights. The stats still count every step,
+# so they are the sort's real totals once it's done. Returns True once the sort has finished
+def fast_forward_sort(chart_info: VisualState, session_info: InternalState, generator: Generator, deadline: float, max_steps: int) -> bool:
+    stats = chart_info.stats
+    start = perf_counter()
+    steps = 0
+    try:
+        for job_finished in generator:
+            steps += 1
+            if job_finished:
+                stats.jobs += 1
+            if steps >= max_steps or perf_counter() >= deadline:
+                return False
+    finally:
+        stats.yields += steps
+        stats.step_time += perf_counter() - start
+    return True
+
+# END OF SORT DRIVERS
+
+
+# RACE MODE
+# Several algorithms sort identical copies of the array at the same time. Each lane is its own VisualState with its own frame encoder, and every frame
+# of the race carries one frame per lane: {"v", "race": [lane frame, ...]}. graph.js draws a race frame as stacked charts instead of the main chart
+RACE_MODES = ["Equal Steps", "Equal Time"] # How each frame's work is shared between the lanes: the same number of steps (generator yields), or the same server time. SYNC THIS WITH THE UI
+MAX_RACE_STEPS = 10000 # Most steps per lane per frame (Equal Steps)
+
+class RaceLane:
+    __slots__ = ("name", "chart", "generator", "place")
+
+    def __init__(self, name: str, chart_info: VisualState, session_info: InternalState):
+        self.name = name
+        self.chart = chart_info.clone()
+        self.chart.reset_visuals()
+        # Every lane gets its own copy of the settings and pending jobs, so the lanes (and the session) don't share a job stack
+        lane_session = session_info.fork()
+        lane_session.algorithm = name
+        self.generator = sort_algorithms[name][1](self.chart, lane_session)
+        self.place: int | None = None # Finishing place, from 1
+
+    # Runs the lane's sort for up to max_steps steps, or until max_seconds have passed. Returns True once the sort has finished
+    def advance(self, max_steps: int, max_seconds: float) -> bool:
+        stats = self.chart.stats
+        start = perf_counter()
+        deadline = start + max_seconds
+        steps = 0
+        try:
+            while steps < max_steps:
+                if next(self.generator):
+                    stats.jobs += 1
+                steps += 1
+                if perf_counter() >= deadline:
+                    break
+            return False
+        except StopIteration:
+            self.chart.reset_visuals()
+            self.chart.partitioning = False
+            return True
+        finally:
+            stats.yields += steps
+            stats.step_time += perf_counter() - start
+
+    # The lane's next frame, with what graph.js labels the lane with
+    def encode(self) -> dict[str, Any]:
+        frame = self.chart.encoder.encode(self.chart)
+        frame["name"] = self.name
+        frame["place"] = self.place
+        frame["steps"] = self.chart.stats.yields
+        return frame
+
+# Runs the lanes until every sort has finished (or the lock is taken), sending one race frame per session_info.wait_interval
+async def stream_race(chart_info: VisualState, session_info: InternalState, lanes: list[RaceLane], lock: int, mode: str, steps_per_frame: int) -> AsyncGenerator[str, None]:
+    running = list(lanes)
+    places = 0
+    equal_time = mode == RACE_MODES[1]
+    shares: dict[RaceLane, float] = {} # What each lane has left of this frame's work: steps (Equal Steps) or seconds (Equal Time)
+
+    # Splits the slice evenly between the lanes with work left. Returns True once every lane has done its share of the frame
+    def advance_lanes(deadline: float, max_steps: int) -> bool:
+        nonlocal places
+        due = [lane for lane in running if shares[lane] > 0]
+        for n, lane in enumerate(due):
+            stats = lane.chart.stats
+            lane_seconds = max(deadline - perf_counter(), 0) / (len(due) - n)
+            lane_steps = max(1, max_steps // len(due))
+            start_steps, start_time = stats.yields, stats.step_time
+            if equal_time:
+                finished = lane.advance(lane_steps, min(shares[lane], lane_seconds))
+                shares[lane] -= stats.step_time - start_time
+            else:
+                finished = lane.advance(min(int(shares[lane]), lane_steps), lane_seconds)
+                shares[lane] -= stats.yields - start_steps
+            if finished:
+                places += 1
+                lane.place = places
+                running.remove(lane)
+        return all(shares[lane] <= 0 for lane in running)
+
+    while running and session_info.is_lock_owner(lock):
+        tick_start = perf_counter()
+        share = FRAME_BUDGET / len(running) if equal_time else steps_per_frame
+        for lane in running:
+            shares[lane] = share
+        # The lanes are stepped in the scheduler's rounds, like a streamed sort, so a race doesn't hold up the sorts of other sessions
+        while not await run_in_scheduler(advance_lanes, session_info, lock):
+            if not session_info.is_lock_owner(lock):
+                return
+
+        # Same as next_frame(): if the stream fell behind, every lane starts over with a keyframe
+        channel = frame_channels.get(chart_info.channel_id) if chart_info.channel_id else None
+        if channel is not None and channel.resync and not channel.queue.full():
+            channel.resync = False
+            for lane in lanes:
+                lane.chart.encoder.request_keyframe()
+        frame = chart_info.deliver({"v": FRAME_PROTOCOL_VERSION, "race": [lane.encode() for lane in lanes]})
+        if frame is not None:
+            yield frame
+        await wait(max(session_info.wait_interval - (perf_counter() - tick_start), 0))
+
+# Markdown table of the lanes in finishing order
+def race_summary(lanes: list[RaceLane]) -> str:
+    rows = ["| Place | Algorithm | Steps | Comparisons | Swaps | Server Time (ms) |", "|---|---|---|---|---|---|"]
+    for lane in sorted(lanes, key=lambda lane: lane.place or len(lanes) + 1):
+        stats = lane.chart.stats
+        place = lane.place if lane.place is not None else "Stopped"
+        rows.append(f"| {place} | {lane.name} | {stats.yields} | {stats.comparisons} | {stats.swaps} | {round(stats.step_time * 1000)} |")
+    return "\n".join(rows)
+# END OF RACE MODE
+
+
+# WORKER PROCESSES
+# Sorts that are computed in one go (traces for Client-side Playback, and timeline recordings) run in a pool of worker processes for arrays of at least
+# WORKER_MIN_ELEMENTS, so a long sort doesn't hold up the event loop that every session's frames go through.
+# Workers are spawned rather than forked (the server has threads running), and import this file for the sort generators; that happens once per worker
+USE_WORKER_PROCESSES = True
+WORKER_MIN_ELEMENTS = 500
+WORKER_PROCESSES = max(1, (os.cpu_count() or 2) - 1)
+WORKER_POLL_INTERVAL = 0.05 # Seconds between checks of whether a sort running in a worker was stopped
+
+worker_pool: ProcessPoolExecutor | None = None
+
+def get_worker_pool() -> ProcessPoolExecutor:
+    global worker_pool
+    if worker_pool is None:
+        worker_pool = ProcessPoolExecutor(max_workers=WORKER_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+    return worker_pool
+
+def use_worker(chart_info: VisualState) -> bool:
+    return USE_WORKER_PROCESSES and len(chart_info.arr) >= WORKER_MIN_ELEMENTS
+
+# What a worker needs to run a session's sort: the chart (VisualState.to_bytes()), the SORT_SETTINGS and the pending step jobs
+def worker_sort_args(chart_info: VisualState, session_info: InternalState) -> tuple[bytes, dict[str, Any], array | None]:
+    jobs = session_info.step_sort_jobs.data if session_info.step_sort_jobs is not None else None
+    return chart_info.to_bytes(), {k: getattr(session_info, k) for k in SORT_SETTINGS}, jobs
+
+# Reverses worker_sort_args() in the worker
+def worker_sort_state(chart_data: bytes, settings: dict[str, Any], jobs: array | None) -> tuple[VisualState, InternalState]:
+    chart_info = VisualState.from_bytes(chart_data)
+    session_info = InternalState()
+    for k, v in settings.items():
+        setattr(session_info, k, v)
+    if jobs is not None:
+        session_info.step_sort_jobs = JobStack()
+        session_info.step_sort_jobs.data = jobs
+    return chart_info, session_info
+
+# Runs fn(*args) in the worker pool. Returns None if the lock is taken before it finishes (the worker finishes anyway, and the result is dropped)
+async def run_in_worker(session_info: InternalState, lock: int, fn: Callable, *args: Any) -> Any:
+    future = asyncio.get_running_loop().run_in_executor(get_worker_pool(), fn, *args)
+    while not future.done():
+        if not session_info.is_lock_owner(lock):
+            future.cancel()
+            return None
+        await asyncio.wait({future}, timeout=WORKER_POLL_INTERVAL)
+    return future.result()
+
+# Runs in a worker: records a complete sort as trace ops, like stream_sort_trace
+def record_trace_in_worker(chart_data: bytes, settings: dict[str, Any], jobs: array | None) -> "RecordedTrace":
+    chart_info, session_info = worker_sort_state(chart_data, settings, jobs)
+    return record_trace(chart_info, session_info)
+
+# Runs in a worker: records a complete sort for the timeline, like record_timeline_button_on_click
+def record_timeline_in_worker(chart_data: bytes, settings: dict[str, Any], jobs: array | None) -> SortRecording:
+    chart_info, session_info = worker_sort_state(chart_data, settings, jobs)
+    recording = SortRecording(chart_info)
+    chart_info.trace = recording.trace
+    generator = sort_algorithms[session_info.algorithm][1](chart_info, session_info)
+    recording.record(generator, chart_info, MAX_CALL_ID)
+    return recording
+
+# stream_sort_trace for a complete sort that runs in a worker. The trace is sent once the worker has finished, and stored in trace_cache under cache_key
+async def stream_worker_trace(chart_info: VisualState, session_info: InternalState, lock: int, cache_key: tuple | None = None) -> AsyncGenerator[str, None]:
+    recorded = await run_in_worker(session_info, lock, record_trace_in_worker, *worker_sort_args(chart_info, session_info))
+    if recorded is None:
+        return
+    chart_info.stats.add(recorded.stats)
+    recorded.stats = recorded.stats.counts()
+    if cache_key is not None:
+        trace_cache.put(cache_key, recorded)
+    async for frame in stream_recorded_trace(chart_info, session_info, recorded):
+        yield frame
+# END OF WORKER PROCESSES
+
+
+# TRACE CACHE
+# Complete sorts are often run again on the same array (Load Save Point then Complete Sort, or changing an animation option and sorting again).
+# Every sort is deterministic (random pivots are seeded, see random_pivot()), so the traces for Client-side Playback and the timeline recordings are kept
+# in one LRU cache shared by every session, and a repeated sort is played back from the cache instead of running the generators again.
+# The key is everything the sort depends on: the array, the chart's visual fields (the trace records changes to them), the pending step jobs and the SORT_SETTINGS
+TRACE_CACHE_BUDGET = 64 * 1024 * 1024 # Bytes the cached traces and recordings can take together. The least recently used ones are evicted past this
+TRACE_CACHE_MAX_ENTRY = TRACE_CACHE_BUDGET // 4 # Larger traces aren't cached, so one long sort doesn't evict everything else
+
+# A complete sort recorded as trace ops: the ops, the final chart (VisualState.to_bytes()) and the stats of the sort
+class RecordedTrace:
+    __slots__ = ("ops", "final", "stats")
+
+    def __init__(self, ops: array, final: bytes, stats: SortStats):
+        self.ops = ops
+        self.final = final
+        self.stats = stats
+
+    def nbytes(self) -> int:
+        return array_nbytes(self.ops) + len(self.final)
+
+class TraceCache:
+    __slots__ = ("entries", "budget", "size", "hits", "misses", "evictions")
+
+    def __init__(self, budget: int = TRACE_CACHE_BUDGET):
+        self.entries: OrderedDict[tuple, tuple[Any, int]] = OrderedDict() # key -> (value, bytes), least recently used first
+        self.budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple) -> Any: # o(1) time
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    # Stores a value (a RecordedTrace or a SortRecording, which are never modified once cached) and evicts the least recently used values past the budget
+    def put(self, key: tuple, value: Any): # o(1) time amortized
+        nbytes = value.nbytes()
+        if nbytes > min(self.budget, TRACE_CACHE_MAX_ENTRY):
+            return
+        self.discard(key)
+        self.entries[key] = (value, nbytes)
+        self.size += nbytes
+        while self.size > self.budget:
+            _, (_, evicted_bytes) = self.entries.popitem(last=False)
+            self.size -= evicted_bytes
+            self.evictions += 1
+
+    def discard(self, key: tuple):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def metrics(self) -> dict[str, int]:
+        return {
+            "trace_cache_hits": self.hits,
+            "trace_cache_misses": self.misses,
+            "trace_cache_evictions": self.evictions,
+            "trace_cache_entries": len(self.entries),
+            "trace_cache_bytes": self.size,
+        }
+
+trace_cache = TraceCache()
+
+# kind is what is cached ("trace" or "timeline"), as both are recorded from the same sort
+def trace_cache_key(kind: str, chart_info: VisualState, session_info: InternalState) -> tuple: # o(n) time
+    digest = hashlib.blake2b(int32_to_bytes(chart_info.arr), digest_size=16)
+    if session_info.step_sort_jobs is not None:
+        digest.update(session_info.step_sort_jobs.data.tobytes())
+    fields = tuple(getattr(chart_info, k) for k in UNDO_FIELDS)
+    settings = tuple(getattr(session_info, k) for k in SORT_SETTINGS)
+    return (kind, digest.hexdigest(), fields, chart_info.animate_swaps, settings)
+
+# Records a complete sort as trace ops, like stream_sort_trace but in one go
+def record_trace(chart_info: VisualState, session_info: InternalState) -> RecordedTrace:
+    start_stats = chart_info.stats.copy()
+    trace = SortTrace(chart_info)
+    chart_info.trace = trace
+    generator = sort_algorithms[session_info.algorithm][1](chart_info, session_info)
+    start = perf_counter()
+    trace.record(generator, chart_info, session_info, float("inf"))
+    chart_info.stats.step_time += perf_counter() - start
+    trace.record_state(chart_info)
+    trace.record_frame(0)
+    chart_info.trace = None
+    return RecordedTrace(trace.ops, chart_info.to_bytes(), chart_info.stats.since(start_stats))
+
+# Moves the chart to the end of a recorded sort, and sends the trace in TRACE_CHUNK_OPS chunks to be played back from where the chart was
+async def stream_recorded_trace(chart_info: VisualState, session_info: InternalState, recorded: RecordedTrace) -> AsyncGenerator[str, None]:
+    encoder = chart_info.encoder
+    encoder.request_keyframe()
+    frame = encoder.encode(chart_info)
+
+    final = VisualState.from_bytes(recorded.final)
+    chart_info.arr = final.arr
+    for k in UNDO_FIELDS:
+        setattr(chart_info, k, getattr(final, k))
+    chart_info.permutation = final.permutation
+    # A complete sort leaves nothing to step through
+    session_info.step_sort_jobs = None
+
+    stats = chart_info.stats
+    ops = recorded.ops
+    chunk_size = TRACE_CHUNK_OPS * TRACE_OP_WIDTH
+    for chunk_start in range(0, len(ops), chunk_size):
+        finished = chunk_start + chunk_size >= len(ops)
+        serialize_start = perf_counter()
+        frame["trace"] = encode_trace_ops(ops[chunk_start:chunk_start + chunk_size])
+        frame["trace_end"] = finished
+        frame["stats"] = {**stats.to_dict(), **trace_cache.metrics()}
+        embedded_frame = chart_info.deliver(frame)
+        stats.serialize_time += perf_counter() - serialize_start
+        if embedded_frame is not None:
+            yield embedded_frame
+        if not finished:
+            frame = encoder.encode_empty()
+            await wait(0)
+
+    encoder.mark_sent(chart_info)
+# END OF TRACE CACHE
+
 # Main
 
+# Files are looked up next to this script, so it can be imported (e.g. by benchmark.py) from any working directory
+APP_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
 # Requires "graph,js"
 try:
-    with open("graph.js", "r") as js_file:
+    with open(os.path.join(APP_DIRECTORY, "graph.js"), "r") as js_file:
        graph_builder_src_js = js_file.read()
         # Load js source code
 except FileNotFoundError:
@@ -642,7 +2996,8 @@ with gr.Blocks() as demo:
     
     # session_info_state stores components that are irrelevant to graphics: Essentially, values that are only used internally (in the back-end)
     # An assumption is made that type(gr.State()) objects pass their 'value' attribute whenever the gr.State object is used as input, meaning that references are maintained and session_info never needs to be used as output.
-    session_info_state = gr.State(value=InternalState()) # luau typecheck: gr.State & {value: InternalState}
+    # Gradio calls end_session when the tab closes and drops the state (see SESSION MEMORY)
+    session_info_state = gr.State(value=InternalState(), delete_callback=end_session) # luau typecheck: gr.State & {value: InternalState}
 
     gr.Markdown("# Sort Visualizer: by Wayne Bai (SID: 20553851)")
 
@@ -651,6 +3006,8 @@ with gr.Blocks() as demo:
 
     # Initialize as empty because this element is updated on the client-side
     html_chart = gr.HTML(value=f"<div></div>", elem_id=HTML_GRAPH_ELEMENT_ID)
+    # Filled in by graph.js with the stats that come with the frames
+    html_stats = gr.HTML(value=f"<div></div>", elem_id=HTML_STATS_ELEMENT_ID)
 
     # Which sorting algorithm to use
     algorithm_option = gr.Radio(label="Sort Algorithm", choices=list(sort_algorithms.keys()), value=session_info_state.value.algorithm)
@@ -660,23 +3017,42 @@ with gr.Blocks() as demo:
         show_queries_option = gr.Checkbox(label="Show Queries", value=session_info_state.value.show_queries) # Uses session info because py prompts visual updates, so js doesnt need this
         show_comparisons_option = gr.Checkbox(label="Show Comparisons", value=session_info_state.value.show_comparisons) # Uses session info because py prompts visual updates, so js doesnt need this
         animate_swaps_option = gr.Checkbox(label="Animate Swaps", value=chart_info_state.value.animate_swaps) # Uses chart info because js needs to know whether to animate
+        use_playback_option = gr.Checkbox(label="Client-side Playback (computes the whole sort at once, then the browser plays it back)", value=session_info_state.value.use_playback)
+        renderer_option = gr.Radio(label="Renderer (Canvas is faster for large arrays)", choices=RENDERERS, value=chart_info_state.value.renderer) # Uses chart info because js draws the chart
 
     # Pivot controls
     with gr.Row():
         use_random_pv_option = gr.Checkbox(label="Use Random Pivot (quicksort)", value=session_info_state.value.use_random_pv)
+        pv_seed_number = gr.Number(label="Random Pivot Seed (quicksort)", value=session_info_state.value.pv_seed, precision=0, interactive=session_info_state.value.use_random_pv)
         pv_alpha_slider = gr.Slider(label="Custom Pivot Point (quicksort)", minimum=0, maximum=1, value=1)
+        pv_strategy_option = gr.Radio(label="Pivot Strategy (quicksort)", choices=PIVOT_STRATEGIES, value=session_info_state.value.pv_strategy)
+
+    # Quick-sort tuning controls
+    with gr.Row():
+        three_way_partition_option = gr.Checkbox(label="Three-Way Partition (quicksort, groups elements equal to the pivot)", value=session_info_state.value.three_way_partition)
+        use_depth_limit_option = gr.Checkbox(label="Heap Sort Fallback (quicksort, introsort depth limit)", value=session_info_state.value.use_depth_limit)
+        insertion_cutoff_slider = gr.Slider(label="Insertion Sort Cutoff (quicksort, 0 to disable)", minimum=0, maximum=32, step=1, value=session_info_state.value.insertion_cutoff)
+
+    # Shell sort controls
+    with gr.Row():
+        gap_sequence_option = gr.Radio(label="Gap Sequence (shell sort)", choices=SHELL_GAP_SEQUENCES, value=session_info_state.value.gap_sequence)
 
     # Unsorting controls
     with gr.Row():
         with gr.Column():
             element_count_slider = gr.Slider(label="Total Elements", minimum=1, maximum=MAX_ELEMENTS, value=50, step=1)
+            workload_option = gr.Dropdown(label="Workload", choices=WORKLOADS, value=WORKLOADS[0])
+            workload_seed_number = gr.Number(label="Workload Seed (leave empty for a new array every time)", value=None, precision=0)
             reset_button = gr.Button("Regenerate Elements")
         with gr.Column():
             shuffle_strength_field = gr.Slider(label= "Shuffle Strength", minimum=0.0, maximum=1.0, value=0.1)
             shuffle_button = gr.Button("Shuffle Elements")
         with gr.Column():
+            # Type a name to create a new save point, or pick one to load, overwrite or delete
+            save_point_option = gr.Dropdown(label="Save Point", choices=[], value=None, allow_custom_value=True)
             snapshot_button = gr.Button("Create Save Point")
             load_snapshot_button = gr.Button("Load Save Point", interactive=False)
+            delete_snapshot_button = gr.Button("Delete Save Point", interactive=False)
             
 
     # Sorting controls
@@ -684,16 +3060,33 @@ with gr.Blocks() as demo:
         with gr.Column():
             iterations_per_step_slider = gr.Slider(label="Iterations per Step", minimum=1, maximum=10, value=1, step=1)
             step_button = gr.Button("Step")
+            step_back_button = gr.Button("Step Back")
+            undo_depth_slider = gr.Slider(label="Step Back History (swaps kept, 0 to disable)", minimum=0, maximum=MAX_UNDO_DEPTH, step=1000, value=session_info_state.value.undo_log.depth)
         with gr.Column():
             queue_data_option = gr.Checkbox(label="Queue Data (Setting to false will improve responsiveness but skip steps, disable this for large arrays)", value=chart_info_state.value.do_queue)
             iteration_interval_slider = gr.Slider(label="Iteration Interval (seconds)", minimum=0.016, maximum=0.5, step=0.001, value=session_info_state.value.wait_interval)
             stop_button = gr.Button("Stop Sorting (May not respond immediately for large arrays)")
+            skip_button = gr.Button("Skip to End")
             sort_button = gr.Button("Complete Sort")
 
+    # Race controls
+    with gr.Row():
+        race_algorithms_option = gr.CheckboxGroup(label="Race Algorithms (sorted side by side on copies of the array)", choices=list(sort_algorithms.keys()), value=["Quick-Sort", "Bubble-Sort"])
+        with gr.Column():
+            race_mode_option = gr.Radio(label="Race Fairness", choices=RACE_MODES, value=RACE_MODES[0])
+            race_steps_slider = gr.Slider(label="Race Steps per Frame (Equal Steps)", minimum=1, maximum=MAX_RACE_STEPS, step=1, value=100)
+            race_button = gr.Button("Race")
+    race_summary_markdown = gr.Markdown()
+
+    # Timeline controls
+    with gr.Row():
+        record_timeline_button = gr.Button("Record Timeline (records a complete sort of the current array without changing it)")
+        timeline_slider = gr.Slider(label="Timeline Step", minimum=0, maximum=1, step=1, value=0, interactive=False)
+
     # Load the README because why not
     try:
 
-        with open("README.md", "r") as instructions_file:
+        with open(os.path.join(APP_DIRECTORY, "README.md"), "r") as instructions_file:
             readme_src = instructions_file.read()
             gr.Markdown(readme_src)
     except Exception as e:
@@ -719,41 +3112,15 @@ with gr.Blocks() as demo:
 
         
         lock = session_info.new_lock()
+        undo_log = session_info.undo_log
+        undo_step = undo_log.begin_step(chart_info, session_info.step_sort_jobs)
         generator = sort_algorithms[session_info.algorithm][0](chart_info, session_info, round(step_count))
 
         try:
-            while session_info.is_lock_owner(lock):
-                job_finished = next(generator)
-
-                if session_info.show_queries:
-                    if chart_info.swapping and chart_info.animate_swaps:
-
-                        applied_wait_interval = session_info.wait_interval * chart_info.get_wait_multiplier_for_current_state()
-
-                        chart_info.dt = applied_wait_interval
-                        yield chart_info.to_embedded_json()
-                        await wait(applied_wait_interval)
-
-                    elif chart_info.swapping or session_info.show_comparisons:
-
-                        applied_wait_interval = session_info.wait_interval
-
-                        chart_info.dt = applied_wait_interval
-
-                        yield chart_info.to_embedded_json()
-                        await wait(applied_wait_interval)
-                        
-                elif job_finished:
-                    chart_info.partitioning = True
-                    yield chart_info.to_embedded_json()
-                    chart_info.partitioning = False
-                    await wait(session_info.wait_interval)
-        except StopIteration:
-            pass
-            
-            
-        yield chart_info.to_embedded_json() # (Assumption based on debugging) At least one yield is required, otherwise chart_info_state.value is set to null
-        session_info.close_lock(lock)
+            async for frame in run_sort_generator(generator, chart_info, session_info, lock):
+                yield frame
+        finally:
+            undo_log.end_step(chart_info, undo_step)
 
     async def sort_button_on_click(
             chart_info: VisualState,
@@ -762,42 +3129,22 @@ with gr.Blocks() as demo:
 
 
         lock = session_info.new_lock()
+        # Stats describe one complete sort (stepping keeps adding to them)
+        chart_info.stats.reset()
+        session_info.undo_log.clear()
+
+        # Checked here instead of in full_quicksort_gen, which runs in the scheduler's task, so the toast goes to this session
+        if session_info.algorithm == "Quick-Sort" and is_sorted(chart_info.arr):
+            gr.Info("The array is fully sorted.")
+            session_info.close_lock(lock)
+            yield chart_info.frame_output()
+            return
 
         # Assumption is that 'full_sort_algorithms' is a dictionary that stores all the supported sort functions
         generator = sort_algorithms[session_info.algorithm][1](chart_info, session_info)
 
-        try:
-            while session_info.is_lock_owner(lock):
-                job_finished = next(generator)
-
-                if session_info.show_queries:
-                    if chart_info.swapping and chart_info.animate_swaps:
-
-                        applied_wait_interval = session_info.wait_interval * chart_info.get_wait_multiplier_for_current_state()
-
-                        chart_info.dt = applied_wait_interval
-                        yield chart_info.to_embedded_json()
-                        await wait(applied_wait_interval)
-
-                    elif chart_info.swapping or session_info.show_comparisons:
-
-                        applied_wait_interval = session_info.wait_interval
-
-                        chart_info.dt = applied_wait_interval
-
-                        yield chart_info.to_embedded_json()
-                        await wait(applied_wait_interval)
-                        
-                elif job_finished:
-                    chart_info.partitioning = True
-                    yield chart_info.to_embedded_json()
-                    chart_info.partitioning = False
-                    await wait(session_info.wait_interval)
-        except StopIteration:
-            pass
-
-        yield chart_info.to_embedded_json() # (Assumption based on debugging) At least one yield is required, otherwise chart_info_state.value is set to null
-        session_info.close_lock(lock)
+        async for frame in run_sort_generator(generator, chart_info, session_info, lock, complete_sort=True):
+            yield frame
                 
     step_button.click(
         step_button_on_click,
@@ -816,34 +3163,163 @@ with gr.Blocks() as demo:
         session_info_state,
     ], [hidden_graph_data], queue=True, concurrency_limit=None, )
 
-    def algorithm_option_on_change(session_info: InternalState, new_algorithm: str):
+    # Async so it runs on the same thread as the sort handlers, which share chart_info's frame encoder
+    async def step_back_button_on_click(chart_info: VisualState, session_info: InternalState):
+        if session_info.lock_active():
+            gr.Info("Sorting is in progress, can't step back")
+            return chart_info.frame_output()
+        if not session_info.undo_log.undo_step(chart_info, session_info):
+            gr.Info("There are no steps to go back to")
+        session_info.touch()
+        return chart_info.frame_output()
+    step_back_button.click(step_back_button_on_click, [chart_info_state, session_info_state], [hidden_graph_data])
+
+    # Records on a copy of the chart and the session (in a worker process for long arrays), so the chart stays as it is until the slider is moved
+    async def record_timeline_button_on_click(chart_info: VisualState, session_info: InternalState):
+        if session_info.lock_active():
+            gr.Info("Sorting is in progress, can't record")
+            return gr.skip()
+        lock = session_info.new_lock()
+
+        cache_key = trace_cache_key("timeline", chart_info, session_info)
+        recording = trace_cache.get(cache_key) # Recordings can be shared by sessions, seek() never modifies them
+        if recording is None and use_worker(chart_info):
+            recording = await run_in_worker(session_info, lock, record_timeline_in_worker, *worker_sort_args(chart_info, session_info))
+            if recording is None:
+                return gr.skip()
+            trace_cache.put(cache_key, recording)
+        elif recording is None:
+            recorded_chart = chart_info.clone()
+            recording = SortRecording(recorded_chart)
+            recorded_chart.trace = recording.trace
+            generator = sort_algorithms[session_info.algorithm][1](recorded_chart, session_info.fork())
+            # Recorded in the scheduler's rounds, like a streamed sort
+            def record_slice(deadline: float, max_steps: int) -> bool:
+                return recording.record(generator, recorded_chart, max_steps, deadline)
+            while not await run_in_scheduler(record_slice, session_info, lock):
+                if not session_info.is_lock_owner(lock):
+                    generator.close()
+                    return gr.skip()
+            trace_cache.put(cache_key, recording)
+        session_info.close_lock(lock)
+
+        session_info.recording = recording
+        session_info.touch()
+        enforce_memory_budget()
+        if not recording.complete:
+            gr.Info(f"The sort is too long to record completely, so the timeline ends after {recording.step_count()} steps")
+        return gr.update(maximum=max(recording.step_count(), 1), value=0, interactive=True)
+    record_timeline_button.click(record_timeline_button_on_click, [chart_info_state, session_info_state], [timeline_slider])
+
+    # Async so it runs on the same thread as the sort handlers, which share chart_info's frame encoder
+    async def timeline_slider_on_release(chart_info: VisualState, session_info: InternalState, step: float):
+        recording = session_info.recording
+        if recording is None:
+            gr.Info("The timeline was cleared to free memory, record it again")
+            return chart_info.frame_output()
+        # Stops anything running, like loading a save point
+        session_info.close_lock(session_info.new_lock())
+        recording.seek(chart_info, round(step))
+        # The chart is now somewhere else in the sort, so stepping starts over from there
+        session_info.step_sort_jobs = None
+        session_info.undo_log.clear()
+        session_info.touch()
+        return chart_info.frame_output()
+    timeline_slider.release(timeline_slider_on_release, [chart_info_state, session_info_state, timeline_slider], [hidden_graph_data], trigger_mode="always_last")
+
+    # The races run on copies of the array, so the main chart comes back unchanged with the next normal frame
+    async def race_button_on_click(chart_info: VisualState, session_info: InternalState, names: list[str], mode: str, steps_per_frame: float):
+        if len(names) < 2:
+            gr.Info("Pick at least two algorithms to race")
+            yield gr.skip(), gr.skip()
+            return
+        lock = session_info.new_lock()
+        lanes = [RaceLane(name, chart_info, session_info) for name in names]
+        async for frame in stream_race(chart_info, session_info, lanes, lock, mode, round(steps_per_frame)):
+            yield frame, gr.skip()
+        session_info.close_lock(lock)
+        session_info.touch()
+        yield gr.skip(), race_summary(lanes)
+    race_button.click(race_button_on_click, [chart_info_state, session_info_state, race_algorithms_option, race_mode_option, race_steps_slider], [hidden_graph_data, race_summary_markdown], queue=True, concurrency_limit=None)
+
+    def undo_depth_slider_on_change(session_info: InternalState, depth: float):
+        session_info.undo_log.set_depth(round(depth))
+    undo_depth_slider.change(undo_depth_slider_on_change, [session_info_state, undo_depth_slider])
+
+    # Async so it runs on the same thread as the sort handlers and never closes a generator while it is running
+    async def skip_button_on_click(chart_info: VisualState, session_info: InternalState):
+        # Taking the lock stops the handler that was stepping through the generator. The generator is taken first, so new_lock() doesn't close it
+        generator = session_info.active_generator
+        session_info.active_generator = None
+        lock = session_info.new_lock()
+        # The trace or undo step that was being recorded ends with that handler, so the skipped steps aren't recorded
+        chart_info.trace = None
+        chart_info.undo = None
+
+        generator = get_fast_forward_generator(chart_info, session_info, generator)
+        if generator is not None:
+            session_info.active_generator = generator # So "Stop" closes it like any other sort
+            # Drained in the scheduler's rounds, so a long sort doesn't hold up other sessions
+            def skip_slice(deadline: float, max_steps: int) -> bool:
+                return fast_forward_sort(chart_info, session_info, generator, deadline, max_steps)
+            while not await run_in_scheduler(skip_slice, session_info, lock):
+                if not session_info.is_lock_owner(lock):
+                    generator.close()
+                    return gr.skip()
+            if session_info.active_generator is generator:
+                session_info.active_generator = None
+
+        # Nothing is left to step through
+        session_info.step_sort_jobs = None
+        chart_info.reset_visuals()
+        chart_info.partitioning = False
+        session_info.undo_log.clear()
+        session_info.close_lock(lock)
+        # The handler that was stopped may have marked a state from the middle of the skip as sent
+        chart_info.encoder.request_keyframe()
+        chart_info.encoder.request_stats()
+        return chart_info.frame_output()
+
+    skip_button.click(skip_button_on_click, [chart_info_state, session_info_state], [hidden_graph_data])
+
+    # Async so it runs on the same thread as the sort handlers and never closes a generator while it is running
+    async def algorithm_option_on_change(session_info: InternalState, new_algorithm: str):
         session_info.algorithm = new_algorithm
-        # Remove any step-sort jobs
+        # Remove any step-sort jobs, which the steps back would restore
         session_info.step_sort_jobs = None
+        session_info.undo_log.clear()
         # Cancel any running algorithms
         session_info.close_lock(session_info.new_lock())
     algorithm_option.change(algorithm_option_on_change, [session_info_state, algorithm_option])
 
-    def stop_button_on_click(session_info: InternalState):
+    async def stop_button_on_click(chart_info: VisualState, session_info: InternalState):
         # Overwrites other locks, then closes itself; result: peace and quiet (nothing will be running)
         session_info.close_lock(session_info.new_lock())
+        # A new frame also makes graph.js skip to the end of any trace it is playing back
+        return chart_info.frame_output()
 
-    stop_button.click(stop_button_on_click, [session_info_state], [])
+    stop_button.click(stop_button_on_click, [chart_info_state, session_info_state], [hidden_graph_data])
 
-    def reset_button_on_click(chart_info: VisualState, session_info: InternalState, element_count_src: float):
+    # Async so it runs on the same thread as the sort handlers, which share chart_info's frame encoder
+    async def reset_button_on_click(chart_info: VisualState, session_info: InternalState, element_count_src: float, workload: str, seed: float | None):
         if session_info.lock_active():
             gr.Info("Sorting is in progress, can't refresh")
-            return chart_info.to_embedded_json()
+            return chart_info.frame_output()
         # Clear step-sort pending jobs
         session_info.step_sort_jobs = None
+        session_info.undo_log.clear()
 
-        # Regenerate randomized elements for the array
-        regenerate(chart_info.arr, floor(element_count_src))
+        # Regenerate the elements with the chosen workload
+        chart_info.arr = generate_workload(workload, floor(element_count_src), None if seed is None else int(seed))
         chart_info.reset_visuals()
+        chart_info.stats.reset()
+        chart_info.encoder.request_keyframe()
+        session_info.touch()
+        enforce_memory_budget()
 
         # Update states
-        return chart_info.to_embedded_json()
-    reset_button.click(reset_button_on_click, [chart_info_state, session_info_state, element_count_slider], [hidden_graph_data], )
+        return chart_info.frame_output()
+    reset_button.click(reset_button_on_click, [chart_info_state, session_info_state, element_count_slider, workload_option, workload_seed_number], [hidden_graph_data], )
     
 
     def queue_data_option_on_change(chart_info: VisualState, v: bool, iter_interval: float):
@@ -858,7 +3334,16 @@ with gr.Blocks() as demo:
 
 
     # Since this doesn't affect the number of elements in the list, it won't cause the program to fail. I will let this be callable mid-sort, just for fun
-    def shuffle_button_on_click(chart_info: VisualState, shuffle_strength: float):
+    # Async so it runs on the same thread as the sort handlers, which share chart_info's frame encoder
+    async def shuffle_button_on_click(chart_info: VisualState, session_info: InternalState, shuffle_strength: float):
+        # These sorts hold copies of elements in a buffer during a pass, and writing them back after a shuffle would duplicate some elements and lose others
+        if session_info.active_generator is not None and session_info.algorithm in BUFFERED_SORTS:
+            gr.Info(f"Can't shuffle while {session_info.algorithm} is running, stop sorting first")
+            yield chart_info.frame_output()
+            return
+
+        # Steps can't be undone past a shuffle
+        session_info.undo_log.clear()
 
         # shuffle(chart_info.arr, shuffle_strength)
 
@@ -870,14 +3355,11 @@ with gr.Blocks() as demo:
         try:
             while True:
                 next(shuffle_generator)
-                chart_info.dt = 0.25*chart_info.get_wait_multiplier_for_current_state()
-                yield chart_info.to_embedded_json()
+                yield chart_info.frame_output()
         except StopIteration:
             pass
 
-        return chart_info.to_embedded_json()
-
-    shuffle_button.click(shuffle_button_on_click, [chart_info_state, shuffle_strength_field], [hidden_graph_data], )
+    shuffle_button.click(shuffle_button_on_click, [chart_info_state, session_info_state, shuffle_strength_field], [hidden_graph_data], )
 
     def pv_alpha_slider_on_change(session_info: InternalState, alpha: float):
         # Updates a variable so the pivot alpha can be adjusted during an on-going sort
@@ -886,8 +3368,33 @@ with gr.Blocks() as demo:
 
     def use_random_pv_option_on_change(session_info: InternalState, value: bool):
         session_info.use_random_pv = value
-        return gr.update(interactive=not value)
-    use_random_pv_option.change(use_random_pv_option_on_change, [session_info_state, use_random_pv_option], [pv_alpha_slider])
+        return gr.update(interactive=not value), gr.update(interactive=not value), gr.update(interactive=value)
+    use_random_pv_option.change(use_random_pv_option_on_change, [session_info_state, use_random_pv_option], [pv_alpha_slider, pv_strategy_option, pv_seed_number])
+
+    def pv_seed_number_on_change(session_info: InternalState, seed: float | None):
+        if seed is not None:
+            session_info.pv_seed = int(seed)
+    pv_seed_number.change(pv_seed_number_on_change, [session_info_state, pv_seed_number])
+
+    def pv_strategy_option_on_change(session_info: InternalState, strategy: str):
+        session_info.pv_strategy = strategy
+    pv_strategy_option.change(pv_strategy_option_on_change, [session_info_state, pv_strategy_option])
+
+    def three_way_partition_option_on_change(session_info: InternalState, value: bool):
+        session_info.three_way_partition = value
+    three_way_partition_option.change(three_way_partition_option_on_change, [session_info_state, three_way_partition_option])
+
+    def use_depth_limit_option_on_change(session_info: InternalState, value: bool):
+        session_info.use_depth_limit = value
+    use_depth_limit_option.change(use_depth_limit_option_on_change, [session_info_state, use_depth_limit_option])
+
+    def gap_sequence_option_on_change(session_info: InternalState, sequence: str):
+        session_info.gap_sequence = sequence
+    gap_sequence_option.change(gap_sequence_option_on_change, [session_info_state, gap_sequence_option])
+
+    def insertion_cutoff_slider_on_change(session_info: InternalState, value: float):
+        session_info.insertion_cutoff = round(value)
+    insertion_cutoff_slider.change(insertion_cutoff_slider_on_change, [session_info_state, insertion_cutoff_slider])
 
     def iteration_interval_slider_on_change(session_info: InternalState, value: float):
         session_info.wait_interval = value
@@ -909,26 +3416,79 @@ with gr.Blocks() as demo:
         chart_info.animate_swaps = animate_swaps
     animate_swaps_option.change(animate_swaps_option_on_change, [chart_info_state, animate_swaps_option])
 
+    def use_playback_option_on_change(session_info: InternalState, use_playback: bool):
+        session_info.use_playback = use_playback
+    use_playback_option.change(use_playback_option_on_change, [session_info_state, use_playback_option])
+
+    # Sends a frame so the chart is redrawn with the new renderer right away, even if nothing is sorting
+    async def renderer_option_on_change(chart_info: VisualState, renderer: str):
+        chart_info.renderer = renderer
+        return chart_info.frame_output()
+    renderer_option.change(renderer_option_on_change, [chart_info_state, renderer_option], [hidden_graph_data])
+
     # end of option row
 
 
     # save point
 
 
-    def snapshot_button_on_click(chart_info: VisualState, session_info: InternalState):
-        session_info.snapshot = chart_info.clone()
-        session_info.snapshot.reset_visuals()
-        return gr.update(interactive=True)
-    snapshot_button.click(snapshot_button_on_click, [chart_info_state, session_info_state], [load_snapshot_button])
+    # Updates for the save point dropdown and the buttons that need a save point
+    def save_point_updates(session_info: InternalState, selected: str | None):
+        names = session_info.save_points.names()
+        has_save_points = len(names) > 0
+        return gr.update(choices=names, value=selected), gr.update(interactive=has_save_points), gr.update(interactive=has_save_points)
+
+    # Async so enforce_memory_budget() runs on the event loop, where the other sessions it compacts are being sorted, instead of in one of gradio's worker threads
+    async def snapshot_button_on_click(chart_info: VisualState, session_info: InternalState, name: str | None):
+        name = (name or "").strip() or session_info.save_points.next_name()
+        session_info.save_points.save(name, chart_info)
+        session_info.touch()
+        enforce_memory_budget()
+        return save_point_updates(session_info, name)
+    snapshot_button.click(snapshot_button_on_click, [chart_info_state, session_info_state, save_point_option], [save_point_option, load_snapshot_button, delete_snapshot_button])
 
-    def load_snapshot_button_on_click(session_info: InternalState):
+    async def load_snapshot_button_on_click(chart_info: VisualState, session_info: InternalState, name: str | None):
         gr.Info("Loading snapshot.. ")  
         session_info.close_lock(session_info.new_lock())
-        # This button isn't interactable until snapshot_button_on_click is called, and it simultaneously asserts session_info.snapshot, therefore it is safe to read at this point
-        yield session_info.snapshot.clone(), session_info.snapshot.to_embedded_json()
-    load_snapshot_button.click(load_snapshot_button_on_click, [session_info_state], [chart_info_state, hidden_graph_data])
+        # The save point can have been deleted, or dropped by enforce_memory_budget() while the session was idle
+        # The restored state has a fresh frame encoder, so its first frame is a keyframe that replaces whatever graph.js was showing
+        loaded = session_info.save_points.load(name) if name else None
+        if loaded is None:
+            gr.Info("That save point doesn't exist anymore (save points are cleared to free memory when a tab is idle)")
+            yield chart_info, gr.skip()
+            return
+        # The renderer and the frame stream belong to the page rather than the saved array, so they stay as they are
+        loaded.renderer = chart_info.renderer
+        loaded.channel_id = chart_info.channel_id
+        session_info.chart = loaded
+        session_info.undo_log.clear()
+        yield loaded, loaded.frame_output()
+    load_snapshot_button.click(load_snapshot_button_on_click, [chart_info_state, session_info_state, save_point_option], [chart_info_state, hidden_graph_data])
+
+    def delete_snapshot_button_on_click(session_info: InternalState, name: str | None):
+        if name:
+            session_info.save_points.delete(name)
+        names = session_info.save_points.names()
+        return save_point_updates(session_info, names[-1] if names else None)
+    delete_snapshot_button.click(delete_snapshot_button_on_click, [session_info_state, save_point_option], [save_point_option, load_snapshot_button, delete_snapshot_button])
 
 
     # end of save point
 
-demo.launch(share=True, head=f"<script defer>{graph_builder_src_js}</script>")
+    # Gives the session a frame stream, and sends graph.js the channel id to subscribe with. This frame always goes through hidden_graph_data
+    # Also registers the session for enforce_memory_budget()
+    async def demo_on_load(chart_info: VisualState, session_info: InternalState):
+        register_session(chart_info, session_info)
+        enforce_memory_budget()
+        chart_info.channel_id = new_channel_id()
+        chart_info.encoder.request_keyframe()
+        frame = chart_info.encoder.encode(chart_info)
+        frame["channel"] = chart_info.channel_id
+        return embed_frame(frame)
+    demo.load(demo_on_load, [chart_info_state, session_info_state], [hidden_graph_data])
+
+# Only launch when run as a script, so the sort generators can be imported without starting a server
+if __name__ == "__main__":
+    server_app, _, _ = demo.launch(share=True, head=f"<script defer>{graph_builder_src_js}</script>", prevent_thread_lock=True)
+    mount_frame_stream(server_app)
+    demo.block_thread()
@@ -0,0 +1,299 @@
+# Benchmarks for the sort generators in app.py. Run with: python benchmark.py [--output results.json] [--compare old_results.json]
+# Importing app builds the gr.Blocks layout but does not launch it, so nothing here starts a server
+
+import argparse
+import json
+import platform
+import random as rand
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from time import perf_counter
+from typing import Any, Callable, Generator
+
+import app
+from app import VisualState, InternalState, sort_algorithms, partition, shuffle_iterative
+
+DEFAULT_SIZES = [10, 100, 500, 1000, 2000]
+DEFAULT_SEED = 121
+USE_NUMPY = False # Set by --numpy: store every chart's array as a numpy int32 array instead of a list
+PIVOT_STRATEGY = "Custom Point" # Set by --pivot-strategy: the quick-sort pivot strategy (one of app.PIVOT_STRATEGIES)
+
+
+# INPUT DISTRIBUTIONS
+# The workloads of app.py (see WORKLOADS), named in lowercase with dashes. They are seeded from the random module, which measure() seeds for every task
+
+def workload_input(workload: str) -> Callable[[int], list[int]]:
+    return lambda n: app.generate_workload(workload, n, use_numpy=False)
+
+distributions: dict[str, Callable[[int], list[int]]] = {workload.lower().replace(" ", "-"): workload_input(workload) for workload in app.WORKLOADS}
+
+def random_input(n: int) -> list[int]:
+    return distributions["random"](n)
+# END OF INPUT DISTRIBUTIONS
+
+
+def new_chart(arr: list[int]) -> VisualState:
+    chart_info = VisualState()
+    chart_info.arr = app.np.array(arr, dtype=app.np.int32) if USE_NUMPY else list(arr)
+    chart_info.reset_visuals()
+    return chart_info
+
+# Drains a generator, returning (number of yields, seconds taken)
+def drain(generator: Generator) -> tuple[int, float]:
+    yields = 0
+    start = perf_counter()
+    for _ in generator:
+        yields += 1
+    return yields, perf_counter() - start
+
+# Runs a measurement `repeat` times on fresh input and keeps the fastest run, which is the least affected by other processes
+def best_of(repeat: int, measure: Callable[[], dict[str, Any]]) -> dict[str, Any]:
+    best = None
+    for _ in range(repeat):
+        result = measure()
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+    return best
+
+def with_rates(yields: int, seconds: float) -> dict[str, Any]:
+    return {
+        "yields": yields,
+        "seconds": seconds,
+        "ops_per_second": yields / seconds if seconds > 0 else None,
+        "seconds_per_yield": seconds / yields if yields > 0 else None,
+    }
+
+
+# BENCHMARKS
+
+def bench_full_sort(name: str, arr: list[int]) -> dict[str, Any]:
+    chart_info = new_chart(arr)
+    session_info = InternalState()
+    session_info.algorithm = name
+    session_info.pv_strategy = PIVOT_STRATEGY
+    yields, seconds = drain(sort_algorithms[name][1](chart_info, session_info))
+    assert app.is_sorted(chart_info.arr), f"{name} did not sort the array"
+
+    stats = chart_info.stats
+    return {
+        **with_rates(yields, seconds),
+        "comparisons": stats.comparisons,
+        "swaps": stats.swaps,
+        "writes": stats.writes,
+        "partitions": stats.partitions,
+    }
+
+def bench_partition(arr: list[int]) -> dict[str, Any]:
+    chart_info = new_chart(arr)
+    if len(arr) < 2:
+        return with_rates(0, 0.0)
+    yields, seconds = drain(partition(chart_info, 0, len(arr) - 1, 1))
+    return with_rates(yields, seconds)
+
+def bench_shuffle(arr: list[int]) -> dict[str, Any]:
+    chart_info = new_chart(arr)
+    yields, seconds = drain(shuffle_iterative(chart_info, 1.0))
+    return with_rates(yields, seconds)
+
+# Average cost of one call, measured over enough calls to take roughly min_seconds
+def time_per_call(call: Callable[[], Any], min_seconds: float = 0.05) -> float:
+    calls = 0
+    start = perf_counter()
+    while True:
+        call()
+        calls += 1
+        elapsed = perf_counter() - start
+        if elapsed >= min_seconds:
+            return elapsed / calls
+
+def bench_serialization(arr: list[int]) -> dict[str, Any]:
+    chart_info = new_chart(arr)
+    n = len(arr)
+
+    def keyframe():
+        chart_info.encoder.request_keyframe()
+        chart_info.to_embedded_json()
+
+    # A typical delta: one swap and a new highlight
+    def delta():
+        if n > 1:
+            chart_info.swap(0, n - 1)
+            chart_info.s0, chart_info.s1 = chart_info.s1, chart_info.s0
+        chart_info.to_embedded_json()
+
+    chart_info.encoder.request_keyframe()
+    keyframe_bytes = len(chart_info.to_embedded_json())
+    if n > 1:
+        chart_info.swap(0, n - 1)
+    delta_bytes = len(chart_info.to_embedded_json())
+
+    return {
+        "keyframe_seconds": time_per_call(keyframe),
+        "keyframe_bytes": keyframe_bytes,
+        "delta_seconds": time_per_call(delta),
+        "delta_bytes": delta_bytes,
+    }
+
+def bench_clone(arr: list[int]) -> dict[str, Any]:
+    chart_info = new_chart(arr)
+
+    # A save point made after one swap, which is stored as a delta against the first one
+    save_points = app.SavePointStore()
+    save_points.save("base", chart_info)
+    if len(arr) > 1:
+        chart_info.swap(0, len(arr) - 1)
+    save_points.save("delta", chart_info)
+
+    return {
+        "clone_seconds": time_per_call(chart_info.clone),
+        "save_point_seconds": time_per_call(lambda: save_points.save("delta", chart_info)),
+        "save_point_bytes": save_points.slots["delta"].nbytes(),
+        "load_save_point_seconds": time_per_call(lambda: save_points.load("delta")),
+    }
+
+# A complete quick-sort recorded for Client-side Playback (a cache miss), against looking it up in a trace cache and decoding the final chart (a hit)
+def bench_trace_cache(arr: list[int]) -> dict[str, Any]:
+    session_info = InternalState()
+    trace_cache = app.TraceCache()
+    key = app.trace_cache_key("trace", new_chart(arr), session_info)
+
+    def miss():
+        trace_cache.put(key, app.record_trace(new_chart(arr), session_info))
+
+    def hit():
+        VisualState.from_bytes(trace_cache.get(key).final)
+
+    miss_seconds = time_per_call(miss)
+    return {
+        "cache_miss_seconds": miss_seconds,
+        "cache_hit_seconds": time_per_call(hit),
+        "trace_bytes": trace_cache.size,
+    }
+
+# END OF BENCHMARKS
+
+
+def get_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=app.APP_DIRECTORY, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+# (kind, name, size, distribution) of one measurement
+Task = tuple[str, str, int, str | None]
+
+# Runs one measurement. The random module is seeded from the seed and the task, so every task gets the same input whether the tasks run one after another or in parallel (--jobs)
+def measure(task: Task, repeat: int, seed: int, use_numpy: bool, pivot_strategy: str) -> dict[str, Any]:
+    global USE_NUMPY, PIVOT_STRATEGY
+    # Worker processes don't share this module's globals
+    USE_NUMPY = use_numpy
+    PIVOT_STRATEGY = pivot_strategy
+    kind, name, size, distribution = task
+    rand.seed(f"{seed}:{kind}:{name}:{size}:{distribution}")
+
+    if kind == "sort":
+        measurements = best_of(repeat, lambda: bench_full_sort(name, distributions[distribution](size)))
+    elif kind == "partition":
+        measurements = best_of(repeat, lambda: bench_partition(distributions[distribution](size)))
+    elif kind == "shuffle":
+        measurements = best_of(repeat, lambda: bench_shuffle(random_input(size)))
+    elif kind == "trace_cache":
+        measurements = bench_trace_cache(random_input(size))
+    elif kind == "serialization":
+        measurements = bench_serialization(random_input(size))
+    else:
+        measurements = bench_clone(random_input(size))
+    return {"kind": kind, "name": name, "size": size, "distribution": distribution, **measurements}
+
+def run(sizes: list[int], distribution_names: list[str], algorithm_names: list[str], repeat: int, seed: int, jobs: int = 1) -> dict[str, Any]:
+    tasks: list[Task] = []
+    for size in sizes:
+        for distribution in distribution_names:
+            for name in algorithm_names:
+                tasks.append(("sort", name, size, distribution))
+            tasks.append(("partition", "partition", size, distribution))
+
+        tasks.append(("shuffle", "shuffle_iterative", size, None))
+        tasks.append(("serialization", "to_embedded_json", size, None))
+        tasks.append(("clone", "clone", size, None))
+        tasks.append(("trace_cache", "record_trace", size, None))
+
+    def report(result: dict[str, Any]):
+        print(f"{result['kind']:>13} {result['name']:<16} n={result['size']:<6} {result['distribution'] or '-':<18} {result.get('seconds', 0):.4f}s", file=sys.stderr)
+
+    results: list[dict[str, Any]] = []
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(measure, task, repeat, seed, USE_NUMPY, PIVOT_STRATEGY) for task in tasks]
+            for future in futures:
+                results.append(future.result())
+                report(results[-1])
+    else:
+        for task in tasks:
+            results.append(measure(task, repeat, seed, USE_NUMPY, PIVOT_STRATEGY))
+            report(results[-1])
+
+    return {
+        "meta": {
+            "revision": get_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version,
+            "platform": platform.platform(),
+            "seed": seed,
+            "repeat": repeat,
+            "numpy": USE_NUMPY,
+            "pivot_strategy": PIVOT_STRATEGY,
+            "jobs": jobs,
+        },
+        "results": results,
+    }
+
+# Prints how much slower (>1) or faster (<1) each measurement is compared to an older results file
+def compare(old: dict[str, Any], new: dict[str, Any]):
+    def key(result: dict[str, Any]):
+        return (result["kind"], result["name"], result["size"], result["distribution"])
+
+    old_results = {key(r): r for r in old["results"]}
+    print(f"Comparing against revision {old['meta'].get('revision')}")
+    for result in new["results"]:
+        previous = old_results.get(key(result))
+        if not previous: continue
+        for metric in ("seconds", "keyframe_seconds", "delta_seconds", "clone_seconds", "save_point_seconds", "load_save_point_seconds", "cache_miss_seconds", "cache_hit_seconds"):
+            if result.get(metric) and previous.get(metric):
+                ratio = result[metric] / previous[metric]
+                print(f"{result['kind']:>13} {result['name']:<16} n={result['size']:<6} {result['distribution'] or '-':<18} {metric:<17} x{ratio:.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the sort generators in app.py")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--distributions", nargs="+", default=list(distributions.keys()), choices=list(distributions.keys()))
+    parser.add_argument("--algorithms", nargs="+", default=list(sort_algorithms.keys()), choices=list(sort_algorithms.keys()))
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per measurement; the fastest is kept")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="An older results file to compare against")
+    parser.add_argument("--numpy", action="store_true", help="Store the arrays as numpy int32 arrays instead of lists")
+    parser.add_argument("--pivot-strategy", default=app.PIVOT_STRATEGIES[0], choices=app.PIVOT_STRATEGIES, help="Quick-sort pivot strategy. The median-of-3-killer distribution is the bad case of Median-of-Three")
+    parser.add_argument("--jobs", type=int, default=1, help="Run the measurements in this many worker processes. Faster, but the timings are noisier when the processes share cores")
+    args = parser.parse_args()
+
+    global USE_NUMPY, PIVOT_STRATEGY
+    PIVOT_STRATEGY = args.pivot_strategy
+    if args.numpy:
+        if app.np is None:
+            parser.error("--numpy needs numpy installed")
+        USE_NUMPY = True
+
+    results = run(args.sizes, args.distributions, args.algorithms, args.repeat, args.seed, args.jobs)
+    with open(args.output, "w") as output_file:
+        json.dump(results, output_file, indent=1)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, "r") as old_file:
+            compare(json.load(old_file), results)
+
+if __name__ == "__main__":
+    main()
@@ -89,6 +89,20 @@ class Color {
 
 //  Constants translated with AI from PYTHON
 const MINIMUM_ANIMATION_DT = 0.03
+const FRAME_PROTOCOL_VERSION = 2;
+
+// Trace op codes, every op is 3 int32 values: [op, a, b]. -1 means null
+const OP_FRAME = 0;
+const OP_RANGE = 1;
+const OP_PIVOT = 2;
+const OP_COMPARE = 3;
+const OP_SWAP_INTENT = 4;
+const OP_SWAP = 5;
+const OP_PARTITIONING = 6;
+const OP_WRITE = 7;
+const OP_BUFFER = 8;
+const OP_BUFFER_HEAD = 9;
+const TRACE_OP_WIDTH = 3;
 
 const SWAPPING_ELEMENT_COLOR = new Color(80, 255, 80);
 const GREATER_ELEMENT_COLOR = new Color(255, 80, 80);
@@ -98,6 +112,28 @@ const DEFAULT_ELEMENT_COLOR = Color.fromHex("#c4c8db");
 const PIVOT_ELEMENT_COLOR = new Color(255,255,80);
 const HIGHLIGHT_STRENGTH = 0.4;
 
+// Every colour a bar can have, precomputed so rendering doesn't lerp or format colours per bar.
+// Each base colour is followed by HIGHLIGHT_LEVELS - 1 increasingly highlighted versions of it, so highlighted(color) is color + 1
+const HIGHLIGHT_LEVELS = 3;
+const PALETTE_BASE_COLORS = [DEFAULT_ELEMENT_COLOR, LESSER_ELEMENT_COLOR, GREATER_ELEMENT_COLOR, PIVOT_ELEMENT_COLOR, SWAPPING_ELEMENT_COLOR];
+const COLOR_DEFAULT = 0 * HIGHLIGHT_LEVELS;
+const COLOR_LESSER = 1 * HIGHLIGHT_LEVELS;
+const COLOR_GREATER = 2 * HIGHLIGHT_LEVELS;
+const COLOR_PIVOT = 3 * HIGHLIGHT_LEVELS;
+const COLOR_SWAPPING = 4 * HIGHLIGHT_LEVELS;
+const PALETTE_HEX = [];
+for (const base of PALETTE_BASE_COLORS) {
+    let color = base;
+    for (let level = 0; level < HIGHLIGHT_LEVELS; level++) {
+        PALETTE_HEX.push(color.toHex());
+        color = color.lerp(HIGHLIGHT_COLOR, HIGHLIGHT_STRENGTH);
+    }
+}
+
+function highlighted(color) {
+    return Math.min(color + 1, color - color % HIGHLIGHT_LEVELS + HIGHLIGHT_LEVELS - 1);
+}
+
 const MAX_BORDER_RADIUS = 16;
 const TOTAL_HEIGHT_PX = 200;
 const TOTAL_WIDTH_PX = 2000;
@@ -105,6 +141,13 @@ const SWAP_ANIMATION_Y_OFFSET = 0.25
 // End of AI Translation
 let bar_width_memo = {};     // same semantics as Python
 
+// Incremental rendering state. applyFrame and the trace playback record what changed, and updateBars only restyles that
+let changedIndices = new Set(); // Indices of frameModel.arr that changed since the last render
+let renderedBars = null; // What updateBars drew last: { length, maxVal, colors (palette index per bar), pivotVal, pv, s0, s1, i0, i1, partitioning }, or null to redraw everything
+let maxValue = 4; // Largest value in frameModel.arr
+let maxValueCount = 0; // How many elements are equal to maxValue
+let maxValueStale = true; // Whether maxValue has to be recomputed
+
 function assert(condition, message) { // functions like the lua 'assert' function
     if (!condition) {
         console.error(message || "Assertion failed! (No message provided)");
@@ -226,6 +269,7 @@ let dataHolderElement; // Group 2 (Main)
 let graphElement; // Group 1 (Main)
 let barContainer; // Group 1
 let graphOverlay; // Group 1
+let statsElement; // Group 3
 
 // Copies an element to the graphOverlay DOM
 // Function Generated by ChatGPT
@@ -256,16 +300,13 @@ function copyElementToOverlay(original) { // Used ChatGPT Level 4 to generate th
     return clone;
 }
 
-// Functions that require the above elements
-function updateBars(data) {
-    assert(barContainer, "Bar container not ready!");
-    const arr = data.arr;
-    const length = arr.length;
-    
+// Returns [widthPerBar, borderRadius] for a chart with 'length' bars
+function getBarLayout(length) {
+    // Try cached layout. The border radius is cached too, because it depends on how many times it was halved
+    if (bar_width_memo[length]) return bar_width_memo[length];
+
     let borderRadius = MAX_BORDER_RADIUS;
-    
-    // Try cached width
-    let widthPerBar = bar_width_memo[length] || borderRadius * 2;
+    let widthPerBar = borderRadius * 2;
     
     // While width is too small, reduce border radius
     while (widthPerBar <= borderRadius * 2) {
@@ -277,64 +318,228 @@ function updateBars(data) {
     }
     
     // Cache the result
-    bar_width_memo[length] = widthPerBar;
-    
-    // Update dynamic properties of the container div
-    barContainer.style.gap = `${borderRadius}px`;
+    bar_width_memo[length] = [widthPerBar, borderRadius];
+    return bar_width_memo[length];
+}
+
+// Creates or removes bar elements until there are exactly 'length' of them
+function setBarCount(length) {
+    while (barContainer.children.length < length) {
+        barContainer.appendChild(document.createElement("div"));
+    }
+    // Another solution is to just hide extra bars
+    while (barContainer.children.length > length) {
+        barContainer.removeChild(barContainer.lastChild);
+    }
+}
+
+// Colour (palette index) of the bar for element i. Shared by both renderers
+function getElementColor(data, i, pivotVal) {
+    const arr = data.arr;
+    let color = COLOR_DEFAULT;
     
-    // Compute height scaling
-    let maxVal = Math.max(Math.max(...arr, 4), 4);
-    let heightFactor = 1 / maxVal;
+    if (data.partitioning) {
+        if (i === data.pv) {
+            color = COLOR_PIVOT;
+        } else if (i >= data.i0 && i < data.i1) {
+            // within range
+            color = (pivotVal < arr[i]) ? COLOR_GREATER : COLOR_LESSER;
+        }
+    }
     
-    let pivotVal = null;
-    if (data.pv !== null && data.pv !== undefined)
-        pivotVal = arr[data.pv];
-
-    // Build/update bars
-    for (let i = 0; i < arr.length; i++) {
-        const v = arr[i];
-        const height = Math.floor(v * heightFactor * 100);
-        
-        let color = null;
-        
-        if (data.partitioning) {
-            if (i === data.pv) {
-                color = PIVOT_ELEMENT_COLOR;
-            } else if (i >= data.i0 && i < data.i1) {
-                // within range
-                color = (pivotVal < arr[i]) ? GREATER_ELEMENT_COLOR : LESSER_ELEMENT_COLOR;
+    // Highlight on swap
+    if (i === data.s0 || i === data.s1) {
+        if (data.swapping) {
+            if (!data.animate_swaps || data.s1 === null) { // Only change the colour if the swap isn't animated. A write (merge and radix sort) only has s0, and is never animated
+                color = COLOR_SWAPPING;
             }
+        } else {
+            color = highlighted(color);
         }
+    }
+    return color;
+}
 
-        if (!color) color = DEFAULT_ELEMENT_COLOR;
-        
-        // Highlight on swap
-        if (i === data.s0 || i === data.s1) {
-            if (data.swapping) {
-                if (!data.animate_swaps) { // Only change the colour if the swap isn't animated
-                    color = SWAPPING_ELEMENT_COLOR;
-                }
-            } else {
-                color = color.lerp(HIGHLIGHT_COLOR, HIGHLIGHT_STRENGTH);
+// Colour (palette index) of the bar for bucket b, where highlightedBuckets is [pivot bucket, s0 bucket, s1 bucket]. Shared by both renderers
+function getBucketColor(data, b, highlightedBuckets) {
+    const size = data.bucket_size;
+    const first = b * size;
+    const mean = data.buckets[b * 3 + 2];
+
+    let color = COLOR_DEFAULT;
+    if (data.partitioning) {
+        if (b === highlightedBuckets[0]) {
+            color = COLOR_PIVOT;
+        } else if (first < data.i1 && first + size > data.i0) {
+            // overlaps the range
+            color = (data.pv_value < mean) ? COLOR_GREATER : COLOR_LESSER;
+        }
+    }
+
+    // Swaps aren't animated between buckets
+    if (b === highlightedBuckets[1] || b === highlightedBuckets[2]) {
+        color = data.swapping ? COLOR_SWAPPING : highlighted(color);
+    }
+    return color;
+}
+
+// Returns [pivot bucket, s0 bucket, s1 bucket], the buckets that contain a highlighted index
+function getHighlightedBuckets(data) {
+    const bucketOf = (i) => (i === null || i === undefined) ? null : Math.floor(i / data.bucket_size);
+    return [bucketOf(data.pv), bucketOf(data.s0), bucketOf(data.s1)];
+}
+
+// Largest bucket max, which the bucket heights are scaled to
+function getBucketsMaxValue(buckets) {
+    let maxVal = 4;
+    for (let i = 1; i < buckets.length; i += 3) {
+        maxVal = Math.max(maxVal, buckets[i]);
+    }
+    return maxVal;
+}
+
+function getPivotValue(data) {
+    if (data.pv !== null && data.pv !== undefined) return data.arr[data.pv];
+    return null;
+}
+
+// Largest value in frameModel.arr (at least 4), which the bar heights are scaled to. Only rescans the array after the largest value was overwritten
+function getMaxValue(arr) {
+    if (maxValueStale) {
+        maxValue = 4;
+        maxValueCount = 0;
+        for (let i = 0; i < arr.length; i++) {
+            const v = arr[i];
+            if (v > maxValue) {
+                maxValue = v;
+                maxValueCount = 1;
+            } else if (v === maxValue) {
+                maxValueCount++;
             }
         }
+        maxValueStale = maxValueCount === 0;
+    }
+    return maxValue;
+}
 
-        let barElement = barContainer.children[i]
-        
-        if (!barElement) {
-            barElement = document.createElement("div");
-            barContainer.appendChild(barElement); // appending works because the for loop starts from index 0, so previous iterations validate that there are at least (i - 1) children        }
+// Keeps maxValue up to date when an element of frameModel.arr changes from oldValue to newValue
+function noteValueChange(oldValue, newValue) {
+    if (maxValueStale) return;
+    if (newValue > maxValue) {
+        maxValue = newValue;
+        maxValueCount = 1;
+    } else if (newValue === maxValue) {
+        maxValueCount++;
+    }
+    if (oldValue === maxValue) {
+        maxValueCount--;
+        if (maxValueCount === 0) maxValueStale = true;
+    }
+}
+
+// Functions that require the above elements
+
+// Adds the indices start..end - 1 (clamped to the array) to a set
+function addRange(set, start, end, length) {
+    for (let i = Math.max(start, 0); i < Math.min(end, length); i++) {
+        set.add(i);
+    }
+}
+
+// Only restyles the bars whose height or colour changed since the last call: the changed indices, the old and new highlights,
+// and the parts of the partitioning range that moved. Everything is restyled when the array's length or largest value changes
+function updateBars(data) {
+    assert(barContainer, "Bar container not ready!");
+    const arr = data.arr;
+    const length = arr.length;
+    
+    const [widthPerBar, borderRadius] = getBarLayout(length);
+    const maxVal = getMaxValue(arr);
+    const pivotVal = getPivotValue(data);
+    const bars = barContainer.children;
+    let previous = renderedBars;
+
+    // Bars that need a new height, and bars that may need a new colour
+    let resized = changedIndices;
+    const recolored = new Set();
+    const heightFactor = 1 / maxVal;
+
+    if (!previous || previous.length !== length || previous.maxVal !== maxVal) {
+        setBarCount(length);
+        // Update dynamic properties of the container div
+        barContainer.style.gap = `${borderRadius}px`;
+        for (let i = 0; i < length; i++) {
+            bars[i].style.width = `${widthPerBar}px`;
+            bars[i].style.height = `${Math.floor(arr[i] * heightFactor * 100)}%`;
+            bars[i].style.borderRadius = `${borderRadius}px`;
+        }
+        previous = { colors: new Int16Array(length).fill(-1) };
+        resized = [];
+        addRange(recolored, 0, length, length);
+    } else {
+        for (const i of changedIndices) recolored.add(i);
+        for (const i of [previous.s0, previous.s1, previous.pv, data.s0, data.s1, data.pv]) {
+            if (i !== null && i !== undefined && i < length) recolored.add(i);
         }
+
+        if (previous.partitioning !== data.partitioning || previous.pivotVal !== pivotVal) {
+            // Every bar in the range is compared to the pivot
+            if (previous.partitioning) addRange(recolored, previous.i0, previous.i1, length);
+            if (data.partitioning) addRange(recolored, data.i0, data.i1, length);
+        } else if (data.partitioning) {
+            // Only the bars that entered or left the range
+            addRange(recolored, Math.min(previous.i0, data.i0), Math.max(previous.i0, data.i0), length);
+            addRange(recolored, Math.min(previous.i1, data.i1), Math.max(previous.i1, data.i1), length);
+        }
+    }
+
+    for (const i of resized) {
+        if (i < length) bars[i].style.height = `${Math.floor(arr[i] * heightFactor * 100)}%`;
+    }
+
+    const colors = previous.colors;
+    for (const i of recolored) {
+        const color = getElementColor(data, i, pivotVal);
+        if (color !== colors[i]) {
+            colors[i] = color;
+            bars[i].style.background = PALETTE_HEX[color];
+        }
+    }
+
+    changedIndices.clear();
+    renderedBars = {
+        length: length, maxVal: maxVal, colors: colors, pivotVal: pivotVal,
+        pv: data.pv, s0: data.s0, s1: data.s1, i0: data.i0, i1: data.i1, partitioning: data.partitioning,
+    };
+}
+
+// Draws an array that the server sent as buckets (see get_bucket_size in app.py). data.buckets is a flat [min, max, mean, ...] list,
+// and each bar covers data.bucket_size elements. A bar is as tall as its largest element, and the part above its smallest element is drawn lighter
+function updateBuckets(data) {
+    assert(barContainer, "Bar container not ready!");
+    const buckets = data.buckets;
+    const length = buckets.length / 3;
+
+    const [widthPerBar, borderRadius] = getBarLayout(length);
+    setBarCount(length);
+    barContainer.style.gap = `${borderRadius}px`;
+    // The bars are restyled here, so updateBars can't rely on what it drew before
+    renderedBars = null;
+
+    const heightFactor = 1 / getBucketsMaxValue(buckets);
+    const highlightedBuckets = getHighlightedBuckets(data);
+
+    for (let b = 0; b < length; b++) {
+        const low = buckets[b * 3], high = buckets[b * 3 + 1];
+        const color = getBucketColor(data, b, highlightedBuckets);
+        const lowPercent = Math.floor(low / high * 100);
+
+        const barElement = barContainer.children[b];
         barElement.style.width = `${widthPerBar}px`;
-        barElement.style.height = `${height}%`;
-        barElement.style.backgroundColor = color.toHex();
+        barElement.style.height = `${Math.floor(high * heightFactor * 100)}%`;
+        barElement.style.background = `linear-gradient(to top, ${PALETTE_HEX[color]} ${lowPercent}%, ${PALETTE_HEX[highlighted(color)]} ${lowPercent}%)`;
         barElement.style.borderRadius = `${borderRadius}px`;
     }
-    
-    // Remove excess bars. Another solution is to just hide extra bars
-    while (barContainer.children.length > arr.length) {
-        barContainer.removeChild(barContainer.lastChild);
-    }
 }
 // Function generated by AI
 function swapDom(a, b) {
@@ -376,6 +581,13 @@ function animateSwap(index1, index2, duration) {
     // requestAnimationFrame(() => {
         swapDom(originalBar1, originalBar2);
     // });
+    // The bars' colours moved with them, and the next frame restyles both
+    if (renderedBars) {
+        const colors = renderedBars.colors;
+        [colors[index1], colors[index2]] = [colors[index2], colors[index1]];
+    }
+    changedIndices.add(index1);
+    changedIndices.add(index2);
 
     // Keep track of how many animations are being run on this bar; only the final animation's onComplete callback should set visibility=true,
     // otherwise the element will be visible again too early
@@ -404,49 +616,808 @@ function animateSwap(index1, index2, duration) {
     
 }
 
+// PERMUTATION ANIMATION
+// A shuffle moves many elements at once, which the server sends as one permutation (see permutation_cycles in app.py) instead of as separate swaps.
+// The bars are put in their new order right away, and every moved bar is animated from its old place to its new one (FLIP),
+// so the browser runs one transform animation per bar instead of cloning a pair of overlay bars per swap
+
+// Calls onMove(from, to) for every element the permutation moves. cycles is the flat [length, index, ..., length, index, ...] list from the server,
+// where the element at each index of a cycle moves to the next index
+function forEachPermutationMove(cycles, onMove) {
+    let i = 0;
+    while (i < cycles.length) {
+        const first = i + 1;
+        const last = i + cycles[i];
+        for (let j = first; j < last; j++) onMove(cycles[j], cycles[j + 1]);
+        onMove(cycles[last], cycles[first]);
+        i = last + 1;
+    }
+}
+
+// Vertical offset of a bar halfway through moving 'distance' pixels. Bars moving right go up and bars moving left go down, like the two bars of a swap
+function getMoveArc(distance) {
+    return -Math.sign(distance) * SWAP_ANIMATION_Y_OFFSET * Math.pow(Math.abs(distance), 0.75);
+}
+
+function animatePermutation(cycles, duration) {
+    assert(barContainer, "Bar container not ready!");
+    const bars = Array.from(barContainer.children);
+    const [widthPerBar, borderRadius] = getBarLayout(bars.length);
+    const step = widthPerBar + borderRadius;
+
+    // The bars' colours move with them, and the next frame restyles the moved bars
+    const colors = renderedBars ? renderedBars.colors : null;
+    const oldColors = colors ? colors.slice() : null;
+    const order = bars.slice();
+    const moves = [];
+    forEachPermutationMove(cycles, (from, to) => {
+        order[to] = bars[from];
+        if (colors) colors[to] = oldColors[from];
+        changedIndices.add(to);
+        moves.push(from, to);
+    });
+    barContainer.replaceChildren(...order);
+    if (duration < MINIMUM_ANIMATION_DT * 1000) return;
+
+    for (let i = 0; i < moves.length; i += 2) {
+        const distance = (moves[i + 1] - moves[i]) * step;
+        order[moves[i + 1]].animate([
+            { transform: `translate(${-distance}px, 0px)` },
+            { transform: `translate(${-distance / 2}px, ${getMoveArc(distance)}px)` },
+            { transform: "translate(0px, 0px)" },
+        ], { duration: duration, easing: "ease-in-out" });
+    }
+}
+// END OF PERMUTATION ANIMATION
+
+// CANVAS RENDERER
+// Draws the whole chart on one <canvas> instead of one div per bar, which avoids thousands of style writes and reflows per frame for large arrays.
+// Swaps are drawn as the two bars moving between their positions, instead of with cloned overlay elements
+
+const RENDERER_CANVAS = "Canvas"; // SYNC THIS WITH PY (RENDERERS)
+
+let graphCanvas; // Group 1
+let canvasContext; // Group 1
+let canvasData = null; // The frame the canvas shows
+let canvasSwaps = []; // Swap animations in progress: { a, b, valueA, valueB, colorA, colorB, start, duration }
+let canvasPermutation = null; // Permutation animation in progress: { moves (flat [from, to, ...]), values, colors, length, start, duration }
+let canvasDrawRequested = false;
+
+// Matches a canvas' resolution to its size on the page. Drawing happens in a TOTAL_WIDTH_PX wide space (like the DOM renderer), scaled to fit
+function resizeCanvas(canvas = graphCanvas, context = canvasContext, cssHeight = TOTAL_HEIGHT_PX) {
+    const ratio = window.devicePixelRatio || 1;
+    const cssWidth = canvas.clientWidth || TOTAL_WIDTH_PX;
+    const width = Math.round(cssWidth * ratio);
+    const height = Math.round(cssHeight * ratio);
+    if (canvas.width !== width || canvas.height !== height) {
+        canvas.width = width;
+        canvas.height = height;
+    }
+    context.setTransform(ratio * cssWidth / TOTAL_WIDTH_PX, 0, 0, ratio, 0, 0);
+}
+
+function fillBar(x, y, width, height, radius, context = canvasContext) {
+    if (radius > 0 && context.roundRect) {
+        context.beginPath();
+        context.roundRect(x, y, width, height, radius);
+        context.fill();
+    } else {
+        context.fillRect(x, y, width, height);
+    }
+}
+
+// Returns [left edge of the first bar, distance between bars] for the same centred layout as the DOM renderer's flex container
+function getCanvasBarPositions(length, widthPerBar, gap) {
+    const step = widthPerBar + gap;
+    return [(TOTAL_WIDTH_PX - (length * step - gap)) / 2, step];
+}
+
+function drawCanvasBars(data) {
+    const arr = data.arr;
+    const length = arr.length;
+    const [widthPerBar, borderRadius] = getBarLayout(length);
+    const [left, step] = getCanvasBarPositions(length, widthPerBar, borderRadius);
+    const heightFactor = TOTAL_HEIGHT_PX / getMaxValue(arr);
+    const pivotVal = getPivotValue(data);
+
+    // Bars that are being swapped are drawn by their animation instead
+    const now = performance.now();
+    canvasSwaps = canvasSwaps.filter((swap) => now < swap.start + swap.duration && swap.a < length && swap.b < length);
+    const moving = new Set();
+    for (const swap of canvasSwaps) {
+        moving.add(swap.a);
+        moving.add(swap.b);
+    }
+    const permutation = canvasPermutation;
+    if (permutation && (now >= permutation.start + permutation.duration || permutation.length !== length)) {
+        canvasPermutation = null;
+    } else if (permutation) {
+        // Every index a permutation moves to is also one it moves from, so these are all the bars it moves
+        for (let i = 1; i < permutation.moves.length; i += 2) moving.add(permutation.moves[i]);
+    }
+
+    for (let i = 0; i < length; i++) {
+        if (moving.has(i)) continue;
+        const height = Math.floor(arr[i] * heightFactor);
+        canvasContext.fillStyle = PALETTE_HEX[getElementColor(data, i, pivotVal)];
+        fillBar(left + i * step, TOTAL_HEIGHT_PX - height, widthPerBar, height, borderRadius);
+    }
+
+    // Same motion as animateSwapElements: across to the other bar's position, and along a wave vertically
+    for (const swap of canvasSwaps) {
+        const t = easeInOutExpo(Math.min((now - swap.start) / swap.duration, 1));
+        const x1 = left + swap.a * step;
+        const deltaX = (swap.b - swap.a) * step;
+        const dy = -wave(t) * SWAP_ANIMATION_Y_OFFSET * Math.pow(Math.abs(deltaX), 0.75);
+
+        const height1 = Math.floor(swap.valueA * heightFactor);
+        canvasContext.fillStyle = swap.colorA;
+        fillBar(x1 + deltaX * t, TOTAL_HEIGHT_PX - height1 + dy, widthPerBar, height1, borderRadius);
+
+        const height2 = Math.floor(swap.valueB * heightFactor);
+        canvasContext.fillStyle = swap.colorB;
+        fillBar(x1 + deltaX - deltaX * t, TOTAL_HEIGHT_PX - height2 - dy, widthPerBar, height2, borderRadius);
+    }
+
+    // Same motion as animatePermutation: across to the new position, along an arc
+    if (canvasPermutation) {
+        const t = easeInOutQuad(Math.min((now - permutation.start) / permutation.duration, 1));
+        const moves = permutation.moves;
+        for (let i = 0; i < moves.length; i += 2) {
+            const distance = (moves[i + 1] - moves[i]) * step;
+            const height = Math.floor(permutation.values[i / 2] * heightFactor);
+            canvasContext.fillStyle = permutation.colors[i / 2];
+            fillBar(left + moves[i] * step + distance * t, TOTAL_HEIGHT_PX - height + wave(t) * getMoveArc(distance), widthPerBar, height, borderRadius);
+        }
+    }
+}
+
+// Same look as updateBuckets: as tall as the bucket's max, lighter above its min
+function drawCanvasBuckets(data) {
+    const buckets = data.buckets;
+    const length = buckets.length / 3;
+    const [widthPerBar, borderRadius] = getBarLayout(length);
+    const [left, step] = getCanvasBarPositions(length, widthPerBar, borderRadius);
+    const heightFactor = TOTAL_HEIGHT_PX / getBucketsMaxValue(buckets);
+    const highlightedBuckets = getHighlightedBuckets(data);
+
+    for (let b = 0; b < length; b++) {
+        const color = getBucketColor(data, b, highlightedBuckets);
+        const x = left + b * step;
+        const lowHeight = Math.floor(buckets[b * 3] * heightFactor);
+        const highHeight = Math.floor(buckets[b * 3 + 1] * heightFactor);
+
+        canvasContext.fillStyle = PALETTE_HEX[highlighted(color)];
+        canvasContext.fillRect(x, TOTAL_HEIGHT_PX - highHeight, widthPerBar, highHeight - lowHeight);
+        canvasContext.fillStyle = PALETTE_HEX[color];
+        canvasContext.fillRect(x, TOTAL_HEIGHT_PX - lowHeight, widthPerBar, lowHeight);
+    }
+}
+
+function drawCanvas() {
+    assert(canvasContext, "Graph canvas not ready!");
+    const data = canvasData;
+    if (!data) return;
+
+    resizeCanvas();
+    canvasContext.clearRect(0, 0, TOTAL_WIDTH_PX, TOTAL_HEIGHT_PX);
+    if (data.buckets) {
+        drawCanvasBuckets(data);
+    } else {
+        drawCanvasBars(data);
+    }
+    // Keep redrawing until the swap animations finish
+    if (canvasSwaps.length > 0 || canvasPermutation) requestCanvasDraw();
+}
+
+// Draws on the next display frame, at most once per display frame
+function requestCanvasDraw() {
+    if (canvasDrawRequested) return;
+    canvasDrawRequested = true;
+    requestAnimationFrame(() => {
+        canvasDrawRequested = false;
+        drawCanvas();
+    });
+}
+
+// Canvas version of animateSwap. The moving bars keep the value and colour they had when the swap started
+function animateCanvasSwap(index1, index2, duration) {
+    const data = canvasData;
+    if (duration < MINIMUM_ANIMATION_DT * 1000) return;
+    const pivotVal = getPivotValue(data);
+    canvasSwaps.push({
+        a: index1,
+        b: index2,
+        valueA: data.arr[index1],
+        valueB: data.arr[index2],
+        colorA: PALETTE_HEX[getElementColor(data, index1, pivotVal)],
+        colorB: PALETTE_HEX[getElementColor(data, index2, pivotVal)],
+        start: performance.now(),
+        duration: duration,
+    });
+}
+
+// Canvas version of animatePermutation. The moving bars keep the value and colour they had when the permutation started
+function animateCanvasPermutation(cycles, duration) {
+    const data = canvasData;
+    if (duration < MINIMUM_ANIMATION_DT * 1000) return;
+    const pivotVal = getPivotValue(data);
+    const moves = [], values = [], colors = [];
+    forEachPermutationMove(cycles, (from, to) => {
+        moves.push(from, to);
+        values.push(data.arr[from]);
+        colors.push(PALETTE_HEX[getElementColor(data, from, pivotVal)]);
+    });
+    canvasPermutation = {
+        moves: moves,
+        values: values,
+        colors: colors,
+        length: data.arr.length,
+        start: performance.now(),
+        duration: duration,
+    };
+}
+
+function updateCanvas(data) {
+    canvasData = data;
+    // The canvas is redrawn completely, so it doesn't need the changed indices
+    changedIndices.clear();
+    if (data.animate_swaps && !data.buckets) {
+        if (data.swapping && data.s1 !== null) animateCanvasSwap(data.s0, data.s1, data.dt * 1000);
+        if (data.permutation) animateCanvasPermutation(data.permutation, data.dt * 1000);
+    }
+    drawCanvas();
+}
+
+let activeRenderer = null;
+
+// Shows the element of the renderer the frame asks for, and hides the other one
+function setRenderer(renderer) {
+    if (renderer === activeRenderer) return;
+    activeRenderer = renderer;
+    const useCanvas = renderer === RENDERER_CANVAS;
+    barContainer.style.display = useCanvas ? "none" : "flex";
+    graphCanvas.style.display = useCanvas ? "block" : "none";
+    if (!useCanvas) {
+        canvasData = null;
+        canvasSwaps = [];
+        canvasPermutation = null;
+        // The bars weren't updated while the canvas was shown
+        renderedBars = null;
+    }
+}
+// END OF CANVAS RENDERER
+
+// [key in frame stats, label]
+const STATS_LABELS = [
+    ["comparisons", "Comparisons"],
+    ["swaps", "Swaps"],
+    ["writes", "Array Writes"],
+    ["partitions", "Partitions"],
+    ["jobs", "Jobs Finished"],
+    ["yields", "Steps"],
+    ["step_ms", "Server Step Time (ms)"],
+    ["serialize_ms", "Server Serialization Time (ms)"],
+    ["sleep_ms", "Server Wait Time (ms)"],
+    // Only sent with traces (Client-side Playback). Counted over every session
+    ["trace_cache_hits", "Trace Cache Hits"],
+    ["trace_cache_misses", "Trace Cache Misses"],
+];
+let statsCells = null; // Value cell of each entry in STATS_LABELS
+let renderedStats = null;
+
+// Shows the stats that came with the latest frame in the stats panel
+function updateStats(stats) {
+    if (!statsElement || !stats || stats === renderedStats) return;
+    renderedStats = stats;
+
+    if (!statsCells) {
+        const table = document.createElement("table");
+        statsCells = [];
+        for (const [key, label] of STATS_LABELS) {
+            const row = table.insertRow();
+            row.insertCell().textContent = label;
+            statsCells.push(row.insertCell());
+        }
+        statsElement.appendChild(table);
+    }
+    for (let i = 0; i < STATS_LABELS.length; i++) {
+        const value = stats[STATS_LABELS[i][0]];
+        statsCells[i].textContent = value === undefined ? "-" : value.toLocaleString();
+    }
+}
+
 // Handles updating the chart based on new data
 function update(data) {
     
     assert(graphElement, `Graph container element not found; are you using "graph" as the element ID?`);
+    showRace(false);
+    setRenderer(data.renderer);
+    updateStats(data.stats);
+    drawBufferLane(data);
+    if (data.renderer === RENDERER_CANVAS) {
+        updateCanvas(data);
+        return;
+    }
+
     // update bar appearance
-    updateBars(data);
+    if (data.buckets) {
+        updateBuckets(data);
+    } else {
+        updateBars(data);
+    }
     
     
-    if (data.animate_swaps) {
+    if (data.animate_swaps && !data.buckets) {
         // handle focused swap
-        if (data.swapping) animateSwap(data.s0, data.s1, data.dt * 1000);
+        if (data.swapping && data.s1 !== null) animateSwap(data.s0, data.s1, data.dt * 1000);
         
-        // handle bulk swaps
-        
-        if (data.bulk_swap) {
-            for (let i = 0; i < data.bulk_swap.length; i++) {
-                animateSwap(data.bulk_swap[i][0], data.bulk_swap[i][1], data.dt * 1000);
+        // handle elements that all move at once (shuffles)
+        if (data.permutation) animatePermutation(data.permutation, data.dt * 1000);
+    }
+}
+
+// Client-side copy of the server's VisualState. Keyframes replace it, delta frames patch it
+let frameModel = { arr: [] };
+let lastFrameSeq = null;
+
+// Records which elements a keyframe changes. Keyframes are sent regularly even when little changed, so they're compared with the old array instead of redrawing everything
+function noteKeyframe(oldArr, newArr) {
+    if (!oldArr || !newArr || oldArr.length !== newArr.length) {
+        renderedBars = null;
+        maxValueStale = true;
+        changedIndices.clear();
+        return;
+    }
+    for (let i = 0; i < newArr.length; i++) {
+        if (oldArr[i] !== newArr[i]) {
+            noteValueChange(oldArr[i], newArr[i]);
+            changedIndices.add(i);
+        }
+    }
+}
+
+// Decodes base64 into bytes
+function decodeBase64(encoded) {
+    const binary = atob(encoded);
+    const bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) {
+        bytes[i] = binary.charCodeAt(i);
+    }
+    return bytes;
+}
+
+// Lists that the server may send packed as base64 little-endian uint16s (see PACK_ARRAYS in app.py)
+const PACKED_FRAME_KEYS = ["arr", "buckets", "permutation", "buffer"];
+
+// Replaces packed lists in a frame with Uint16Arrays, which view the decoded bytes without copying them again
+function unpackFrame(frame) {
+    for (const key of PACKED_FRAME_KEYS) {
+        if (typeof frame[key] === "string") {
+            frame[key] = new Uint16Array(decodeBase64(frame[key]).buffer);
+        }
+    }
+}
+
+// Applies a delta frame to a model. onSet(index, oldValue, newValue), if given, is called for every element that changes
+function applyDelta(model, frame, onSet) {
+    for (const key in frame) {
+        if (key === "set" || key === "bset" || key === "key" || key === "v") continue;
+        model[key] = frame[key];
+    }
+
+    // "set" is a flat list of index/value pairs
+    const changes = frame.set;
+    if (changes) {
+        const arr = model.arr;
+        for (let i = 0; i < changes.length; i += 2) {
+            const index = changes[i];
+            if (onSet) onSet(index, arr[index], changes[i + 1]);
+            arr[index] = changes[i + 1];
+        }
+    }
+
+    // "bset" is a flat list of [bucket, min, max, mean] for arrays that are sent as buckets
+    const bucketChanges = frame.bset;
+    if (bucketChanges) {
+        const buckets = model.buckets;
+        for (let i = 0; i < bucketChanges.length; i += 4) {
+            const b = bucketChanges[i] * 3;
+            buckets[b] = bucketChanges[i + 1];
+            buckets[b + 1] = bucketChanges[i + 2];
+            buckets[b + 2] = bucketChanges[i + 3];
+        }
+    }
+}
+
+// Records an element of frameModel that a delta changed, for the incremental renderers
+function noteSet(index, oldValue, newValue) {
+    noteValueChange(oldValue, newValue);
+    changedIndices.add(index);
+}
+
+// Applies a keyframe or a delta frame to frameModel and returns the model
+function applyFrame(frame) {
+    unpackFrame(frame);
+    // Frames without a version are full states from the old protocol, which are treated as keyframes
+    if (frame.v === undefined || frame.key) {
+        noteKeyframe(frameModel.arr, frame.arr);
+        frameModel = frame;
+        lastFrameSeq = frame.seq;
+        return frameModel;
+    }
+    assert(frame.v === FRAME_PROTOCOL_VERSION, `Unsupported frame protocol version ${frame.v}`);
+
+    if (lastFrameSeq !== null && frame.seq !== lastFrameSeq + 1) {
+        // The model is stale until the next keyframe arrives, but applying the delta anyway keeps it as close as possible
+        console.warn(`Missed frames (expected seq ${lastFrameSeq + 1}, got ${frame.seq}); waiting for the next keyframe`);
+    }
+    lastFrameSeq = frame.seq;
+
+    applyDelta(frameModel, frame, noteSet);
+    return frameModel;
+}
+
+// TRACE PLAYBACK
+// A trace is a recording of a whole sort. It is played back here on its own clock instead of waiting for a frame per step from the server
+
+let playback = null; // { chunks: Queue of Int32Array, ops, position, clock, ended }
+
+// Decodes base64 little-endian int32s
+function decodeTrace(encoded) {
+    return new Int32Array(decodeBase64(encoded).buffer);
+}
+
+function intToNullable(v) {
+    return v === -1 ? null : v;
+}
+
+// Applies ops to the model until a frame op is reached. Returns the frame's duration in ms, or null if the available ops ran out first
+function applyTraceUntilFrame(model) {
+    while (true) {
+        if (!playback.ops || playback.position >= playback.ops.length) {
+            if (playback.chunks.length === 0) return null;
+            playback.ops = playback.chunks.remove();
+            playback.position = 0;
+            continue;
+        }
+        const ops = playback.ops;
+        const p = playback.position;
+        const op = ops[p], a = ops[p + 1], b = ops[p + 2];
+        playback.position = p + TRACE_OP_WIDTH;
+
+        switch (op) {
+            case OP_FRAME:
+                model.dt = a / 1000;
+                return a;
+            case OP_RANGE:
+                model.i0 = a;
+                model.i1 = b;
+                break;
+            case OP_PIVOT:
+                model.pv = intToNullable(a);
+                break;
+            case OP_COMPARE:
+            case OP_SWAP_INTENT:
+                model.s0 = intToNullable(a);
+                model.s1 = intToNullable(b);
+                model.swapping = op === OP_SWAP_INTENT;
+                break;
+            case OP_SWAP: {
+                const arr = model.arr;
+                const temp = arr[a];
+                arr[a] = arr[b];
+                arr[b] = temp;
+                changedIndices.add(a);
+                changedIndices.add(b);
+                break;
             }
+            case OP_WRITE:
+                model.arr[a] = b;
+                changedIndices.add(a);
+                break;
+            case OP_PARTITIONING:
+                model.partitioning = a === 1;
+                break;
+            case OP_BUFFER:
+                // The buffer is copied from the array before anything is written over it
+                model.buffer = a === -1 ? null : model.arr.slice(a, b);
+                model.b0 = 0;
+                if (a !== -1) model.buffer_start = a;
+                break;
+            case OP_BUFFER_HEAD:
+                model.b0 = a;
+                break;
+            default:
+                console.warn(`Unknown trace op ${op}`);
         }
     }
 }
 
+// Renders every frame of the trace whose start time has passed; several frames per display frame are merged into one render
+function onPlaybackFrame(current) {
+    if (playback !== current) return; // A newer playback replaced this one
+    const now = performance.now();
+    let rendered = false;
+
+    while (playback.clock <= now) {
+        const duration = applyTraceUntilFrame(frameModel);
+        if (duration === null) break;
+        playback.clock += duration;
+        rendered = true;
+    }
+    if (rendered) update(frameModel);
+
+    const exhausted = playback.chunks.length === 0 && (!playback.ops || playback.position >= playback.ops.length);
+    if (exhausted && playback.ended) {
+        playback = null;
+        return;
+    }
+    requestAnimationFrame(() => onPlaybackFrame(current));
+}
+
+// Adds a trace chunk to the playback, starting the playback if it isn't running
+function receiveTrace(frame) {
+    const ops = decodeTrace(frame.trace);
+    const ended = frame.trace_end;
+    delete frame.trace;
+    delete frame.trace_end;
+
+    // The first chunk comes with a keyframe of the state the trace starts from, which replaces any older playback
+    if (frame.key) finishPlayback();
+    applyFrame(frame);
+
+    if (!playback) {
+        const current = { chunks: new Queue(), ops: null, position: 0, clock: performance.now(), ended: false };
+        playback = current;
+        requestAnimationFrame(() => onPlaybackFrame(current));
+    }
+    playback.chunks.add(ops);
+    playback.ended = ended;
+}
+
+// Applies the rest of the trace without rendering it, so a newer frame can be applied on top of the final state
+function finishPlayback() {
+    if (!playback) return;
+    while (applyTraceUntilFrame(frameModel) !== null);
+    playback = null;
+}
+// END OF TRACE PLAYBACK
+
+// BUFFER LANE
+// Merge and radix sort copy elements out of the array into a buffer (VisualState.buffer in app.py). It's drawn under the chart the same way as a race lane,
+// with every element under the index it was copied from. Elements leave the strip once they're written back; the next one to go is drawn as the pivot
+
+const BUFFER_LANE_HEIGHT_PX = 100;
+
+let bufferLane = null; // { label, canvas, context }, created with the chart
+let bufferLaneShown = false;
+
+function showBufferLane(shown) {
+    if (!bufferLane || shown === bufferLaneShown) return;
+    bufferLaneShown = shown;
+    bufferLane.label.style.display = shown ? "block" : "none";
+    bufferLane.canvas.style.display = shown ? "block" : "none";
+}
+
+// o(length of the array) time, and only while a buffer is held
+function drawBufferLane(data) {
+    const buffer = data.buffer;
+    showBufferLane(Boolean(buffer) && !data.buckets);
+    if (!bufferLaneShown) return;
+
+    const context = bufferLane.context;
+    resizeCanvas(bufferLane.canvas, context, BUFFER_LANE_HEIGHT_PX);
+    context.clearRect(0, 0, TOTAL_WIDTH_PX, BUFFER_LANE_HEIGHT_PX);
+
+    // Lined up with the chart's bars and scaled like them. The array can be missing the buffer's largest elements, hence the cap on the height
+    const length = data.arr.length;
+    const [widthPerBar, borderRadius] = getBarLayout(length);
+    const [left, step] = getCanvasBarPositions(length, widthPerBar, borderRadius);
+    const heightFactor = BUFFER_LANE_HEIGHT_PX / getMaxValue(data.arr);
+    for (let k = data.b0; k < buffer.length; k++) {
+        const height = Math.min(Math.floor(buffer[k] * heightFactor), BUFFER_LANE_HEIGHT_PX);
+        context.fillStyle = PALETTE_HEX[k === data.b0 ? COLOR_PIVOT : COLOR_DEFAULT];
+        fillBar(left + (data.buffer_start + k) * step, BUFFER_LANE_HEIGHT_PX - height, widthPerBar, height, borderRadius, context);
+    }
+
+    bufferLane.label.textContent = `Buffer: ${buffer.length - data.b0} of ${buffer.length} elements left`;
+}
+
+// RACE MODE
+// A race frame ({ race: [lane frame, ...] }) has a frame for each algorithm in a race (see RACE MODE in app.py). Each lane has its own model, which its frames patch
+// like frameModel, and is drawn on its own canvas under the others. The main chart is hidden during a race and comes back with the next normal frame
+
+const RACE_LANE_HEIGHT_PX = 100;
+
+let raceContainer; // Group 1
+let raceLanes = []; // { model, label, canvas, context }
+let raceShown = false;
+let raceDrawRequested = false;
+
+// Swaps between the race lanes and the main chart
+function showRace(shown) {
+    if (shown === raceShown) return;
+    raceShown = shown;
+    raceContainer.style.display = shown ? "block" : "none";
+    if (shown) {
+        barContainer.style.display = "none";
+        graphCanvas.style.display = "none";
+        showBufferLane(false);
+        canvasSwaps = [];
+    } else {
+        // setRenderer shows the main chart again with the next frame
+        activeRenderer = null;
+        renderedBars = null;
+    }
+}
+
+// Creates or removes lanes until there are exactly 'count' of them
+function setRaceLaneCount(count) {
+    while (raceLanes.length < count) {
+        const label = document.createElement("div");
+        const canvas = document.createElement("canvas");
+        canvas.style.width = "100%";
+        canvas.style.height = `${RACE_LANE_HEIGHT_PX}px`;
+        canvas.style.display = "block";
+        raceContainer.appendChild(label);
+        raceContainer.appendChild(canvas);
+        raceLanes.push({ model: null, label: label, canvas: canvas, context: canvas.getContext("2d") });
+    }
+    while (raceLanes.length > count) {
+        const lane = raceLanes.pop();
+        lane.label.remove();
+        lane.canvas.remove();
+    }
+}
+
+// Same look as the canvas renderer, without swap animations (races take many steps per frame)
+function drawRaceLane(lane) {
+    const data = lane.model;
+    const context = lane.context;
+    resizeCanvas(lane.canvas, context, RACE_LANE_HEIGHT_PX);
+    context.clearRect(0, 0, TOTAL_WIDTH_PX, RACE_LANE_HEIGHT_PX);
+
+    if (data.buckets) {
+        const buckets = data.buckets;
+        const length = buckets.length / 3;
+        const [widthPerBar] = getBarLayout(length);
+        const [left, step] = getCanvasBarPositions(length, widthPerBar, 0);
+        const heightFactor = RACE_LANE_HEIGHT_PX / getBucketsMaxValue(buckets);
+        const highlightedBuckets = getHighlightedBuckets(data);
+        for (let b = 0; b < length; b++) {
+            const height = Math.floor(buckets[b * 3 + 1] * heightFactor);
+            context.fillStyle = PALETTE_HEX[getBucketColor(data, b, highlightedBuckets)];
+            context.fillRect(left + b * step, RACE_LANE_HEIGHT_PX - height, widthPerBar, height);
+        }
+    } else {
+        const arr = data.arr;
+        const length = arr.length;
+        const [widthPerBar, borderRadius] = getBarLayout(length);
+        const [left, step] = getCanvasBarPositions(length, widthPerBar, borderRadius);
+        let maxVal = 4;
+        for (let i = 0; i < length; i++) {
+            if (arr[i] > maxVal) maxVal = arr[i];
+        }
+        const heightFactor = RACE_LANE_HEIGHT_PX / maxVal;
+        const pivotVal = getPivotValue(data);
+        for (let i = 0; i < length; i++) {
+            const height = Math.floor(arr[i] * heightFactor);
+            context.fillStyle = PALETTE_HEX[getElementColor(data, i, pivotVal)];
+            fillBar(left + i * step, RACE_LANE_HEIGHT_PX - height, widthPerBar, height, borderRadius, context);
+        }
+    }
+
+    const place = data.place ? ` (finished #${data.place})` : "";
+    lane.label.textContent = `${data.name}: ${data.steps} steps${place}`;
+}
+
+function requestRaceDraw() {
+    if (raceDrawRequested) return;
+    raceDrawRequested = true;
+    requestAnimationFrame(() => {
+        raceDrawRequested = false;
+        if (!raceShown) return;
+        for (const lane of raceLanes) {
+            if (lane.model) drawRaceLane(lane);
+        }
+    });
+}
+
+// Race frames are applied as soon as they arrive, and drawn at most once per display frame
+function receiveRace(frame) {
+    assert(raceContainer, "Graph element not ready!");
+    showRace(true);
+    setRaceLaneCount(frame.race.length);
+    frame.race.forEach((laneFrame, i) => {
+        const lane = raceLanes[i];
+        unpackFrame(laneFrame);
+        if (laneFrame.key || !lane.model) {
+            lane.model = laneFrame;
+        } else {
+            applyDelta(lane.model, laneFrame);
+        }
+    });
+    requestRaceDraw();
+}
+// END OF RACE MODE
+
 let framesWaiting = new Queue();
 
+// FRAME STREAM
+// Frames arrive through the server's frame stream (server-sent events) once graph.js subscribes to it, and through the data element otherwise.
+// Both end up in receiveFrame
+
+const FRAME_STREAM_PATH = "frames"; // SYNC THIS WITH PY (relative, so it also works when the app isn't served from the root)
+
+let frameStream = null; // EventSource of the subscribed channel
+let frameStreamChannel = null;
+
+// Subscribes to the frame stream of a channel, replacing any older subscription. The EventSource reconnects on its own if the stream drops
+function subscribeToFrames(channel) {
+    if (channel === frameStreamChannel || typeof EventSource === "undefined") return;
+    if (frameStream) frameStream.close();
+    frameStreamChannel = channel;
+    frameStream = new EventSource(`${FRAME_STREAM_PATH}/${channel}`);
+    frameStream.onmessage = (event) => receiveFrame(JSON.parse(event.data));
+    frameStream.onerror = () => console.warn("Frame stream interrupted; frames arrive through the data element until it reconnects");
+}
+// END OF FRAME STREAM
+
 // Limits data to be processed per-frame, so nothing is skipped
 function onNewData() {
 
     assert(dataHolderElement, "Data holder element not ready!");
     // dataElement is expected to be a <script> with JSON content in its innerHTML
 
-    const data = JSON.parse(dataHolderElement.innerHTML);
+    receiveFrame(JSON.parse(dataHolderElement.innerHTML));
+}
+
+let doQueue = true; // The newest "Queue Data" setting. Deltas only carry do_queue when it changes, so it's kept here instead of read from each frame
+
+function receiveFrame(data) {
+    // The server tells graph.js which frame stream to subscribe to when the page loads
+    if (data.channel !== undefined) {
+        subscribeToFrames(data.channel);
+        delete data.channel;
+    }
+
+    if (data.race !== undefined) {
+        // Older frames and the rest of a playback are applied without being drawn, so they can't replace the race with the main chart
+        while (framesWaiting.length > 0) {
+            applyFrame(framesWaiting.remove());
+        }
+        finishPlayback();
+        receiveRace(data);
+        return;
+    }
+
+    if (data.trace !== undefined) {
+        // Frames that were waiting are older than the trace, so they are applied immediately instead of rendered
+        while (framesWaiting.length > 0) {
+            applyFrame(framesWaiting.remove());
+        }
+        receiveTrace(data);
+        return;
+    }
+    // Any other frame is newer than the trace being played
+    finishPlayback();
     
+    if (data.do_queue !== undefined) doQueue = data.do_queue;
     framesWaiting.add(data);
     if (framesWaiting.length > 1) {
-        if (!data.do_queue) {
-            framesWaiting.clear(); // empty the queue
-            framesWaiting.add(data); // add the only element waiting
+        if (!doQueue) {
+            // Dropped frames are never rendered, but their deltas still have to be applied so the model stays in sync
+            while (framesWaiting.length > 1) {
+                applyFrame(framesWaiting.remove());
+            }
         }
         return;
     }
 
     function onFrame() {
-        update(framesWaiting.remove())
+        if (framesWaiting.length === 0) return; // The queue was emptied by a trace that arrived in the meantime
+        update(applyFrame(framesWaiting.remove()))
         if (framesWaiting.length > 0) {
             requestAnimationFrame(onFrame)
         }
@@ -457,7 +1428,7 @@ function onNewData() {
 // Main
 
 
-// Group 1; Will initialize graphElement, barContainer, graphOverlay
+// Group 1; Will initialize graphElement, barContainer, graphCanvas, canvasContext, graphOverlay
 waitForElementById("graph", (ele) => {
     console.log("Graph element found!");
     graphElement = ele;
@@ -468,6 +1439,13 @@ waitForElementById("graph", (ele) => {
     barContainer.style.alignItems = "flex-end";
     barContainer.style.height = `${TOTAL_HEIGHT_PX}px`;
     graphElement.appendChild(barContainer);
+
+    graphCanvas = document.createElement("canvas");
+    graphCanvas.style.display = "none";
+    graphCanvas.style.width = "100%";
+    graphCanvas.style.height = `${TOTAL_HEIGHT_PX}px`;
+    canvasContext = graphCanvas.getContext("2d");
+    graphElement.appendChild(graphCanvas);
     
     
     graphOverlay = document.createElement("div");
@@ -486,10 +1464,29 @@ waitForElementById("graph", (ele) => {
     
     graphOverlay.id = "graph-overlay";
     graphElement.appendChild(graphOverlay);
+
+    const bufferCanvas = document.createElement("canvas");
+    bufferCanvas.style.width = "100%";
+    bufferCanvas.style.height = `${BUFFER_LANE_HEIGHT_PX}px`;
+    bufferCanvas.style.display = "none";
+    bufferLane = { label: document.createElement("div"), canvas: bufferCanvas, context: bufferCanvas.getContext("2d") };
+    bufferLane.label.style.display = "none";
+    graphElement.appendChild(bufferLane.label);
+    graphElement.appendChild(bufferCanvas);
+
+    raceContainer = document.createElement("div");
+    raceContainer.style.display = "none";
+    graphElement.appendChild(raceContainer);
     
     
 });
     
+// Group 3; Will initialize statsElement
+waitForElementById("graph-stats", (ele) => {
+    statsElement = ele;
+    updateStats(frameModel.stats);
+});
+
 // Group 2;Will initialize dataHolderElement
 waitForElementById("graph-data", (ele) => {
     console.log("Data holder element found!");